@@ -12,7 +12,7 @@ from .models import (
     NutritionToken,
     Tag,
 )
-from .services.token_calculator import compute_token_profile
+from .services.token_profile import get_meal_token_profiles
 from .services.recipe_import import normalize_meal_ingredient_fields, measure_exists
 
 
@@ -141,7 +141,7 @@ class MealAdmin(admin.ModelAdmin):
         if not obj.pk:
             return "Save the recipe first to see its computed token profile."
 
-        totals = compute_token_profile(obj)
+        totals = get_meal_token_profiles([obj.pk])[obj.pk]
         if not totals:
             return "No tokens computed — check that ingredients have measures and token values set."
 
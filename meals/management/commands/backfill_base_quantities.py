@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from meals.services.catalog import bump_catalog_version
+from meals.services.token_calculator import backfill_base_quantities
+from meals.services.token_profile import rebuild_meal_token_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every MealIngredient's stored quantity_value/measure_multiplier/base_quantity "
+        "(or just the given ingredients' rows) — e.g. after loaddata, which stores only the parsed quantity — "
+        "then rebuild token profiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("ingredient_ids", nargs="*", type=int, help="Only rows using these ingredients")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_base_quantities(options["ingredient_ids"] or None, batch_size=options["batch_size"])
+        if updated:
+            rebuild_meal_token_profiles()
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Updated base quantities on {updated} meal ingredients."))
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from meals.services.benchmark import BENCHMARK_FUNCTIONS, CatalogDistribution, run_benchmarks
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark optimize_meal_plan, build_menu_batches and schedule_batches over synthetic "
+        "catalogs sampled from a fixture, and print the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fixture", default=str(Path(settings.BASE_DIR) / "data.json"),
+            help="dumpdata fixture the synthetic recipes are sampled from (default: data.json)",
+        )
+        parser.add_argument("--sizes", type=_int_list, default=[100, 1000, 10000],
+                            help="Comma-separated catalog sizes (default 100,1000,10000; up to 50000 is practical)")
+        parser.add_argument("--days", type=_int_list, default=[7], help="Comma-separated day counts")
+        parser.add_argument("--meals", type=_int_list, action="append",
+                            help="Comma-separated meal types for one scenario; repeat for more (default: 2 and 1,2,3)")
+        parser.add_argument("--heat", type=_int_list, default=[3], help="Comma-separated heat values")
+        parser.add_argument("--locked", type=_int_list, default=[0, 2], help="Comma-separated locked-recipe counts")
+        parser.add_argument("--forced", type=_int_list, default=[0, 1],
+                            help="Comma-separated forced-ingredient counts")
+        parser.add_argument("--functions", default=",".join(BENCHMARK_FUNCTIONS),
+                            help="Comma-separated functions to time")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario (default 3)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON here instead of stdout")
+
+    def handle(self, *args, **options):
+        functions = [name for name in options["functions"].split(",") if name]
+        unknown = set(functions) - set(BENCHMARK_FUNCTIONS)
+        if unknown:
+            raise CommandError(f"Unknown functions {sorted(unknown)}; pick from {list(BENCHMARK_FUNCTIONS)}")
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        try:
+            distribution = CatalogDistribution.from_fixture(options["fixture"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        report = run_benchmarks(
+            distribution,
+            options["sizes"],
+            days_options=options["days"],
+            meal_options=[tuple(meals) for meals in options["meals"] or [[2], [1, 2, 3]]],
+            heat_options=options["heat"],
+            locked_options=options["locked"],
+            forced_options=options["forced"],
+            functions=functions,
+            repeat=options["repeat"],
+            seed=options["seed"],
+        )
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output + "\n", encoding="utf-8")
+            self.stderr.write(f"Wrote {len(report['results'])} results to {options['output']}")
+        else:
+            self.stdout.write(output)
@@ -2,6 +2,7 @@ import csv
 import os
 from django.core.management.base import BaseCommand
 from meals.models import Ingredient, IngredientCategory
+from meals.services.catalog import bump_catalog_version
 
 
 class Command(BaseCommand):
@@ -44,4 +45,5 @@ class Command(BaseCommand):
                 ingredient.save(update_fields=['category'])
                 updated += 1
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(f'Assigned categories to {updated} ingredients.'))
@@ -3,6 +3,7 @@ from django.db import connection
 from meals.models import Ingredient, NutritionToken, IngredientNutritionToken
 import os
 import csv
+from meals.services.catalog import bump_catalog_version
 
 class Command(BaseCommand):
     help = 'Import ingredients and token data from CSV into DB'
@@ -88,4 +89,5 @@ class Command(BaseCommand):
                     )
                     token_links += 1
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(f'Imported {created} ingredients with {token_links} token links.'))
@@ -3,6 +3,7 @@ import os
 from django.core.management.base import BaseCommand
 from django.db import connection
 from meals.models import IngredientMeasure
+from meals.services.catalog import bump_catalog_version
 
 class Command(BaseCommand):
     help = 'Import ingredient measurement conversions from CSV into the IngredientMeasure model'
@@ -46,4 +47,5 @@ class Command(BaseCommand):
                 )
                 created += 1
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(f'Successfully imported {created} ingredient measures.'))
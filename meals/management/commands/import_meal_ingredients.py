@@ -3,6 +3,7 @@ import os
 from django.core.management.base import BaseCommand
 from django.db import connection
 from meals.models import Meal, Ingredient, MealIngredient
+from meals.services.catalog import bump_catalog_version
 
 class Command(BaseCommand):
     help = 'Import meal-ingredient relationships with metadata from CSV'
@@ -55,4 +56,5 @@ class Command(BaseCommand):
                 except Exception as e:
                     self.stderr.write(f"Error importing row: {e}")
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(f'Successfully imported {created} meal-ingredient links.'))
\ No newline at end of file
@@ -14,6 +14,7 @@ from meals.models import (
 )
 from meals.services.recipe_import import measure_exists, normalize_meal_ingredient_fields
 from meals.services.token_calculator import compute_token_profile
+from meals.services.catalog import bump_catalog_version
 
 
 class Command(BaseCommand):
@@ -166,6 +167,7 @@ class Command(BaseCommand):
                     required=mi.get("required", True),
                 )
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(f'Created meal "{meal.name}" (id={meal.pk}).'))
 
         if report["new_ingredients"]:
@@ -4,6 +4,7 @@ import re
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from meals.models import Meal
+from meals.services.catalog import bump_catalog_version
 
 class Command(BaseCommand):
     help = 'Import recipes from a hardcoded CSV file into the Recipe model'
@@ -105,6 +106,7 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f'Fatal error: {str(e)}'))
             return
 
+        bump_catalog_version()
         self.stdout.write(self.style.SUCCESS(
             f'Import complete: {created} created, {errors} errors.'
         ))
\ No newline at end of file
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from meals.models import Household, Menu
+from meals.services.catalog import get_catalog_snapshot
+from meals.views import (
+    _generation_params,
+    _pantry_statuses,
+    _parse_generate_options,
+    _persist_menu,
+    _run_menu_optimizer,
+)
+
+# Set in the parent right before the pool forks, so every worker plans
+# against the same snapshot instead of loading its own from the database.
+_snapshot = None
+
+
+def _plan_household(job):
+    """Runs in a pool worker: no database access, just the optimizer over
+    the inherited snapshot. Returns the job with its plan attached."""
+    options = job["options"]
+    forced_ingredients = options["forced_ingredients"]
+    slots, assigned, to_freeze, _recipes, _unfilled, _progress, stats = _run_menu_optimizer(
+        options["days"], options["meals"], options["rules"], job["members"],
+        recipes=_snapshot.recipe_adapters(
+            list(forced_ingredients.keys()), options["include_tags"], options["exclude_tags"]
+        ),
+        forced_ingredients=forced_ingredients, engine=options["engine"],
+        pantry_bonus=_snapshot.pantry_bonus(job["pantry_statuses"], options["pantry_weight"]),
+        snapshot=_snapshot,
+        **options["search_options"],
+    )
+    return {**job, "slots": slots, "assigned": assigned, "to_freeze": to_freeze, "stats": stats}
+
+
+class Command(BaseCommand):
+    help = (
+        "Build draft menus for every household from its menu_preferences, ahead of time, "
+        "so the generate endpoint can promote one instead of optimizing on the request path"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("household_ids", nargs="*", type=int, help="Only these households")
+        parser.add_argument("--drafts", type=int, default=1, help="Drafts to keep ready per household (default 1)")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Worker processes (default: CPU count; 1 plans in this process)",
+        )
+
+    def handle(self, *args, **options):
+        global _snapshot
+
+        households = Household.objects.order_by("id")
+        if options["household_ids"]:
+            households = households.filter(id__in=options["household_ids"])
+
+        _snapshot = get_catalog_snapshot()
+        jobs = []
+        for household in households:
+            parsed, error = _parse_generate_options(household.menu_preferences or {})
+            if error:
+                self.stderr.write(f"Skipping household {household.id}: {error.data['error']}")
+                continue
+            try:
+                _snapshot.tag_mask(parsed["include_tags"], parsed["exclude_tags"])
+            except ValueError as e:
+                self.stderr.write(f"Skipping household {household.id}: {e}")
+                continue
+            pantry_statuses = _pantry_statuses(household.id) if parsed["pantry_weight"] else {}
+            params = _generation_params(
+                _snapshot.version, household.number_of_members, parsed["days"], parsed["meals"],
+                parsed["rules"], parsed["forced_ingredients"], parsed["engine"],
+                parsed["include_tags"], parsed["exclude_tags"], parsed["pantry_weight"], pantry_statuses,
+            )
+            for _ in range(max(options["drafts"], 0)):
+                jobs.append({
+                    "household_id": household.id,
+                    "members": household.number_of_members,
+                    "options": parsed,
+                    "pantry_statuses": pantry_statuses,
+                    "params": params,
+                })
+
+        workers = min(options["workers"], len(jobs))
+        if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # Forked workers must not inherit open database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(pool.map(_plan_household, jobs))
+        else:
+            results = [_plan_household(job) for job in jobs]
+
+        # Drafts from an older catalog version or other preferences can't
+        # match a request any more; replace them all, one household per
+        # transaction so a failure never leaves a household half-replaced.
+        results_by_household = {}
+        for result in results:
+            results_by_household.setdefault(result["household_id"], []).append(result)
+        household_ids = set(results_by_household)
+        for household_id, household_results in results_by_household.items():
+            with transaction.atomic():
+                Menu.objects.filter(household_id=household_id, is_draft=True).delete()
+                for result in household_results:
+                    _persist_menu(
+                        household_id, result["slots"], result["assigned"], result["to_freeze"],
+                        is_draft=True, generation_params=result["params"],
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Pregenerated {len(results)} draft menus for {len(household_ids)} households "
+            f"(catalog v{_snapshot.version})."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from meals.services.catalog import bump_catalog_version
+from meals.services.token_profile import rebuild_meal_token_profiles
+
+
+class Command(BaseCommand):
+    help = "Recompute and persist every meal's MealTokenProfile rows (or just the given meal ids)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("meal_ids", nargs="*", type=int, help="Only rebuild these meals")
+
+    def handle(self, *args, **options):
+        profiles = rebuild_meal_token_profiles(options["meal_ids"] or None)
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt token profiles for {len(profiles)} meals."
+        ))
@@ -1,15 +1,16 @@
 from django.core.management.base import BaseCommand
 from meals.services.meal_plan_optimizer import optimize_meal_plan
-from meals.services.token_calculator import compute_token_profile
+from meals.services.token_calculator import compute_token_profiles_bulk
 from meals.models import Meal
 
 
 class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         recipes = list(Meal.objects.all())
+        profiles = compute_token_profiles_bulk([recipe.id for recipe in recipes])
 
         for recipe in recipes:
-            recipe.token_profile = compute_token_profile(recipe)
+            recipe.token_profile = profiles[recipe.id]
 
         rules = {"red meat":2, "white meat": 2, "legumes": 2, "fish":2, "vegetables": 20}
 
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0019_ingredientcategory_ingredient_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='token_profile_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='MealTokenProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_profile_rows', to='meals.meal')),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='meals.nutritiontoken')),
+            ],
+            options={
+                'unique_together': {('meal', 'token')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0021_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='household',
+            name='menu_preferences',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='generation_params',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['household', 'is_draft'], name='menu_household_draft_idx'),
+        ),
+    ]
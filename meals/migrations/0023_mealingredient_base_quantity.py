@@ -0,0 +1,95 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:07
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+# Frozen copies of token_calculator's parse_quantity/resolve_line_quantities
+# as of this migration, so later changes to those can't alter it.
+QUANTITY_QUANTUM = Decimal("0.0001")
+FRACTION_RE = re.compile(r"^(?:(\d+)\s+)?(\d+)\s*/\s*(\d+)$")
+
+
+def parse_quantity(u_quantity):
+    if u_quantity is None:
+        return None
+    text = str(u_quantity).strip().replace(",", ".")
+    match = FRACTION_RE.match(text)
+    if match:
+        whole, numerator, denominator = match.groups()
+        if int(denominator) == 0:
+            return None
+        return Decimal(whole or 0) + Decimal(numerator) / Decimal(denominator)
+    try:
+        quantity = Decimal(text)
+    except (InvalidOperation, TypeError):
+        return None
+    return quantity if quantity.is_finite() else None
+
+
+def resolve_line_quantities(u_quantity, measure_multiplier):
+    quantity = parse_quantity(u_quantity)
+    if quantity is None:
+        return None, None
+    base_quantity = None
+    if measure_multiplier is not None:
+        base_quantity = (quantity * Decimal(measure_multiplier)).quantize(QUANTITY_QUANTUM)
+    return quantity.quantize(QUANTITY_QUANTUM), base_quantity
+
+
+def fill_stored_quantities(apps, schema_editor):
+    """Same values as sync_base_quantity/backfill_base_quantities at the
+    time, over the historical models, so existing rows have them as soon as
+    readers switch to the stored columns."""
+    MealIngredient = apps.get_model("meals", "MealIngredient")
+    IngredientMeasure = apps.get_model("meals", "IngredientMeasure")
+    measures = {
+        (ingredient_id, unit): multiplier
+        for ingredient_id, unit, multiplier in IngredientMeasure.objects.values_list(
+            "ingredient_id", "unit_description", "multiplier"
+        )
+    }
+    fields = ["quantity_value", "measure_multiplier", "base_quantity"]
+    changed = []
+    for line in MealIngredient.objects.order_by("id").only("id", "ingredient_id", "u_quantity", "u_desc").iterator(
+        chunk_size=1000
+    ):
+        multiplier = measures.get((line.ingredient_id, (line.u_desc or "").strip().lower()))
+        quantity_value, base_quantity = resolve_line_quantities(line.u_quantity, multiplier)
+        if quantity_value is None:
+            continue
+        line.quantity_value = quantity_value
+        line.measure_multiplier = multiplier
+        line.base_quantity = base_quantity
+        changed.append(line)
+        if len(changed) >= 1000:
+            MealIngredient.objects.bulk_update(changed, fields)
+            changed = []
+    MealIngredient.objects.bulk_update(changed, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0022_menu_drafts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealingredient',
+            name='base_quantity',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='mealingredient',
+            name='measure_multiplier',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='mealingredient',
+            name='quantity_value',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(fill_stored_quantities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0023_mealingredient_base_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menu',
+            name='shopping_list_stale',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.CreateModel(
+            name='MenuShoppingLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(blank=True, max_length=100)),
+                ('measured', models.BooleanField(default=True)),
+                ('quantity', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('sources', models.PositiveIntegerField(default=0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='meals.ingredient')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_lines', to='meals.menu')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('menu', 'ingredient', 'unit', 'measured'), name='unique_menu_shopping_line')],
+            },
+        ),
+    ]
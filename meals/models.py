@@ -89,6 +89,9 @@ class Meal(models.Model):
         related_name='meals',
         blank=True,
     )
+    # TOKEN_PROFILE_VERSION the meal's MealTokenProfile rows were last built
+    # with; None means they're stale (see services/token_profile.py).
+    token_profile_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -103,6 +106,16 @@ class MealIngredient(models.Model):
     sub = models.CharField(max_length=255, blank=True, null=True)
     notas = models.TextField(blank=True, null=True)
     required = models.BooleanField(default=True)
+    # Denormalized from u_quantity/u_desc on every save (and when the
+    # ingredient's measures change), so aggregations can SUM in SQL instead
+    # of re-parsing strings — see services/token_calculator.py. All None
+    # where they don't apply: u_quantity isn't a number ("qb", "a gosto"),
+    # or the unit has no IngredientMeasure.
+    quantity_value = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True, editable=False)
+    measure_multiplier = models.FloatField(null=True, blank=True, editable=False)
+    base_quantity = models.DecimalField(
+        max_digits=14, decimal_places=4, null=True, blank=True, editable=False, db_index=True
+    )
 
     def __str__(self):
         return f"{self.meal} - {self.ingredient}"
@@ -134,9 +147,39 @@ class IngredientNutritionToken(models.Model):
     class Meta:
         unique_together = ('ingredient', 'token')
 
+class MealTokenProfile(models.Model):
+    """Materialized compute_token_profile(meal) output — one row per meal x
+    token, so readers don't have to redo the MealIngredient -> IngredientMeasure
+    -> IngredientNutritionToken walk on every request. Only trusted while
+    meal.token_profile_version matches TOKEN_PROFILE_VERSION; signals reset
+    that stamp whenever a row feeding the meal's profile changes."""
+
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='token_profile_rows')
+    token = models.ForeignKey(NutritionToken, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=14, decimal_places=4)
+
+    class Meta:
+        unique_together = ('meal', 'token')
+
+    def __str__(self):
+        return f"{self.meal.name} - {self.token.name}: {self.quantity}"
+
+class CatalogVersion(models.Model):
+    """Single-row counter bumped whenever recipe-catalog data changes (see
+    services/catalog.py) — lets every worker process tell whether its
+    in-memory CatalogSnapshot is still current with one cheap query."""
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
 class Household(models.Model):
     name = models.CharField(max_length=255, default="Default Household")
     number_of_members = models.PositiveIntegerField(default=2)
+    # Same fields as a GenerateMenuView body (days, meals, tokens,
+    # forcedIngredients, engine, ...) — what pregenerate_menus plans with.
+    menu_preferences = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.name
@@ -166,9 +209,17 @@ class Menu(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Drafts are built ahead of time by pregenerate_menus (inactive until
+    # GenerateMenuView promotes one whose generation_params match a request).
+    is_draft = models.BooleanField(default=False)
+    generation_params = models.JSONField(null=True, blank=True)
+    # Whether shopping_lines can't be trusted (recipe ingredients changed, or
+    # never built) — the next read rebuilds them (see services/shopping_list.py).
+    shopping_list_stale = models.BooleanField(default=True, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["household", "is_draft"], name="menu_household_draft_idx")]
 
     def __str__(self):
         return f"Menu for {self.household.name} ({self.created_at.date()})"
@@ -225,6 +276,33 @@ class MenuMeal(models.Model):
         return f"Day {self.day_number} {self.get_meal_type_display()} - {self.meal.name} ({self.get_state_display()})"
 
 
+class MenuShoppingLine(models.Model):
+    """One line of a menu's persisted shopping list: the summed quantity of
+    an ingredient in one unit over the menu's planned slots (scaled by
+    portions_multiplier), or — measured=False, unit "" — a marker that it
+    appears with a non-numeric quantity ("qb"). Kept up to date
+    incrementally by MenuMeal signals; `sources` counts the MealIngredient
+    x planned-slot pairs adding to it, so the line goes when it hits 0."""
+
+    menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name="shopping_lines")
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    unit = models.CharField(max_length=100, blank=True)
+    measured = models.BooleanField(default=True)
+    quantity = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    sources = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["menu", "ingredient", "unit", "measured"],
+                name="unique_menu_shopping_line",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.menu} - {self.quantity} {self.unit} {self.ingredient.name}"
+
+
 class MenuFreezeEntry(models.Model):
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name="freeze_entries")
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
@@ -2,7 +2,8 @@ from rest_framework import serializers
 from meals.models import Meal, Ingredient, IngredientNutritionToken, MealIngredient, HouseholdIngredient, MenuMeal, Menu, Tag
 from datetime import timedelta
 from meals.services.token_profile import compute_menu_token_profile
-from meals.services.shopping_list import compute_menu_ingredients
+from meals.services.shopping_list import menu_shopping_list
+from meals.services.token_calculator import parse_quantity
 
 
 def apply_multiplier_display(name, multiplier):
@@ -94,7 +95,7 @@ class MenuSerializer(serializers.ModelSerializer):
 
     def get_tokens(self, obj):
         
-        meals = [(mm.meal, mm.portions_multiplier) for mm in obj.menu_meals.all()]
+        meals = [(mm.meal, mm.portions_multiplier) for mm in obj.menu_meals.all().select_related("meal")]
         totals = compute_menu_token_profile(meals)
 
         # Example logic: "real" = actual, "planned" = dummy value
@@ -159,9 +160,14 @@ class IngredientInRecipeSerializer(serializers.Serializer):
     id = serializers.CharField(source='ingredient.id')
     name = serializers.CharField(source='ingredient.name')
     image = serializers.SerializerMethodField()
-    quantity = serializers.FloatField(source='u_quantity')
+    quantity = serializers.SerializerMethodField()
     unit = serializers.CharField(source='u_desc')
 
+    def get_quantity(self, obj):
+        # u_quantity parsed on the fly for rows loaded raw, never synced.
+        quantity = obj.quantity_value if obj.quantity_value is not None else parse_quantity(obj.u_quantity)
+        return float(quantity) if quantity is not None else None
+
     def get_image(self, obj):
         request = self.context.get('request')
         if obj.ingredient.icon:
@@ -188,7 +194,7 @@ def serialize_menu_ingredients(menu, request):
     (ingredient, unit) so the same ingredient can list multiple unit lines
     (e.g. "1 cup" + "3 tbsp"), plus a separate section for ingredients that
     only ever appear with a non-numeric quantity (e.g. "qb"/to taste)."""
-    measured, unmeasured = compute_menu_ingredients(menu)
+    measured, unmeasured = menu_shopping_list(menu)
 
     measured_out = []
     for bucket in measured.values():
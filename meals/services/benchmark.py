@@ -0,0 +1,266 @@
+import json
+import math
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import product
+
+from .meal_plan_optimizer import (
+    RecipeAdapter,
+    build_menu_batches,
+    optimize_meal_plan,
+    plan_shortfall,
+    schedule_batches,
+)
+from .token_calculator import ingredient_quantities_from_rows, line_base_quantity, token_profiles_from_rows
+
+# Multiplicative noise (log-normal sigma) applied to every token and
+# ingredient amount of a template recipe, so synthetic recipes built from
+# the same template still differ.
+AMOUNT_JITTER = 0.25
+
+BENCHMARK_FUNCTIONS = ("optimize_meal_plan", "build_menu_batches", "schedule_batches")
+
+
+class CatalogDistribution:
+    """What a synthetic catalog is sampled from: the real recipes of a
+    dumpdata fixture (data.json), reduced to what the optimizer sees —
+    token profile, serves and base-unit ingredient usage per recipe."""
+
+    def __init__(self, templates, ingredient_ids):
+        # [(serves, {token: Decimal}, {ingredient_id: Decimal})], one per
+        # fixture recipe with a non-empty token profile.
+        self.templates = templates
+        # Ingredient ids ordered by how many recipes use them, most first —
+        # forced-ingredient scenarios pick from the front.
+        self.ingredient_ids = ingredient_ids
+
+    @classmethod
+    def from_fixture(cls, path):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row["model"], []).append(row)
+
+        token_names = {row["pk"]: row["fields"]["name"] for row in by_model.get("meals.nutritiontoken", [])}
+        measures = {
+            (row["fields"]["ingredient"], row["fields"]["unit_description"]): row["fields"]["multiplier"]
+            for row in by_model.get("meals.ingredientmeasure", [])
+        }
+        tokens_by_ingredient = {}
+        for row in by_model.get("meals.ingredientnutritiontoken", []):
+            fields = row["fields"]
+            tokens_by_ingredient.setdefault(fields["ingredient"], []).append(
+                (token_names[fields["token"]], fields["quantity"])
+            )
+        lines = [
+            (
+                f["meal"],
+                f["ingredient"],
+                line_base_quantity(f["ingredient"], f["u_quantity"], f["u_desc"], measures),
+            )
+            for f in (row["fields"] for row in by_model.get("meals.mealingredient", []))
+        ]
+
+        profiles = token_profiles_from_rows(lines, tokens_by_ingredient)
+        usage = ingredient_quantities_from_rows(lines)
+
+        templates = []
+        for row in by_model.get("meals.meal", []):
+            profile = profiles.get(row["pk"])
+            if profile:
+                templates.append((row["fields"]["serves"], profile, usage.get(row["pk"], {})))
+        if not templates:
+            raise ValueError(f"{path} has no recipes with a token profile to sample from")
+
+        popularity = {}
+        for _serves, _profile, ingredients in templates:
+            for ingredient_id in ingredients:
+                popularity[ingredient_id] = popularity.get(ingredient_id, 0) + 1
+        ingredient_ids = sorted(popularity, key=lambda ingredient_id: (-popularity[ingredient_id], ingredient_id))
+        return cls(templates, ingredient_ids)
+
+    def mean_token_amounts(self):
+        """{token: mean amount per recipe} over the templates (0 counted)."""
+        totals = {}
+        for _serves, profile, _ingredients in self.templates:
+            for token, amount in profile.items():
+                totals[token] = totals.get(token, Decimal(0)) + amount
+        return {token: total / len(self.templates) for token, total in totals.items()}
+
+    def synthetic_catalog(self, size, seed=0):
+        """`size` RecipeAdapters, each a random template with every amount
+        jittered by AMOUNT_JITTER — so token mixes, amount scales and serves
+        follow the real catalog's. Carries the full ingredient usage as
+        forced_ingredient_profile. Same size and seed, same catalog."""
+        rng = random.Random(seed)
+        recipes = []
+        for recipe_id in range(1, size + 1):
+            serves, profile, ingredients = rng.choice(self.templates)
+            recipes.append(RecipeAdapter(
+                recipe_id,
+                f"synthetic-{recipe_id}",
+                serves,
+                token_profile={token: _jitter(amount, rng) for token, amount in profile.items()},
+                forced_ingredient_profile={
+                    ingredient_id: _jitter(amount, rng) for ingredient_id, amount in ingredients.items()
+                },
+            ))
+        return recipes
+
+
+def _jitter(amount, rng):
+    factor = Decimal(math.exp(rng.gauss(0, AMOUNT_JITTER))).quantize(Decimal("0.0001"))
+    return (amount * factor).quantize(Decimal("0.0001"))
+
+
+def _scenario_inputs(distribution, catalog, days, meals, locked, forced):
+    """rules, locked recipes and forced ingredients for one scenario: token
+    targets are the catalog's mean per-recipe amounts times the slot count
+    (reachable, but only with a balanced menu); forced ingredients are the
+    `forced` most widely used ones, each wanted in the amount two average
+    recipes using it would contribute."""
+    total_slots = days * len(meals)
+    rules = {
+        token: (mean * total_slots).quantize(Decimal("0.01"))
+        for token, mean in distribution.mean_token_amounts().items()
+    }
+    forced_ingredients = {}
+    for ingredient_id in distribution.ingredient_ids[:forced]:
+        amounts = [
+            r.forced_ingredient_profile[ingredient_id]
+            for r in catalog
+            if ingredient_id in r.forced_ingredient_profile
+        ]
+        forced_ingredients[ingredient_id] = (2 * sum(amounts) / len(amounts)).quantize(Decimal("0.01"))
+    return total_slots, rules, catalog[:locked], forced_ingredients
+
+
+def _measure(run, repeat):
+    """(latencies in ms, peak traced allocation in KiB, last result). The
+    allocation pass runs separately, since tracemalloc skews timings."""
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        latencies.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    try:
+        run()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latencies, peak / 1024, result
+
+
+def _back_to_back_repeats(schedule):
+    return sum(1 for a, b in zip(schedule, schedule[1:]) if a["recipe"].id == b["recipe"].id)
+
+
+def run_benchmarks(
+    distribution,
+    sizes,
+    days_options=(7,),
+    meal_options=((2,), (1, 2, 3)),
+    heat_options=(3,),
+    locked_options=(0, 2),
+    forced_options=(0, 1),
+    functions=BENCHMARK_FUNCTIONS,
+    repeat=3,
+    seed=0,
+    members=2,
+):
+    """
+    Times `functions` over synthetic catalogs of each size (see
+    CatalogDistribution.synthetic_catalog) for every combination of days,
+    meals, heat, locked count and forced-ingredient count. Every run is
+    seeded, so two runs on the same code see the same inputs and picks.
+
+    Returns {"meta": {...}, "results": [...]}, JSON-serializable. Each
+    result holds the scenario, latency_ms {"min", "median", "max"} over
+    `repeat` runs, peak_alloc_kib of one traced run, and quality:
+    shortfall (plan_shortfall, 0 = every target met) and unfilled_slots
+    for the planners, back_to_back_repeats for schedule_batches.
+    optimize_meal_plan has no forced-ingredient support, so it skips
+    scenarios with forced > 0.
+    """
+    results = []
+    for size in sizes:
+        catalog = distribution.synthetic_catalog(size, seed=seed)
+        for days, meals, heat, locked, forced in product(
+            days_options, meal_options, heat_options, locked_options, forced_options
+        ):
+            total_slots, rules, locked_recipes, forced_ingredients = _scenario_inputs(
+                distribution, catalog, days, meals, locked, forced
+            )
+            scenario = {
+                "catalog_size": size,
+                "days": days,
+                "meals": list(meals),
+                "heat": heat,
+                "locked": locked,
+                "forced": forced,
+            }
+
+            if "optimize_meal_plan" in functions and not forced:
+                def run():
+                    return optimize_meal_plan(
+                        catalog, rules, total_meals=total_slots, heat=heat,
+                        locked_recipes=locked_recipes, debug=True, rng=random.Random(seed),
+                    )
+                latencies, peak, (plan, tally) = _measure(run, repeat)
+                quality = {
+                    "shortfall": float(plan_shortfall(tally, {}, rules, None)),
+                    "unfilled_slots": total_slots - len(plan),
+                }
+                results.append(_result("optimize_meal_plan", scenario, latencies, peak, quality))
+
+            def build():
+                return build_menu_batches(
+                    catalog, rules, total_slots, members, heat=heat, locked_recipes=locked_recipes,
+                    forced_ingredients=forced_ingredients, debug=True, rng=random.Random(seed),
+                )
+
+            if "build_menu_batches" in functions:
+                latencies, peak, (batches, _, token_progress, ingredient_progress) = _measure(build, repeat)
+                quality = {
+                    "shortfall": float(plan_shortfall(token_progress, ingredient_progress, rules, forced_ingredients)),
+                    "unfilled_slots": total_slots - sum(b["occasions"] for b in batches),
+                }
+                results.append(_result("build_menu_batches", scenario, latencies, peak, quality))
+
+            if "schedule_batches" in functions:
+                batches = build()[0]
+                latencies, peak, schedule = _measure(lambda: schedule_batches(batches), repeat)
+                quality = {"back_to_back_repeats": _back_to_back_repeats(schedule)}
+                results.append(_result("schedule_batches", scenario, latencies, peak, quality))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "templates": len(distribution.templates),
+        },
+        "results": results,
+    }
+
+
+def _result(function, scenario, latencies, peak, quality):
+    return {
+        "function": function,
+        **scenario,
+        "latency_ms": {
+            "min": round(min(latencies), 3),
+            "median": round(statistics.median(latencies), 3),
+            "max": round(max(latencies), 3),
+        },
+        "peak_alloc_kib": round(peak, 1),
+        "quality": quality,
+    }
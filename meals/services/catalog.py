@@ -0,0 +1,308 @@
+import threading
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from ..models import CatalogVersion, IngredientMeasure, Meal, MealIngredient, Tag
+from .meal_plan_optimizer import RecipeAdapter
+from .token_calculator import LINE_FIELDS, base_quantity_lines, ingredient_quantities_from_rows
+from .token_profile import get_meal_token_profiles
+from .vectorized_optimizer import pack_profiles
+
+CATALOG_VERSION_PK = 1
+
+# How much a HouseholdIngredient.status counts toward a recipe's pantry
+# coverage (see CatalogSnapshot.pantry_bonus): "Plenty" fully, "Low" half.
+PANTRY_STATUS_CREDIT = {0: 0.0, 1: 0.5, 2: 1.0}
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def current_catalog_version():
+    """The catalog version counter as last committed (0 before any bump)."""
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list("version", flat=True).first()
+    return version or 0
+
+
+def bump_catalog_version():
+    """Marks every worker's CatalogSnapshot stale. Deferred to transaction
+    commit, so a rolled-back admin save or import never bumps, and a worker
+    can't rebuild from data other connections can't see yet."""
+    transaction.on_commit(_bump_catalog_version)
+
+
+def _bump_catalog_version():
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(version=F("version") + 1)
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK, defaults={"version": 1})
+
+
+class CatalogSnapshot:
+    """Everything the optimizer and the recipe search endpoints read about the
+    recipe catalog, loaded in one go: a RecipeAdapter per Meal, tag names per
+    meal, ingredient ids per meal, base-unit ingredient usage per meal and
+    every unit measure — plus every recipe's token profile packed into a
+    dense float matrix (token_matrix, one row per recipe in `recipes` order,
+    one column per token_names entry) for one-pass scoring over the whole
+    catalog (see rank_slot_alternatives) — and, per Tag name, a bitset of
+    the recipes carrying it (tag_bits: an int whose bit i is recipes[i]),
+    so tag-filtered candidate pools are a few big-int ANDs (tag_mask) — and
+    the required MealIngredient rows as a sparse recipe x ingredient
+    incidence matrix in CSR form (required_indptr/required_indices, columns
+    in ingredient_ids order), so scoring every recipe against a household's
+    pantry is one sparse matrix-vector product (pantry_bonus) — and
+    ingredient_usage as a recipe x ingredient matrix in CSC form
+    (usage_indptr/usage_rows/usage_values, columns in usage_ingredient_ids
+    order), so a request's forced ingredients are a few column slices
+    (usage_matrix) rather than a walk over every recipe.
+
+    Never mutated after it's built — when the catalog version moves on, a
+    fresh snapshot is built and swapped in whole (get_catalog_snapshot), so
+    requests already holding the old one keep a consistent view.
+    """
+
+    def __init__(
+        self, version, recipes, tags_by_meal, ingredients_by_meal, ingredient_usage, measures, tag_categories=None,
+        required_ingredients_by_meal=None,
+    ):
+        self.version = version
+        self.recipes = tuple(recipes)
+        self.recipes_by_id = {r.id: r for r in self.recipes}
+        self.recipe_rows = {r.id: row for row, r in enumerate(self.recipes)}
+        self.tags_by_meal = tags_by_meal
+        self.ingredients_by_meal = ingredients_by_meal
+        self.ingredient_usage = ingredient_usage
+        self.measures = measures
+        self.token_names = tuple(sorted({name for r in self.recipes for name in r.token_profile}))
+        self.token_columns = {name: i for i, name in enumerate(self.token_names)}
+        self.token_matrix = pack_profiles([r.token_profile for r in self.recipes], self.token_names)
+
+        # {tag name: Tag.category}, including tags no recipe carries yet.
+        self.tag_categories = dict(tag_categories or {})
+        rows_by_tag = {}
+        for row, recipe in enumerate(self.recipes):
+            for name in tags_by_meal.get(recipe.id, ()):
+                rows_by_tag.setdefault(name, []).append(row)
+                self.tag_categories.setdefault(name, "")
+        self.tag_bits = {name: _bitset(rows, len(self.recipes)) for name, rows in rows_by_tag.items()}
+
+        required_ingredients_by_meal = required_ingredients_by_meal or {}
+        self.ingredient_ids = tuple(sorted({i for ids in required_ingredients_by_meal.values() for i in ids}))
+        self.ingredient_columns = {ingredient_id: col for col, ingredient_id in enumerate(self.ingredient_ids)}
+        counts = np.array(
+            [len(required_ingredients_by_meal.get(r.id, ())) for r in self.recipes], dtype=np.int64
+        )
+        self.required_indptr = np.concatenate([[0], np.cumsum(counts)])
+        self.required_indices = np.array(
+            [
+                self.ingredient_columns[ingredient_id]
+                for r in self.recipes
+                for ingredient_id in sorted(required_ingredients_by_meal.get(r.id, ()))
+            ],
+            dtype=np.int64,
+        )
+        # Row of every stored entry, so the product is a single bincount.
+        self._required_rows = np.repeat(np.arange(len(self.recipes)), counts)
+
+        usage_by_ingredient = {}
+        for row, recipe in enumerate(self.recipes):
+            for ingredient_id, quantity in ingredient_usage.get(recipe.id, {}).items():
+                usage_by_ingredient.setdefault(ingredient_id, []).append((row, float(quantity)))
+        self.usage_ingredient_ids = tuple(sorted(usage_by_ingredient))
+        self.usage_columns = {ingredient_id: col for col, ingredient_id in enumerate(self.usage_ingredient_ids)}
+        entries = [entry for ingredient_id in self.usage_ingredient_ids for entry in usage_by_ingredient[ingredient_id]]
+        self.usage_indptr = np.concatenate([
+            [0],
+            np.cumsum([len(usage_by_ingredient[i]) for i in self.usage_ingredient_ids], dtype=np.int64),
+        ]).astype(np.int64)
+        self.usage_rows = np.array([row for row, _ in entries], dtype=np.int64)
+        self.usage_values = np.array([quantity for _, quantity in entries], dtype=np.float64)
+
+    def tag_mask(self, include_tags=(), exclude_tags=()):
+        """Bitset of the recipes passing a tag filter: with include_tags, a
+        recipe needs one of the included tags of every Tag category
+        included (OR within a category, AND across — "Portugal or Espanha,
+        and Vegetariano"); it must carry none of exclude_tags. Raises
+        ValueError naming any tag that doesn't exist."""
+        unknown = sorted((set(include_tags) | set(exclude_tags)) - set(self.tag_categories))
+        if unknown:
+            raise ValueError(f"Unknown tags: {', '.join(unknown)}")
+
+        mask = (1 << len(self.recipes)) - 1
+        by_category = {}
+        for name in include_tags:
+            category = self.tag_categories[name]
+            by_category[category] = by_category.get(category, 0) | self.tag_bits.get(name, 0)
+        for bits in by_category.values():
+            mask &= bits
+        for name in exclude_tags:
+            mask &= ~self.tag_bits.get(name, 0)
+        return mask
+
+    def mask_rows(self, mask):
+        """Row indexes (into recipes) of the bits set in mask, ascending."""
+        size = (len(self.recipes) + 7) // 8
+        bits = np.unpackbits(np.frombuffer(mask.to_bytes(size, "little"), dtype=np.uint8), bitorder="little")
+        return np.flatnonzero(bits[: len(self.recipes)])
+
+    def pantry_bonus(self, statuses, weight):
+        """{recipe id: weight x pantry coverage} for every recipe with any
+        coverage, where a recipe's coverage is the mean PANTRY_STATUS_CREDIT
+        of its required ingredients under `statuses` ({ingredient_id:
+        HouseholdIngredient.status}; missing ones count as All Out) — 1.0
+        when the household has plenty of everything the recipe needs. See
+        build_menu_batches's pantry_bonus param."""
+        if not weight or not statuses:
+            return {}
+        vector = np.zeros(len(self.ingredient_ids), dtype=np.float64)
+        for ingredient_id, status in statuses.items():
+            col = self.ingredient_columns.get(ingredient_id)
+            if col is not None:
+                vector[col] = PANTRY_STATUS_CREDIT.get(status, 0.0)
+        covered = np.bincount(
+            self._required_rows, weights=vector[self.required_indices], minlength=len(self.recipes)
+        )
+        coverage = covered / np.maximum(np.diff(self.required_indptr), 1)
+        return {self.recipes[row].id: weight * float(coverage[row]) for row in np.flatnonzero(coverage)}
+
+    def rows_of(self, recipes):
+        """Row indexes (into recipes/token_matrix) of the given adapters, as
+        an int array — None if any of them isn't in this snapshot."""
+        row_of = self.recipe_rows
+        rows = [row_of.get(r.id) for r in recipes]
+        if None in rows:
+            return None
+        return np.array(rows, dtype=np.int64)
+
+    def token_submatrix(self, rows, token_names):
+        """token_matrix's `rows`, with one column per token_names entry in
+        that order (0 for a token no recipe has) — what pack_profiles would
+        give for those recipes, without repacking their profiles."""
+        matrix = np.zeros((len(rows), len(token_names)), dtype=np.float64)
+        for j, name in enumerate(token_names):
+            col = self.token_columns.get(name)
+            if col is not None:
+                matrix[:, j] = self.token_matrix[rows, col]
+        return matrix
+
+    def usage_matrix(self, ingredient_ids):
+        """Dense float matrix of ingredient_usage, one row per recipe (in
+        `recipes` order) and one column per ingredient_ids entry, in that
+        order; 0 where a recipe doesn't use the ingredient. Only the stored
+        entries of those columns are touched."""
+        usage = np.zeros((len(self.recipes), len(ingredient_ids)), dtype=np.float64)
+        for j, ingredient_id in enumerate(ingredient_ids):
+            col = self.usage_columns.get(ingredient_id)
+            if col is not None:
+                start, end = self.usage_indptr[col], self.usage_indptr[col + 1]
+                usage[self.usage_rows[start:end], j] = self.usage_values[start:end]
+        return usage
+
+    def recipe_adapters(self, forced_ingredient_ids=None, include_tags=(), exclude_tags=()):
+        """The snapshot's adapters, ready for build_menu_batches. With
+        forced_ingredient_ids, returns per-request copies carrying
+        forced_ingredient_profile for exactly those ids (same numbers as
+        compute_ingredient_quantities) instead of the shared {}. With
+        include_tags/exclude_tags, only the recipes passing tag_mask, in
+        catalog order."""
+        pool = self.recipes
+        if include_tags or exclude_tags:
+            pool = [self.recipes[row] for row in self.mask_rows(self.tag_mask(include_tags, exclude_tags))]
+        if not forced_ingredient_ids:
+            return list(pool)
+
+        recipes = []
+        for recipe in pool:
+            usage = self.ingredient_usage.get(recipe.id, {})
+            recipes.append(recipe.with_forced_ingredient_profile({
+                ingredient_id: usage[ingredient_id]
+                for ingredient_id in forced_ingredient_ids
+                if ingredient_id in usage
+            }))
+        return recipes
+
+
+def build_catalog_snapshot(version):
+    profiles = get_meal_token_profiles()
+    recipes = [
+        RecipeAdapter(
+            id=meal_id,
+            name=name,
+            serves=serves,
+            time=time,
+            image=image or "",
+            token_profile=profiles.get(meal_id, {}),
+        )
+        for meal_id, name, serves, time, image in Meal.objects.values_list(
+            "id", "name", "serves", "time", "image"
+        )
+    ]
+
+    tags_by_meal = {}
+    for meal_id, tag_name in Meal.tags.through.objects.values_list("meal_id", "tag__name"):
+        tags_by_meal.setdefault(meal_id, set()).add(tag_name)
+
+    measures = {
+        (ingredient_id, unit): multiplier
+        for ingredient_id, unit, multiplier in IngredientMeasure.objects.values_list(
+            "ingredient_id", "unit_description", "multiplier"
+        )
+    }
+
+    ingredients_by_meal = {}
+    required_ingredients_by_meal = {}
+    rows = []
+    for *row, required in MealIngredient.objects.values_list(*LINE_FIELDS, "required"):
+        meal_id, ingredient_id = row[0], row[1]
+        ingredients_by_meal.setdefault(meal_id, set()).add(ingredient_id)
+        if required:
+            required_ingredients_by_meal.setdefault(meal_id, set()).add(ingredient_id)
+        rows.append(row)
+    # Same base quantities (and silent skips) as compute_ingredient_quantities.
+    ingredient_usage = ingredient_quantities_from_rows(base_quantity_lines(rows))
+
+    return CatalogSnapshot(
+        version=version,
+        recipes=recipes,
+        tags_by_meal={meal_id: frozenset(names) for meal_id, names in tags_by_meal.items()},
+        ingredients_by_meal={meal_id: frozenset(ids) for meal_id, ids in ingredients_by_meal.items()},
+        ingredient_usage=ingredient_usage,
+        measures=measures,
+        tag_categories=dict(Tag.objects.values_list("name", "category")),
+        required_ingredients_by_meal=required_ingredients_by_meal,
+    )
+
+
+def _bitset(rows, size):
+    """int with exactly the given bits set, built in O(size) through a
+    bytearray rather than OR-ing one big int per row."""
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, "little")
+
+
+def get_catalog_snapshot():
+    """This worker's CatalogSnapshot, rebuilt (once, under a lock) only when
+    the committed catalog version differs from the one it was built at.
+    Costs one query when the snapshot is current."""
+    global _snapshot
+    version = current_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = build_catalog_snapshot(version)
+        return _snapshot
+
+
+def clear_catalog_snapshot():
+    """Drops this worker's snapshot so the next read rebuilds it. Tests use
+    this: TestCase never commits, so bump_catalog_version never fires there."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
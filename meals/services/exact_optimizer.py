@@ -0,0 +1,269 @@
+import random
+import time
+
+from .meal_plan_optimizer import _add_profile, _merge_token_profiles, _recipe_sizing, build_menu_batches
+
+# Beyond this many free slots the per-suffix bound tables and the search tree
+# get too big to be worth it — solve_menu_batches_exact falls back to greedy.
+MAX_EXACT_SLOTS = 21
+
+EPSILON = 1e-9
+
+
+def _pack(profile, keys):
+    return [float(profile.get(key, 0)) for key in keys]
+
+
+def _shortfall(totals, targets):
+    return sum(max(0.0, target - total) for target, total in zip(targets, totals))
+
+
+def _suffix_top_sums(vectors, max_picks):
+    """top[i][k][m] = sum of the m largest values of column k among
+    vectors[i:], for m in 0..max_picks — the most any m further picks from
+    position i on could add to column k. Built back to front in
+    O(n * columns * max_picks)."""
+    columns = len(vectors[0]) if vectors else 0
+    best = [[] for _ in range(columns)]  # per column, descending top values so far
+    top = [None] * (len(vectors) + 1)
+    top[len(vectors)] = [[0.0] * (max_picks + 1) for _ in range(columns)]
+    for i in range(len(vectors) - 1, -1, -1):
+        row = []
+        for k in range(columns):
+            values = best[k]
+            value = vectors[i][k]
+            if value > 0 and (len(values) < max_picks or value > values[-1]):
+                pos = len(values)
+                while pos > 0 and values[pos - 1] < value:
+                    pos -= 1
+                values.insert(pos, value)
+                del values[max_picks:]
+            sums = [0.0]
+            for m in range(max_picks):
+                sums.append(sums[-1] + (values[m] if m < len(values) else 0.0))
+            row.append(sums)
+        top[i] = row
+    return top
+
+
+def solve_menu_batches_exact(
+    recipes,
+    rules,
+    total_slots,
+    members,
+    forbidden_ids=None,
+    locked_recipes=None,
+    forced_ingredients=None,
+    node_limit=200000,
+    time_limit_ms=2000,
+    deadline=None,
+    rng=None,
+):
+    """
+    Exact counterpart of build_menu_batches for small menus: finds the set of
+    distinct recipes that fills the free slots (same _recipe_sizing occasions,
+    locked recipes pre-placed, no repeats, forbidden_ids excluded) with the
+    lowest plan_shortfall — token rules plus forced ingredients, counted in
+    full for the whole plan — instead of a randomized greedy pick.
+
+    A set of recipes fills R free slots when its occasions add up to at least
+    R while all but its biggest one add up to less than R — the biggest is
+    then scheduled last and cut short, exactly as build_menu_batches would.
+
+    Depth-first branch-and-bound over recipes ordered by how much of the
+    outstanding targets they cover, seeded with the heat=1 greedy plan as
+    the incumbent. A branch is pruned when even the best possible remaining
+    picks (per-token top-m sums over the rest of the ordering, m = picks
+    still allowed) can't beat the incumbent. Stops at node_limit nodes or
+    time_limit_ms (or the optional Deadline, whichever comes first — then
+    "exact" goes in its cut_short), keeping the best plan found so far.
+
+    Falls back to the greedy plan (proven_optimal False) when there are more
+    than MAX_EXACT_SLOTS free slots or not enough distinct recipes to fill
+    them. rng breaks the greedy plan's ties (random.Random(0) when omitted),
+    so the same rng seed always gives the same plan, fallback included. Raises ValueError like build_menu_batches when there are more
+    locked recipes than slots.
+
+    Returns (result, stats): result is the same tuple as
+    build_menu_batches(debug=True); stats {"proven_optimal": bool, "nodes":
+    int, "fallback": bool}.
+    """
+    forbidden_ids = set(forbidden_ids) if forbidden_ids else set()
+    locked_recipes = list(locked_recipes) if locked_recipes else []
+    forced_ingredients = forced_ingredients or {}
+
+    greedy = build_menu_batches(
+        recipes,
+        rules,
+        total_slots,
+        members,
+        heat=1,
+        forbidden_ids=forbidden_ids,
+        locked_recipes=locked_recipes,
+        forced_ingredients=forced_ingredients,
+        debug=True,
+        rng=rng or random.Random(0),
+        deadline=deadline,
+    )
+    remaining = total_slots - len(locked_recipes)
+    filled = sum(b["occasions"] for b in greedy[0])
+    if remaining > MAX_EXACT_SLOTS or filled < total_slots:
+        return greedy, {"proven_optimal": False, "nodes": 0, "fallback": True}
+
+    token_keys = list(rules.keys())
+    ingredient_keys = list(forced_ingredients.keys())
+
+    def vector(recipe):
+        return _pack(recipe.token_profile, token_keys) + _pack(
+            getattr(recipe, "forced_ingredient_profile", {}), ingredient_keys
+        )
+
+    targets = [float(rules[key]) for key in token_keys] + [float(forced_ingredients[key]) for key in ingredient_keys]
+    for r in locked_recipes:
+        targets = [target - value for target, value in zip(targets, vector(r))]
+        forbidden_ids.add(r.id)
+
+    candidates = []
+    seen = set()
+    for r in recipes:
+        if r.id in forbidden_ids or r.id in seen:
+            continue
+        seen.add(r.id)
+        candidates.append(r)
+
+    vectors = [vector(r) for r in candidates]
+    occasions = [_recipe_sizing(r.serves, members)[1] for r in candidates]
+    need = [max(target, 0.0) for target in targets]
+
+    def coverage(v):
+        return sum(min(value, n) / n for value, n in zip(v, need) if n > 0)
+
+    order = sorted(range(len(candidates)), key=lambda i: coverage(vectors[i]), reverse=True)
+    candidates = [candidates[i] for i in order]
+    vectors = [vectors[i] for i in order]
+    occasions = [occasions[i] for i in order]
+    top = _suffix_top_sums(vectors, remaining)
+
+    greedy_fresh = greedy[0][len(locked_recipes):]
+    greedy_totals = [0.0] * len(targets)
+    for b in greedy_fresh:
+        greedy_totals = [t + value for t, value in zip(greedy_totals, vector(b["recipe"]))]
+
+    best = {"shortfall": _shortfall(greedy_totals, targets), "picks": None}
+    counters = {"nodes": 0, "aborted": False}
+    if deadline is not None and deadline.remaining_ms() is not None:
+        time_limit_ms = min(time_limit_ms, deadline.remaining_ms())
+    stop_at = time.monotonic() + time_limit_ms / 1000
+    picks = []
+
+    def bound(start, picks_left, totals):
+        return sum(
+            max(0.0, target - total - top[start][k][picks_left])
+            for k, (target, total) in enumerate(zip(targets, totals))
+        )
+
+    def search(start, occ_sum, occ_max, totals):
+        picks_left = remaining - len(picks)
+        for j in range(start, len(candidates)):
+            if best["shortfall"] <= EPSILON:
+                return
+            if counters["nodes"] >= node_limit or (
+                counters["nodes"] % 1024 == 0 and time.monotonic() >= stop_at
+            ):
+                counters["aborted"] = True
+                if deadline is not None and deadline.expired():
+                    deadline.cut("exact")
+                return
+            # Everything from j on can only do as well as this bound — and
+            # later j's see a subset of those recipes, so stop scanning.
+            if bound(j, picks_left, totals) >= best["shortfall"] - EPSILON:
+                return
+
+            new_sum = occ_sum + occasions[j]
+            new_max = max(occ_max, occasions[j])
+            if new_sum - new_max >= remaining:
+                continue
+
+            counters["nodes"] += 1
+            new_totals = [t + value for t, value in zip(totals, vectors[j])]
+            picks.append(j)
+            if new_sum >= remaining:
+                shortfall = _shortfall(new_totals, targets)
+                if shortfall < best["shortfall"] - EPSILON:
+                    best["shortfall"] = shortfall
+                    best["picks"] = list(picks)
+            if picks_left > 1:
+                search(j + 1, new_sum, new_max, new_totals)
+            picks.pop()
+            if counters["aborted"]:
+                return
+
+    search(0, 0, 0, [0.0] * len(targets))
+    stats = {
+        "proven_optimal": not counters["aborted"],
+        "nodes": counters["nodes"],
+        "fallback": False,
+    }
+    if best["picks"] is None:
+        return greedy, stats
+
+    # Biggest batch last, so it's the one cut short to fit the slot count.
+    chosen = sorted((candidates[j] for j in best["picks"]), key=lambda r: _recipe_sizing(r.serves, members)[1])
+    batches = greedy[0][: len(locked_recipes)]
+    to_freeze = [f for f in greedy[1] if f["recipe"].id in {r.id for r in locked_recipes}]
+    slots_filled = len(locked_recipes)
+    for recipe in chosen:
+        multiplier, natural_occasions, frozen = _recipe_sizing(recipe.serves, members)
+        occasions_used = min(natural_occasions, total_slots - slots_filled)
+        if frozen and occasions_used == natural_occasions:
+            to_freeze.append({"recipe": recipe, "portions": frozen})
+        batches.append({"recipe": recipe, "occasions": occasions_used, "multiplier": multiplier})
+        slots_filled += occasions_used
+
+    token_progress = {}
+    ingredient_progress = {}
+    for b in batches:
+        token_progress = _merge_token_profiles(token_progress, b["recipe"].token_profile)
+        ingredient_progress = _merge_token_profiles(
+            ingredient_progress, getattr(b["recipe"], "forced_ingredient_profile", {})
+        )
+    return (batches, to_freeze, token_progress, ingredient_progress), stats
+
+
+def build_menu_batches_exact(
+    recipes,
+    rules,
+    total_slots,
+    members,
+    heat=3,
+    forbidden_ids=None,
+    locked_recipes=None,
+    forced_ingredients=None,
+    debug=False,
+    rng=None,
+    deadline=None,
+    on_pick=None,
+):
+    """solve_menu_batches_exact behind build_menu_batches' signature, so it
+    can be used wherever an engine is expected. heat is accepted and
+    ignored; rng only breaks ties in the greedy seed/fallback plan, so the
+    result is deterministic for a given rng seed (unless deadline cuts it
+    short). on_pick is replayed over the final plan's batches, since the
+    search has no meaningful partial picks."""
+    result, _stats = solve_menu_batches_exact(
+        recipes,
+        rules,
+        total_slots,
+        members,
+        forbidden_ids=forbidden_ids,
+        locked_recipes=locked_recipes,
+        forced_ingredients=forced_ingredients,
+        deadline=deadline,
+        rng=rng,
+    )
+    if on_pick is not None:
+        token_progress = {}
+        for batch in result[0]:
+            _add_profile(token_progress, batch["recipe"].token_profile)
+            on_pick(batch, token_progress)
+    return result if debug else result[:2]
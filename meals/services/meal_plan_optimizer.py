@@ -1,7 +1,71 @@
 import random
-import copy
+import heapq
 import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from functools import partial
+
+
+class RecipeAdapter:
+    """What the optimizer knows about one recipe: id/name/serves for sizing
+    (see _recipe_sizing), time/image for serializing the result without
+    going back to the Meal row, its token_profile ({token name: Decimal})
+    and forced_ingredient_profile ({ingredient_id: Decimal base-unit
+    quantity}, see build_menu_batches). Slotted since a CatalogSnapshot
+    holds one per Meal for the whole worker lifetime.
+    """
+
+    __slots__ = ("id", "name", "serves", "time", "image", "token_profile", "forced_ingredient_profile")
+
+    def __init__(self, id, name, serves, time=0, image="", token_profile=None, forced_ingredient_profile=None):
+        self.id = id
+        self.name = name
+        self.serves = serves
+        self.time = time
+        self.image = image
+        self.token_profile = token_profile or {}
+        self.forced_ingredient_profile = forced_ingredient_profile or {}
+
+    def with_forced_ingredient_profile(self, forced_ingredient_profile):
+        """Copy of this adapter carrying a request-specific forced_ingredient_profile."""
+        return RecipeAdapter(
+            self.id, self.name, self.serves, self.time, self.image,
+            self.token_profile, forced_ingredient_profile,
+        )
+
+    def __repr__(self):
+        return f"RecipeAdapter(id={self.id!r}, name={self.name!r})"
+
+
+class Deadline:
+    """A wall-clock cut-off shared by every optimizer stage of one request
+    (batch build, restarts, refinement), so the request as a whole stays
+    within it instead of each stage getting its own budget. ms=None never
+    expires. A stage that stops early because of it records its name in
+    cut_short, so callers can report how much of the search completed.
+    """
+
+    __slots__ = ("at", "cut_short")
+
+    def __init__(self, ms=None):
+        self.at = time.monotonic() + ms / 1000 if ms is not None else None
+        self.cut_short = set()
+
+    def expired(self):
+        return self.at is not None and time.monotonic() >= self.at
+
+    def remaining_ms(self):
+        """Milliseconds left (0 once expired), None without a cut-off."""
+        if self.at is None:
+            return None
+        return max((self.at - time.monotonic()) * 1000, 0)
+
+    def cut(self, stage):
+        self.cut_short.add(stage)
+
 
 def optimize_meal_plan(
     recipes,
@@ -12,6 +76,8 @@ def optimize_meal_plan(
     locked_recipes=None,
     forbidden_ids=None,
     debug=False,
+    rng=None,
+    numeric="decimal",
 ):
     """
     recipes: list of Recipe objects with .id and .token_profile (dict[str, float])
@@ -28,7 +94,11 @@ def optimize_meal_plan(
         totals are a sum, not sequence-dependent — only the count seeded
         matters, for pacing the remaining picks against total_meals.
     forbidden_ids: set of recipe IDs to avoid repeats
+    rng: optional random.Random driving the picks (defaults to the module
+        random), so a seeded run is reproducible
+    numeric: NUMERIC_BACKENDS key candidate scoring runs in
     """
+    rng = rng or random
     forbidden_ids = set(forbidden_ids) if forbidden_ids else set()
     locked_recipes = list(locked_recipes) if locked_recipes else []
 
@@ -49,7 +119,7 @@ def optimize_meal_plan(
         meal_plan = list(locked_recipes)
         token_progress = {}
         for r in meal_plan:
-            token_progress = _merge_token_profiles(token_progress, r.token_profile)
+            _add_profile(token_progress, r.token_profile)
     else:
         available_recipes = [r for r in recipes if r.id not in forbidden_ids]
 
@@ -63,33 +133,32 @@ def optimize_meal_plan(
 
         if starting_recipe:
             meal_plan = [starting_recipe]
-            token_progress = copy.deepcopy(starting_recipe.token_profile)
         else:
-            first = random.choice(available_recipes)
-            meal_plan = [first]
-            token_progress = copy.deepcopy(first.token_profile)
+            meal_plan = [rng.choice(available_recipes)]
+        token_progress = dict(meal_plan[0].token_profile)
 
         forbidden_ids.add(meal_plan[0].id)
 
+    tokens = TokenAccumulator(rules.keys(), numeric, steps=total_meals)
+    for r in meal_plan:
+        tokens.add(tokens.pack(r.token_profile))
+    packed = [(r, tokens.pack(r.token_profile)) for r in recipes]
+    expected_by_step = _expected_amounts_by_step(rules, total_meals, tokens.convert)
+
     for step in range(len(meal_plan), total_meals):
-        candidates = [r for r in recipes if r.id not in forbidden_ids]
-        # Shuffle so that candidates with tied scores (e.g. when rules is
-        # empty) aren't always picked in recipe/DB order.
-        random.shuffle(candidates)
-
-        scored = []
-        for recipe in candidates:
-            simulated = _merge_token_profiles(token_progress, recipe.token_profile)
-            score = _score_candidate(simulated, rules, step + 1, total_meals)
-            scored.append((recipe, score))
-
-        # Sort by score (lower is better)
-        scored.sort(key=lambda x: x[1])
-        top_n = scored[:min(heat, len(scored))]
-        selected = random.choice(top_n)[0]
+        expected = expected_by_step[step + 1]
+        scored = [
+            ((recipe, recipe_tokens), _score_candidate(tokens, recipe_tokens, expected))
+            for recipe, recipe_tokens in packed
+            if recipe.id not in forbidden_ids
+        ]
+
+        top_n = _top_k_scored(scored, heat, rng)
+        selected, selected_tokens = rng.choice(top_n)[0]
 
         meal_plan.append(selected)
-        token_progress = _merge_token_profiles(token_progress, selected.token_profile)
+        tokens.add(selected_tokens)
+        _add_profile(token_progress, selected.token_profile)
         forbidden_ids.add(selected.id)
 
     if debug:
@@ -97,25 +166,123 @@ def optimize_meal_plan(
     return meal_plan
 
 
+def _top_k_scored(scored, k, rng):
+    """The k lowest-scoring (recipe, score) pairs (lower is better), in no
+    particular order — callers pick among them at random anyway. Ties on
+    the k-th score are broken at random, so tied candidates (e.g. when
+    rules is empty) aren't always picked in recipe/DB order; that gives the
+    same odds as shuffling the whole pool before a stable sort, but costs
+    an O(n log k) heap pass plus a sample of the tied ones instead of a
+    full shuffle and sort every step."""
+    if len(scored) <= k:
+        return list(scored)
+    kth = max(heapq.nsmallest(k, (score for _, score in scored)))
+    below = [pair for pair in scored if pair[1] < kth]
+    tied = [pair for pair in scored if pair[1] == kth]
+    return below + rng.sample(tied, k - len(below))
+
+
 def _merge_token_profiles(base, addition):
-    result = copy.deepcopy(base)
-    for token, value in addition.items():
-        result[token] = result.get(token, 0) + value
+    # Values are Decimals (immutable), so a shallow copy is enough.
+    result = dict(base)
+    _add_profile(result, addition)
     return result
 
 
-def _score_candidate(token_progress, rules, current_step, total_steps):
+def _add_profile(totals, addition):
+    """In-place _merge_token_profiles, for running totals owned by the caller."""
+    for token, value in addition.items():
+        totals[token] = totals.get(token, 0) + value
+
+
+# Scoring counts in whole units of 1/(FIXED_POINT_SCALE x steps) of a
+# token: FIXED_POINT_SCALE matches the resolution token profiles are stored
+# at (PROFILE_QUANTUM), and the extra factor of `steps` makes every prorated
+# target (step / steps * required) a whole number too. All arithmetic is
+# then exact, whichever NUMERIC_BACKENDS type carries it — so ties are real
+# ties, never an artifact of rounding step / steps.
+FIXED_POINT_SCALE = 10000
+
+# Number types greedy scoring can run in. "decimal" is the default; "float"
+# and "fixed" (int) are much cheaper per operation and rank identically —
+# floats stay exact since every value is a whole number well below 2**53.
+# Only candidate ranking uses them; reported progress dicts are always
+# summed from the recipes' own Decimal profiles.
+NUMERIC_BACKENDS = {
+    "decimal": Decimal,
+    "float": float,
+    "fixed": int,
+}
+
+
+class TokenAccumulator:
+    """Running totals for a fixed set of keys (rule tokens or forced
+    ingredient ids), held in a list indexed by each key's position in
+    `keys` instead of a dict, in one of the NUMERIC_BACKENDS.
+
+    Candidate profiles are packed once per optimizer call (pack) into the
+    same layout, so scoring a candidate "as if added" (shortfall_if_added)
+    walks three parallel lists without building a merged dict, and only the
+    recipe actually picked is folded in, in place (add). Keys outside `keys`
+    are dropped at packing time — they can't affect the score. Targets
+    passed to shortfall_if_added must go through convert too; `steps` is
+    the number of steps targets get prorated over (see FIXED_POINT_SCALE).
+    """
+
+    __slots__ = ("keys", "index", "totals", "number", "scale", "zero")
+
+    def __init__(self, keys, numeric="decimal", steps=1):
+        self.number = NUMERIC_BACKENDS[numeric]
+        self.scale = FIXED_POINT_SCALE * max(steps, 1)
+        self.zero = self.number(0)
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.totals = [self.zero] * len(self.keys)
+
+    def convert(self, value):
+        """A Decimal-compatible amount in this accumulator's units and number type."""
+        return self.number(int((Decimal(value) * self.scale).to_integral_value()))
+
+    def pack(self, profile):
+        """profile ({key: Decimal}) as a tuple of amounts in `keys` order."""
+        zero = self.zero
+        convert = self.convert
+        return tuple(convert(profile[key]) if key in profile else zero for key in self.keys)
+
+    def add(self, packed):
+        totals = self.totals
+        for i, value in enumerate(packed):
+            totals[i] += value
+
+    def shortfall_if_added(self, packed, targets):
+        """Sum over keys of how far below targets[i] the totals would be
+        with `packed` added — without adding it."""
+        penalty = self.zero
+        for target, total, value in zip(targets, self.totals, packed):
+            under = target - total - value
+            if under > 0:
+                penalty += under
+        return penalty
+
+
+def _expected_amounts_by_step(rules, total_steps, convert=Decimal):
+    """For every step 0..total_steps, each rule's required amount prorated
+    to that step, in rules order (= the TokenAccumulator's keys order) —
+    computed once in Decimal per call, then converted to the scoring
+    backend, instead of per candidate."""
+    return [
+        [convert(Decimal(step) / Decimal(total_steps) * Decimal(required)) for required in rules.values()]
+        for step in range(total_steps + 1)
+    ]
+
+
+def _score_candidate(tokens, packed, expected):
     """
-    Penalize based on how far under the expected token amount we are.
-    Only penalize underperformance for now.
+    Penalize based on how far under the expected token amounts
+    (_expected_amounts_by_step) the plan would be with this candidate (`packed`
+    into `tokens`' layout) added. Only penalize underperformance for now.
     """
-    penalty = 0
-    for token, required in rules.items():
-        expected = Decimal(current_step) / Decimal(total_steps) * Decimal(required)
-        actual = token_progress.get(token, Decimal(0))
-        under = max(Decimal(0), expected - actual)
-        penalty += under
-    return penalty
+    return tokens.shortfall_if_added(packed, expected)
 
 
 def _recipe_sizing(serves, members):
@@ -140,7 +307,7 @@ def _recipe_sizing(serves, members):
     return 1, serves // members, 0
 
 
-def _ingredient_shortfall_penalty(ingredient_progress, forced_ingredients):
+def _ingredient_shortfall_penalty(ingredients, packed, targets):
     """Score contribution for forced ingredients (see build_menu_batches's
     forced_ingredients param). Unlike token rules — whose target is prorated
     across the whole plan by _score_candidate — a forced ingredient's full
@@ -149,14 +316,12 @@ def _ingredient_shortfall_penalty(ingredient_progress, forced_ingredients):
     of easing in gradually. That's what makes forcing an ingredient behave
     greedily (grabbed as soon as a good recipe using it is available) rather
     than being spread evenly over the whole plan like a token rule.
+
+    ingredients: TokenAccumulator over the forced ingredient ids; packed:
+    the candidate's forced_ingredient_profile in its layout; targets: the
+    forced amounts in the same order.
     """
-    if not forced_ingredients:
-        return Decimal(0)
-    penalty = Decimal(0)
-    for ingredient_id, target in forced_ingredients.items():
-        actual = ingredient_progress.get(ingredient_id, Decimal(0))
-        penalty += max(Decimal(0), target - actual)
-    return penalty
+    return ingredients.shortfall_if_added(packed, targets)
 
 
 def build_menu_batches(
@@ -169,14 +334,19 @@ def build_menu_batches(
     locked_recipes=None,
     forced_ingredients=None,
     debug=False,
+    rng=None,
+    numeric="decimal",
+    deadline=None,
+    on_pick=None,
+    pantry_bonus=None,
 ):
     """
     Like optimize_meal_plan, but plans in servings-needed rather than
     recipes-needed: each pick becomes a "batch" that can cover 1-3 slots
-    depending on how its yield (recipe._meal.serves) compares to `members`
+    depending on how its yield (recipe.serves) compares to `members`
     (see _recipe_sizing), instead of always covering exactly one slot.
 
-    recipes: list of Recipe adapters (.id, .token_profile, ._meal.serves),
+    recipes: list of RecipeAdapter-like objects (.id, .token_profile, .serves),
         optionally carrying .forced_ingredient_profile (dict {ingredient_id:
         Decimal grams used by this recipe} — see forced_ingredients below).
         Adapters without the attribute are treated as contributing nothing
@@ -198,6 +368,22 @@ def build_menu_batches(
         rules, so a forced ingredient tends to get used up in the first
         good-fitting recipes rather than spread across the whole plan.
         Locked recipes' usage counts toward the target too.
+    rng: optional random.Random driving the shuffles/picks (defaults to the
+        module-level random) — see build_menu_batches_best_of.
+    numeric: NUMERIC_BACKENDS key candidate scoring runs in ("decimal",
+        "float" or "fixed"). Only affects ranking; token_progress and
+        ingredient_progress are always summed in Decimal.
+    deadline: optional Deadline. If it expires mid-build, the remaining
+        slots are filled with random unused recipes, unscored, so there's
+        still a complete plan to return — and "build" goes in cut_short.
+    on_pick: optional callable(batch, token_progress), called as each batch
+        (locked ones first) is added, with the running token totals — for
+        streaming progress. token_progress keeps changing afterwards, so
+        copy it to keep it. An exception it raises aborts the build.
+    pantry_bonus: optional {recipe_id: amount} (CatalogSnapshot.pantry_bonus)
+        subtracted from a candidate's score at every step, in token units —
+        favours recipes the household already has the ingredients for. It
+        doesn't depend on the plan so far, so it's converted once up front.
 
     Returns (batches, to_freeze), or (batches, to_freeze, token_progress,
     ingredient_progress) when debug=True:
@@ -216,6 +402,7 @@ def build_menu_batches(
     forbidden_ids = set(forbidden_ids) if forbidden_ids else set()
     locked_recipes = list(locked_recipes) if locked_recipes else []
     forced_ingredients = forced_ingredients or {}
+    rng = rng or random
 
     batches = []
     to_freeze = []
@@ -223,17 +410,24 @@ def build_menu_batches(
     ingredient_progress = {}
     slots_filled = 0
 
+    tokens = TokenAccumulator(rules.keys(), numeric, steps=total_slots)
+    ingredients = TokenAccumulator(forced_ingredients.keys(), numeric, steps=total_slots)
+    ingredient_targets = [ingredients.convert(forced_ingredients[key]) for key in ingredients.keys]
+    bonuses = {recipe_id: tokens.convert(amount) for recipe_id, amount in (pantry_bonus or {}).items()}
+
     for r in locked_recipes:
         forbidden_ids.add(r.id)
-        multiplier, occasions, frozen = _recipe_sizing(r._meal.serves, members)
-        token_progress = _merge_token_profiles(token_progress, r.token_profile)
-        ingredient_progress = _merge_token_profiles(
-            ingredient_progress, getattr(r, "forced_ingredient_profile", {})
-        )
+        multiplier, occasions, frozen = _recipe_sizing(r.serves, members)
+        tokens.add(tokens.pack(r.token_profile))
+        ingredients.add(ingredients.pack(getattr(r, "forced_ingredient_profile", {})))
+        _add_profile(token_progress, r.token_profile)
+        _add_profile(ingredient_progress, getattr(r, "forced_ingredient_profile", {}))
         if frozen:
             to_freeze.append({"recipe": r, "portions": frozen})
         batches.append({"recipe": r, "occasions": 1, "multiplier": multiplier})
         slots_filled += 1
+        if on_pick is not None:
+            on_pick(batches[-1], token_progress)
 
     remaining_needed = total_slots - slots_filled
     if remaining_needed < 0:
@@ -241,32 +435,47 @@ def build_menu_batches(
             f"total_slots ({total_slots}) is smaller than the number of locked recipes ({len(locked_recipes)})."
         )
 
+    packed = [
+        (r, tokens.pack(r.token_profile), ingredients.pack(getattr(r, "forced_ingredient_profile", {})))
+        for r in recipes
+    ]
+
+    expected_by_step = _expected_amounts_by_step(rules, total_slots, tokens.convert)
+
+    rushed = None
     while slots_filled < total_slots:
-        candidates = [r for r in recipes if r.id not in forbidden_ids]
-        if not candidates:
-            # Out of distinct recipes — stop here rather than repeating one.
-            # slots_filled stays below total_slots; caller reports the gap.
-            break
-        # Shuffle so that candidates with tied scores (e.g. when rules is
-        # empty) aren't always picked in recipe/DB order.
-        random.shuffle(candidates)
-
-        scored = []
-        for recipe in candidates:
-            simulated = _merge_token_profiles(token_progress, recipe.token_profile)
-            score = _score_candidate(simulated, rules, slots_filled + 1, total_slots)
-            if forced_ingredients:
-                simulated_ingredients = _merge_token_profiles(
-                    ingredient_progress, getattr(recipe, "forced_ingredient_profile", {})
-                )
-                score += _ingredient_shortfall_penalty(simulated_ingredients, forced_ingredients)
-            scored.append((recipe, score))
-
-        scored.sort(key=lambda x: x[1])
-        top_n = scored[:min(heat, len(scored))]
-        selected = random.choice(top_n)[0]
-
-        multiplier, natural_occasions, frozen = _recipe_sizing(selected._meal.serves, members)
+        if rushed is None and deadline is not None and deadline.expired():
+            deadline.cut("build")
+            rushed = [entry for entry in packed if entry[0].id not in forbidden_ids]
+
+        if rushed is not None:
+            if not rushed:
+                break
+            i = rng.randrange(len(rushed))
+            rushed[i], rushed[-1] = rushed[-1], rushed[i]
+            selected, selected_tokens, selected_ingredients = rushed.pop()
+        else:
+            expected = expected_by_step[slots_filled + 1]
+            scored = []
+            for entry in packed:
+                recipe, recipe_tokens, recipe_ingredients = entry
+                if recipe.id in forbidden_ids:
+                    continue
+                score = _score_candidate(tokens, recipe_tokens, expected)
+                if forced_ingredients:
+                    score += _ingredient_shortfall_penalty(ingredients, recipe_ingredients, ingredient_targets)
+                if bonuses:
+                    score -= bonuses.get(recipe.id, tokens.zero)
+                scored.append((entry, score))
+            if not scored:
+                # Out of distinct recipes — stop here rather than repeating one.
+                # slots_filled stays below total_slots; caller reports the gap.
+                break
+
+            top_n = _top_k_scored(scored, heat, rng)
+            selected, selected_tokens, selected_ingredients = rng.choice(top_n)[0]
+
+        multiplier, natural_occasions, frozen = _recipe_sizing(selected.serves, members)
         occasions = min(natural_occasions, total_slots - slots_filled)
         # Only surface a freeze card when the 3x-cap is the actual reason for
         # not using the full yield — not when we simply ran out of slots.
@@ -274,18 +483,297 @@ def build_menu_batches(
             to_freeze.append({"recipe": selected, "portions": frozen})
 
         batches.append({"recipe": selected, "occasions": occasions, "multiplier": multiplier})
-        token_progress = _merge_token_profiles(token_progress, selected.token_profile)
-        ingredient_progress = _merge_token_profiles(
-            ingredient_progress, getattr(selected, "forced_ingredient_profile", {})
-        )
+        tokens.add(selected_tokens)
+        ingredients.add(selected_ingredients)
+        _add_profile(token_progress, selected.token_profile)
+        _add_profile(ingredient_progress, getattr(selected, "forced_ingredient_profile", {}))
         forbidden_ids.add(selected.id)
         slots_filled += occasions
+        if on_pick is not None:
+            on_pick(batches[-1], token_progress)
 
     if debug:
         return batches, to_freeze, token_progress, ingredient_progress
     return batches, to_freeze
 
 
+def plan_shortfall(token_progress, ingredient_progress, rules, forced_ingredients=None):
+    """How far a finished plan falls short of its targets: the sum, over
+    every token rule, of how much of the required amount is still missing,
+    plus the same for every forced ingredient. 0 means every target was met.
+    Unlike _score_candidate, nothing is prorated — this judges the plan as a
+    whole (see build_menu_batches_best_of)."""
+    shortfall = Decimal(0)
+    for token, required in rules.items():
+        shortfall += max(Decimal(0), Decimal(required) - token_progress.get(token, Decimal(0)))
+    for ingredient_id, target in (forced_ingredients or {}).items():
+        shortfall += max(Decimal(0), target - ingredient_progress.get(ingredient_id, Decimal(0)))
+    return shortfall
+
+
+def build_menu_batches_best_of(build, restarts, deadline=None, rng=None, max_workers=None, **kwargs):
+    """
+    Runs `restarts` independent passes of a batch builder (build_menu_batches
+    or build_menu_batches_vectorized — `build`, called with **kwargs plus
+    debug=True and its own seeded random.Random) and keeps the best plan:
+    fewest unfilled slots first, then lowest plan_shortfall. Since each pass
+    is randomized by `heat`, this trades a few extra passes server-side for
+    the "regenerate until it looks good" round trips users would otherwise
+    make.
+
+    Passes run on a thread pool (max_workers, default min(restarts, CPU
+    count)) — a real speedup for the vectorized engine, whose NumPy work
+    releases the GIL; the pure-Python engine just runs them back to back.
+    deadline: optional Deadline, also handed to every pass. Passes that
+    haven't started once it expires are skipped ("restarts" goes in
+    cut_short); the first pass always runs, so there's always a plan to
+    return. An on_pick in kwargs is handed to every pass with the pass
+    index bound first: on_pick(pass_index, batch, token_progress).
+
+    Returns (result, score, stats): result is the best pass's debug tuple
+    (batches, to_freeze, token_progress, ingredient_progress), score its
+    plan_shortfall, stats {"restarts": requested, "restarts_completed": ran}.
+    """
+    restarts = max(1, restarts)
+    completed = _run_build_passes(build, restarts, rng, deadline, max_workers, kwargs)
+    (_unfilled, score), best = min(completed, key=lambda outcome: outcome[0])
+    return best, score, {"restarts": restarts, "restarts_completed": len(completed)}
+
+
+def _run_build_passes(build, passes, rng, deadline, max_workers, kwargs):
+    """Runs `passes` independently seeded passes of `build` (see
+    build_menu_batches_best_of for the threading/deadline rules) and returns
+    ((unfilled_slots, plan_shortfall), debug_result) for each pass that ran,
+    in pass order."""
+    rng = rng or random
+    seeds = [rng.getrandbits(64) for _ in range(passes)]
+    rules = kwargs.get("rules", {})
+    forced_ingredients = kwargs.get("forced_ingredients")
+    total_slots = kwargs.get("total_slots", 0)
+    on_pick = kwargs.pop("on_pick", None)
+
+    def run_pass(index):
+        if index > 0 and deadline is not None and deadline.expired():
+            deadline.cut("restarts")
+            return None
+        if on_pick is not None:
+            kwargs_for_pass = {**kwargs, "on_pick": partial(on_pick, index)}
+        else:
+            kwargs_for_pass = kwargs
+        result = build(**kwargs_for_pass, debug=True, rng=random.Random(seeds[index]), deadline=deadline)
+        batches, _to_freeze, token_progress, ingredient_progress = result
+        unfilled = total_slots - sum(b["occasions"] for b in batches)
+        score = plan_shortfall(token_progress, ingredient_progress, rules, forced_ingredients)
+        return (unfilled, score), result
+
+    workers = max_workers or min(passes, os.cpu_count() or 1)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(run_pass, range(passes)))
+    else:
+        outcomes = [run_pass(index) for index in range(passes)]
+    return [outcome for outcome in outcomes if outcome is not None]
+
+
+def _jaccard_distance(a, b):
+    union = a | b
+    if not union:
+        return 0.0
+    return 1 - len(a & b) / len(union)
+
+
+def build_menu_batches_alternatives(
+    build, count, min_distance=0.3, attempts=None, deadline=None, rng=None, max_workers=None, **kwargs
+):
+    """
+    Up to `count` distinct plans from one batch builder, for the client to
+    page through, instead of `count` separate preview requests. Runs
+    `attempts` passes (default 4 per plan wanted) the same way as
+    build_menu_batches_best_of, then walks them best-first (fewest unfilled
+    slots, then lowest plan_shortfall) keeping each one whose freshly-picked
+    recipe set is at least `min_distance` (Jaccard distance) away from every
+    plan kept so far. If that leaves fewer than `count`, the best remaining
+    passes that are merely distinct (distance > 0) fill the gap — so fewer
+    than `count` come back only when fewer distinct plans were found.
+    Locked recipes are shared by every plan, so they don't count toward the
+    distance.
+
+    Returns (plans, stats): plans is a list of (result, score, distance) in
+    the order they were kept (best first) — result the pass's debug tuple,
+    score its plan_shortfall, distance its smallest Jaccard distance to the
+    plans before it (None for the first); stats {"attempts": requested,
+    "attempts_completed": ran}.
+    """
+    count = max(1, count)
+    attempts = max(count, attempts or 4 * count)
+    completed = _run_build_passes(build, attempts, rng, deadline, max_workers, kwargs)
+    completed.sort(key=lambda outcome: outcome[0])
+
+    locked_ids = {r.id for r in kwargs.get("locked_recipes") or []}
+
+    def fresh_ids(result):
+        return frozenset(b["recipe"].id for b in result[0]) - locked_ids
+
+    kept = []
+    kept_ids = []
+    for threshold in (min_distance, 1e-9):
+        for outcome in completed:
+            if len(kept) >= count:
+                break
+            (_unfilled, score), result = outcome
+            ids = fresh_ids(result)
+            if ids in kept_ids:
+                continue
+            distances = [_jaccard_distance(ids, other) for other in kept_ids]
+            if distances and min(distances) < threshold:
+                continue
+            kept.append((result, score, min(distances) if distances else None))
+            kept_ids.append(ids)
+
+    return kept, {"attempts": attempts, "attempts_completed": len(completed)}
+
+
+def _shortfall_delta(totals, removed, added, targets):
+    """Change in plan_shortfall's contribution from `targets` ({key:
+    required}) when the `removed` profile is swapped for `added`, given
+    current `totals` — only touches the keys being targeted, so a candidate
+    move costs O(len(targets)) instead of re-scoring the whole plan."""
+    delta = Decimal(0)
+    for key, required in targets.items():
+        current = totals.get(key, Decimal(0))
+        updated = current - removed.get(key, Decimal(0)) + added.get(key, Decimal(0))
+        delta += max(Decimal(0), required - updated) - max(Decimal(0), required - current)
+    return delta
+
+
+def refine_menu_batches(
+    batches,
+    recipes,
+    rules,
+    members,
+    locked_recipes=None,
+    forbidden_ids=None,
+    forced_ingredients=None,
+    iterations=200,
+    deadline=None,
+    rng=None,
+    pantry_bonus=None,
+):
+    """
+    Hill-climbing post-pass over build_menu_batches' output: repeatedly picks
+    a random non-locked batch and a random unused recipe, and swaps the
+    recipe in when that lowers plan_shortfall. The greedy build never
+    revisits an early pick; one or two such swaps often close most of a
+    plan's remaining token/forced-ingredient gap.
+
+    A swap keeps the batch's slot count: the new recipe must cover exactly
+    the same number of occasions per _recipe_sizing (or at least as many,
+    when the batch was cut short by running out of slots), and takes its own
+    multiplier. Locked recipes are never swapped out, and forbidden_ids,
+    recipes already in the plan and locked recipes are never swapped in (no
+    repeats). Each move is scored incrementally (_shortfall_delta) against
+    running totals, so hundreds of moves fit in a request.
+
+    pantry_bonus: optional {recipe_id: amount}, as in build_menu_batches —
+    a swap must then lower plan_shortfall minus the plan's total bonus, so
+    refinement doesn't trade away pantry-covered recipes for nothing.
+
+    Stops after `iterations` moves, when the optional Deadline expires
+    ("refine" goes in cut_short), or as soon as the plan has no shortfall
+    left. Callers should re-run schedule_batches
+    on the result.
+
+    Returns (batches, to_freeze, token_progress, ingredient_progress, stats):
+    the same shapes as build_menu_batches(debug=True), with to_freeze
+    recomputed for the final picks, plus stats {"refine_iterations": moves
+    tried, "refine_improvements": moves kept}.
+    """
+    rng = rng or random
+    rules = {token: Decimal(required) for token, required in rules.items()}
+    forced_ingredients = forced_ingredients or {}
+    pantry_bonus = pantry_bonus or {}
+    locked_ids = {r.id for r in (locked_recipes or [])}
+
+    batches = [dict(b) for b in batches]
+    token_totals = {}
+    ingredient_totals = {}
+    for b in batches:
+        token_totals = _merge_token_profiles(token_totals, b["recipe"].token_profile)
+        ingredient_totals = _merge_token_profiles(
+            ingredient_totals, getattr(b["recipe"], "forced_ingredient_profile", {})
+        )
+    shortfall = plan_shortfall(token_totals, ingredient_totals, rules, forced_ingredients)
+
+    used_ids = {b["recipe"].id for b in batches} | locked_ids | set(forbidden_ids or ())
+    pool = [r for r in recipes if r.id not in used_ids]
+    movable = [i for i, b in enumerate(batches) if b["recipe"].id not in locked_ids]
+
+    tried = 0
+    improved = 0
+    while pool and movable and shortfall > 0 and tried < iterations:
+        if deadline is not None and deadline.expired():
+            deadline.cut("refine")
+            break
+        tried += 1
+
+        i = rng.choice(movable)
+        j = rng.randrange(len(pool))
+        batch, candidate = batches[i], pool[j]
+        old = batch["recipe"]
+
+        _, old_natural, _ = _recipe_sizing(old.serves, members)
+        multiplier, natural, _ = _recipe_sizing(candidate.serves, members)
+        cut_short = batch["occasions"] < old_natural
+        if natural != batch["occasions"] and not (cut_short and natural > batch["occasions"]):
+            continue
+
+        old_ingredients = getattr(old, "forced_ingredient_profile", {})
+        new_ingredients = getattr(candidate, "forced_ingredient_profile", {})
+        delta = _shortfall_delta(token_totals, old.token_profile, candidate.token_profile, rules)
+        if forced_ingredients:
+            delta += _shortfall_delta(ingredient_totals, old_ingredients, new_ingredients, forced_ingredients)
+        gain = delta
+        if pantry_bonus:
+            gain -= Decimal(pantry_bonus.get(candidate.id, 0)) - Decimal(pantry_bonus.get(old.id, 0))
+        if gain >= 0:
+            continue
+
+        for key, value in old.token_profile.items():
+            token_totals[key] = token_totals.get(key, Decimal(0)) - value
+        for key, value in candidate.token_profile.items():
+            token_totals[key] = token_totals.get(key, Decimal(0)) + value
+        for key, value in old_ingredients.items():
+            ingredient_totals[key] = ingredient_totals.get(key, Decimal(0)) - value
+        for key, value in new_ingredients.items():
+            ingredient_totals[key] = ingredient_totals.get(key, Decimal(0)) + value
+
+        batches[i] = {"recipe": candidate, "occasions": batch["occasions"], "multiplier": multiplier}
+        pool[j] = old
+        shortfall += delta
+        improved += 1
+
+    # Re-derive freeze cards for the final picks, same rules as build_menu_batches:
+    # locked recipes always surface theirs, fresh ones only when the 3x cap
+    # (not running out of slots) is why their yield wasn't fully used.
+    to_freeze = []
+    for b in batches:
+        _, natural, frozen = _recipe_sizing(b["recipe"].serves, members)
+        if frozen and (b["recipe"].id in locked_ids or b["occasions"] == natural):
+            to_freeze.append({"recipe": b["recipe"], "portions": frozen})
+
+    # Totals re-summed from scratch so no cancelled-out keys linger at 0.
+    token_progress = {}
+    ingredient_progress = {}
+    for b in batches:
+        token_progress = _merge_token_profiles(token_progress, b["recipe"].token_profile)
+        ingredient_progress = _merge_token_profiles(
+            ingredient_progress, getattr(b["recipe"], "forced_ingredient_profile", {})
+        )
+
+    stats = {"refine_iterations": tried, "refine_improvements": improved}
+    return batches, to_freeze, token_progress, ingredient_progress, stats
+
+
 def schedule_batches(batches):
     """
     Flattens batches (see build_menu_batches) into a chronologically-ordered
@@ -294,40 +782,25 @@ def schedule_batches(batches):
     dumped consecutively: no recipe is placed for a 3rd slot in a row unless
     it's the only batch with occasions left (unavoidable at that point).
 
+    The round-robin is a deque rotation: the batch just placed goes to the
+    back (or is dropped once used up), so it's never next unless it's the
+    only one left — O(total occasions) instead of rescanning the list and
+    popping from its middle on every slot.
+
     Returns a list of {"recipe": adapter, "multiplier": int}.
     """
-    active = [
+    active = deque(
         {"recipe": b["recipe"], "multiplier": b["multiplier"], "remaining": b["occasions"]}
         for b in batches
         if b["occasions"] > 0
-    ]
+    )
 
     result = []
-    last_index = 0
     while active:
-        n = len(active)
-        chosen_i = None
-        for step in range(n):
-            i = (last_index + step) % n
-            candidate = active[i]
-            last_two_same = (
-                len(result) >= 2
-                and result[-1]["recipe"].id == candidate["recipe"].id
-                and result[-2]["recipe"].id == candidate["recipe"].id
-            )
-            if last_two_same and n > 1:
-                continue
-            chosen_i = i
-            break
-        if chosen_i is None:
-            chosen_i = last_index % n
-
-        candidate = active[chosen_i]
+        candidate = active.popleft()
         result.append({"recipe": candidate["recipe"], "multiplier": candidate["multiplier"]})
         candidate["remaining"] -= 1
-        last_index = chosen_i + 1
-        if candidate["remaining"] == 0:
-            active.pop(chosen_i)
-            last_index = chosen_i
+        if candidate["remaining"]:
+            active.append(candidate)
 
     return result
@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
+
+PLAN_CACHE_MAX_ENTRIES = 128
+PLAN_CACHE_TTL_SECONDS = 600
+
+
+class PlanCache:
+    """Small per-worker LRU of optimizer results with a time-to-live.
+
+    Keys must already identify everything the result depends on — callers
+    include the catalog version, so a catalog change never serves a stale
+    plan, it just stops hitting old keys (which then age out of the LRU).
+    Values are shared between hits and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=PLAN_CACHE_MAX_ENTRIES, ttl_seconds=PLAN_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+plan_cache = PlanCache()
@@ -1,7 +1,75 @@
 from collections import defaultdict
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 
-from ..models import MealIngredient
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Lower, Trim
+
+from ..models import Ingredient, MealIngredient, Menu, MenuShoppingLine
+from .token_calculator import parse_quantity
+
+
+def _aggregate_menu_lines(menu):
+    """{(ingredient_id, unit, measured): [quantity, sources]} over a menu's
+    planned slots — the lines MenuShoppingLine holds. Measured lines sum
+    quantity_value x portions_multiplier per ingredient and normalized unit
+    in one grouped query. Only rows with no stored quantity_value are
+    fetched one by one, and re-parsed in Python (parse_quantity) in case
+    they were never synced; what still doesn't parse ("qb") becomes an
+    unmeasured (ingredient_id, "", False) line. Constant query count,
+    whatever the number of planned meals."""
+    rows = MealIngredient.objects.filter(
+        meal__menu_entries__menu=menu, meal__menu_entries__state="planned"
+    ).order_by()
+
+    lines = {}
+    totals = (
+        rows.filter(quantity_value__isnull=False)
+        .annotate(unit=Lower(Trim("u_desc")))
+        .values_list("ingredient_id", "unit")
+        .annotate(
+            total=Sum(
+                F("quantity_value") * F("meal__menu_entries__portions_multiplier"),
+                output_field=DecimalField(max_digits=20, decimal_places=4),
+            ),
+            sources=Count("id"),
+        )
+    )
+    for ingredient_id, unit, total, sources in totals:
+        line = lines.setdefault((ingredient_id, unit, True), [Decimal(0), 0])
+        line[0] += total
+        line[1] += sources
+
+    for ingredient_id, u_quantity, u_desc, multiplier in rows.filter(quantity_value__isnull=True).values_list(
+        "ingredient_id", "u_quantity", "u_desc", "meal__menu_entries__portions_multiplier"
+    ):
+        quantity = parse_quantity(u_quantity)
+        if quantity is None:
+            line = lines.setdefault((ingredient_id, "", False), [Decimal(0), 0])
+        else:
+            line = lines.setdefault((ingredient_id, u_desc.strip().lower(), True), [Decimal(0), 0])
+            line[0] += quantity * multiplier
+        line[1] += 1
+    return lines
+
+
+def _group_lines(lines, ingredients):
+    """(measured, unmeasured) as returned by compute_menu_ingredients, from
+    ((ingredient_id, unit, measured), quantity) pairs and an {id:
+    Ingredient} map."""
+    measured = {}
+    unmeasured = {}
+    for (ingredient_id, unit, is_measured), quantity in lines:
+        ingredient = ingredients[ingredient_id]
+        if is_measured:
+            bucket = measured.setdefault(ingredient_id, {"ingredient": ingredient, "lines": defaultdict(Decimal)})
+            bucket["lines"][unit] += quantity
+        else:
+            unmeasured[ingredient_id] = ingredient
+
+    for ingredient_id in measured:
+        unmeasured.pop(ingredient_id, None)
+    return measured, unmeasured
 
 
 def compute_menu_ingredients(menu):
@@ -10,7 +78,9 @@ def compute_menu_ingredients(menu):
     scaling each meal's quantities by its slot's portions_multiplier and
     grouping by (ingredient, unit) so e.g. yogurt used as "1 cup" in one
     recipe and "3 tbsp" in another stays as two lines rather than being
-    force-converted into a single base unit.
+    force-converted into a single base unit. Computed from scratch (see
+    _aggregate_menu_lines); readers should use menu_shopping_list, which
+    serves the persisted MenuShoppingLine rows instead.
 
     Returns (measured, unmeasured):
     - measured: {ingredient_id: {"ingredient": Ingredient, "lines": {unit: Decimal}}}
@@ -20,33 +90,122 @@ def compute_menu_ingredients(menu):
       silently disappears from the list; an ingredient that also has a real
       measured line elsewhere is left out of this bucket.
     """
-    measured = {}
-    unmeasured = {}
+    lines = _aggregate_menu_lines(menu)
+    ingredients = Ingredient.objects.in_bulk({ingredient_id for ingredient_id, _, _ in lines})
+    return _group_lines(((key, quantity) for key, (quantity, _) in lines.items()), ingredients)
 
-    menu_meals = menu.menu_meals.filter(state="planned").select_related("meal")
 
-    for menu_meal in menu_meals:
-        multiplier = Decimal(menu_meal.portions_multiplier)
-        meal_ingredients = MealIngredient.objects.select_related("ingredient").filter(
-            meal=menu_meal.meal
-        )
+def rebuild_menu_shopping_lines(menu):
+    """Replaces a menu's MenuShoppingLine rows with a full recompute and
+    marks them fresh. For menus built in one go (_persist_menu) and for
+    stale ones (menu_shopping_list does it on read)."""
+    with transaction.atomic():
+        # Row lock on the menu, taken by apply_menu_meal_change too.
+        list(Menu.objects.select_for_update().filter(pk=menu.pk).values_list("pk", flat=True))
+        lines = _aggregate_menu_lines(menu)
+        MenuShoppingLine.objects.filter(menu=menu).delete()
+        MenuShoppingLine.objects.bulk_create([
+            MenuShoppingLine(
+                menu=menu, ingredient_id=ingredient_id, unit=unit, measured=measured,
+                quantity=quantity, sources=sources,
+            )
+            for (ingredient_id, unit, measured), (quantity, sources) in lines.items()
+        ])
+        Menu.objects.filter(pk=menu.pk).update(shopping_list_stale=False)
+    menu.shopping_list_stale = False
 
-        for mi in meal_ingredients:
-            ingredient = mi.ingredient
-            unit = mi.u_desc.strip().lower()
 
-            try:
-                quantity = Decimal(mi.u_quantity) * multiplier
-            except (InvalidOperation, TypeError):
-                unmeasured.setdefault(ingredient.id, ingredient)
-                continue
+def mark_shopping_lists_stale(menu_ids=None, meal_id=None):
+    """Flags menus for a rebuild on their next read — the given ones, or
+    every menu using meal_id (whose ingredients just changed). One UPDATE."""
+    menus = Menu.objects.all()
+    if menu_ids is not None:
+        menus = menus.filter(pk__in=list(menu_ids))
+    if meal_id is not None:
+        menus = menus.filter(pk__in=Menu.objects.filter(menu_meals__meal_id=meal_id).values("pk"))
+    menus.update(shopping_list_stale=True)
 
-            bucket = measured.setdefault(
-                ingredient.id, {"ingredient": ingredient, "lines": defaultdict(Decimal)}
+
+def _meal_lines(meal_id):
+    """{(ingredient_id, unit, measured): [quantity, sources]} of one serving
+    of one meal — what one planned slot of it (portions_multiplier 1) adds
+    to a menu's lines, keyed like _aggregate_menu_lines."""
+    lines = {}
+    for ingredient_id, u_quantity, u_desc, quantity_value in MealIngredient.objects.filter(
+        meal_id=meal_id
+    ).values_list("ingredient_id", "u_quantity", "u_desc", "quantity_value"):
+        quantity = quantity_value if quantity_value is not None else parse_quantity(u_quantity)
+        if quantity is None:
+            line = lines.setdefault((ingredient_id, "", False), [Decimal(0), 0])
+        else:
+            line = lines.setdefault((ingredient_id, u_desc.strip().lower(), True), [Decimal(0), 0])
+            line[0] += quantity
+        line[1] += 1
+    return lines
+
+
+def apply_menu_meal_change(menu_id, meal_id, multiplier_delta, slot_delta):
+    """Adds one meal's lines (_meal_lines) to a menu's MenuShoppingLine
+    rows, quantities scaled by multiplier_delta and sources by slot_delta —
+    e.g. (-2, -1) when a planned slot with portions_multiplier 2 is marked
+    done, (1, 0) when a planned slot's multiplier goes from 1 to 2. A no-op
+    for stale menus, which get rebuilt anyway; if the rows turn out not to
+    match (a line to subtract from is missing), the menu is marked stale
+    instead of guessing."""
+    if not multiplier_delta and not slot_delta:
+        return
+    with transaction.atomic():
+        stale = (
+            Menu.objects.select_for_update().filter(pk=menu_id)
+            .values_list("shopping_list_stale", flat=True).first()
+        )
+        if stale is None or stale:
+            return
+        changes = _meal_lines(meal_id)
+        if not changes:
+            return
+        existing = {
+            (line.ingredient_id, line.unit, line.measured): line
+            for line in MenuShoppingLine.objects.filter(
+                menu_id=menu_id, ingredient_id__in={ingredient_id for ingredient_id, _, _ in changes}
             )
-            bucket["lines"][unit] += quantity
+        }
 
-    for ingredient_id in measured:
-        unmeasured.pop(ingredient_id, None)
+        to_create, to_update, to_delete = [], [], []
+        for key, (quantity, sources) in changes.items():
+            quantity_change = quantity * multiplier_delta
+            sources_change = sources * slot_delta
+            line = existing.get(key)
+            if line is None:
+                if sources_change <= 0:
+                    mark_shopping_lists_stale([menu_id])
+                    return
+                ingredient_id, unit, measured = key
+                to_create.append(MenuShoppingLine(
+                    menu_id=menu_id, ingredient_id=ingredient_id, unit=unit, measured=measured,
+                    quantity=quantity_change, sources=sources_change,
+                ))
+                continue
+            line.quantity += quantity_change
+            line.sources += sources_change
+            if line.sources < 0:
+                mark_shopping_lists_stale([menu_id])
+                return
+            (to_delete if line.sources == 0 else to_update).append(line)
 
-    return measured, unmeasured
+        MenuShoppingLine.objects.bulk_create(to_create)
+        MenuShoppingLine.objects.bulk_update(to_update, ["quantity", "sources"])
+        MenuShoppingLine.objects.filter(pk__in=[line.pk for line in to_delete]).delete()
+
+
+def menu_shopping_list(menu):
+    """compute_menu_ingredients' result, read from the menu's persisted
+    MenuShoppingLine rows in one indexed query — rebuilt first if the menu
+    is stale."""
+    if menu.shopping_list_stale:
+        rebuild_menu_shopping_lines(menu)
+    lines = list(MenuShoppingLine.objects.filter(menu=menu).select_related("ingredient"))
+    ingredients = {line.ingredient_id: line.ingredient for line in lines}
+    return _group_lines(
+        (((line.ingredient_id, line.unit, line.measured), line.quantity) for line in lines), ingredients
+    )
@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+import numpy as np
+
+from .vectorized_optimizer import pack_profiles
+
+
+def rank_slot_alternatives(snapshot, rules, kept_recipes, replaced_recipe=None, forced_ingredients=None, limit=5):
+    """
+    Best replacements for one slot of an otherwise fixed draft, scored in a
+    single vectorized pass over the whole catalog instead of re-running the
+    optimizer with every other slot locked.
+
+    Each candidate is scored like the last step of build_menu_batches: how
+    far the draft's token totals (kept_recipes, each counted once — a batch
+    spanning several slots is still one batch) plus the candidate would fall
+    short of every rule, plus the same for forced ingredients. Recipes
+    already in the draft, and replaced_recipe itself, are excluded.
+
+    snapshot: the CatalogSnapshot whose token_matrix/ingredient_usage to
+        score against — its `recipes` are the candidates.
+    rules: {token name: required amount}
+    kept_recipes: adapters on every other slot of the draft.
+    replaced_recipe: the adapter currently on the slot, if any — token
+        deltas are reported against it.
+    forced_ingredients: optional {ingredient_id: Decimal grams}.
+
+    Returns (alternatives, current_score): alternatives is up to `limit`
+    {"recipe": adapter, "score": float, "token_deltas": {token: Decimal}}
+    dicts, best first (ties by name); current_score is the same score for
+    replaced_recipe (None without one) — just kept_recipes' when it is one
+    of them too (a batch cooked for several slots), since it's only counted
+    once either way.
+    """
+    forced_ingredients = forced_ingredients or {}
+    rule_names = list(rules.keys())
+    required = np.array([float(rules[name]) for name in rule_names], dtype=np.float64)
+
+    matrix = np.zeros((len(snapshot.recipes), len(rule_names)), dtype=np.float64)
+    for j, name in enumerate(rule_names):
+        column = snapshot.token_columns.get(name)
+        if column is not None:
+            matrix[:, j] = snapshot.token_matrix[:, column]
+
+    kept_unique = list({r.id: r for r in kept_recipes}.values())
+    kept_ids = {r.id for r in kept_unique}
+    kept_totals = pack_profiles([r.token_profile for r in kept_unique], rule_names).sum(axis=0)
+    scores = np.maximum(required - kept_totals - matrix, 0.0).sum(axis=1)
+    kept_score = float(np.maximum(required - kept_totals, 0.0).sum())
+
+    row_of = snapshot.recipe_rows
+    if forced_ingredients:
+        forced_keys = list(forced_ingredients.keys())
+        targets = np.array([float(forced_ingredients[key]) for key in forced_keys], dtype=np.float64)
+        usage = snapshot.usage_matrix(forced_keys)
+        kept_rows = [row_of[i] for i in kept_ids if i in row_of]
+        kept_usage = usage[kept_rows].sum(axis=0)
+        scores += np.maximum(targets - kept_usage - usage, 0.0).sum(axis=1)
+        kept_score += float(np.maximum(targets - kept_usage, 0.0).sum())
+
+    current_score = None
+    excluded = set(kept_ids)
+    if replaced_recipe is not None:
+        excluded.add(replaced_recipe.id)
+        if replaced_recipe.id in kept_ids:
+            current_score = kept_score
+        elif replaced_recipe.id in row_of:
+            current_score = float(scores[row_of[replaced_recipe.id]])
+    for recipe_id in excluded:
+        row = row_of.get(recipe_id)
+        if row is not None:
+            scores[row] = np.inf
+
+    # Only rows scoring at or below the limit-th best need sorting; ties are
+    # settled by name, so the same draft always gets the same list.
+    rows = np.flatnonzero(np.isfinite(scores))
+    if rows.size > limit:
+        kth = np.partition(scores[rows], limit - 1)[limit - 1]
+        rows = rows[scores[rows] <= kth]
+    top = sorted(rows, key=lambda row: (scores[row], snapshot.recipes[row].name))[:limit]
+
+    replaced_profile = replaced_recipe.token_profile if replaced_recipe is not None else {}
+    alternatives = []
+    for row in top:
+        recipe = snapshot.recipes[row]
+        deltas = {}
+        for token in sorted(set(recipe.token_profile) | set(replaced_profile)):
+            delta = recipe.token_profile.get(token, Decimal(0)) - replaced_profile.get(token, Decimal(0))
+            if delta:
+                deltas[token] = delta
+        alternatives.append({"recipe": recipe, "score": float(scores[row]), "token_deltas": deltas})
+    return alternatives, current_score
@@ -1,40 +1,264 @@
 # services/token_profile.py
+import re
 from decimal import Decimal, InvalidOperation
+
+from django.db.models import Sum
+
 from ..models import MealIngredient, IngredientMeasure, IngredientNutritionToken
 
+# Bump whenever compute_token_profile's formula changes, so every persisted
+# MealTokenProfile built with the old one is treated as stale (see
+# services/token_profile.py).
+# 2: base quantities come from MealIngredient.base_quantity (fractions
+#    parsed, rounded to QUANTITY_QUANTUM).
+TOKEN_PROFILE_VERSION = 2
+
+QUANTITY_QUANTUM = Decimal("0.0001")  # MealIngredient.quantity_value/base_quantity decimal_places
+
+# MealIngredient fields base_quantity_lines reads, in this order.
+LINE_FIELDS = ("meal_id", "ingredient_id", "base_quantity", "u_quantity", "u_desc")
+
+# "1/2", "1 1/2" — optional whole part, then numerator/denominator.
+_FRACTION_RE = re.compile(r"^(?:(\d+)\s+)?(\d+)\s*/\s*(\d+)$")
+
+
 def compute_token_profile(meal, multiplier=1):
-    token_totals = {}
-    meal_ingredients = MealIngredient.objects.select_related('ingredient').filter(meal=meal)
+    profile = compute_token_profiles_bulk([meal.id])[meal.id]
     portions_multiplier = Decimal(multiplier)
+    return {name: value * portions_multiplier for name, value in profile.items()}
 
-    for meal_ingredient in meal_ingredients:
-        ingredient = meal_ingredient.ingredient
 
-        try:
-            quantity = Decimal(meal_ingredient.u_quantity) * portions_multiplier
-        except (InvalidOperation, TypeError):
-            continue
+def compute_token_profiles_bulk(meal_ids=None):
+    """Token profiles of many meals at once — {meal_id: {token name:
+    Decimal}}, unscaled (multiplier 1) — in two queries total (meal
+    ingredients' stored base_quantity, their nutrition tokens; plus one
+    measure lookup when some lines have none stored, see
+    base_quantity_lines) instead of a measure and token lookup per
+    ingredient line per meal. Per line: a
+    u_quantity that isn't a number, or a unit with no matching
+    IngredientMeasure row (base_quantity None), silently contributes
+    nothing.
 
-        unit = meal_ingredient.u_desc.strip().lower()
+    Every id in meal_ids gets an entry ({} when nothing was computable); with
+    meal_ids=None every meal that has at least one ingredient line does.
+    """
+    lines = MealIngredient.objects.all()
+    if meal_ids is not None:
+        meal_ids = list(meal_ids)
+        lines = lines.filter(meal_id__in=meal_ids)
+    lines = base_quantity_lines(lines.values_list(*LINE_FIELDS))
 
-        try:
-            measure = IngredientMeasure.objects.get(ingredient=ingredient, unit_description=unit)
-            unit_multiplier = Decimal(measure.multiplier)
-        except IngredientMeasure.DoesNotExist:
-            continue
+    ingredient_ids = {ingredient_id for _, ingredient_id, _ in lines}
+    tokens_by_ingredient = {}
+    for ingredient_id, token_name, quantity in IngredientNutritionToken.objects.filter(
+        ingredient_id__in=ingredient_ids
+    ).values_list("ingredient_id", "token__name", "quantity"):
+        tokens_by_ingredient.setdefault(ingredient_id, []).append((token_name, quantity))
+
+    return token_profiles_from_rows(lines, tokens_by_ingredient, meal_ids)
+
+
+def parse_quantity(u_quantity):
+    """A MealIngredient.u_quantity as a Decimal: plain numbers ("2", "0.5",
+    or "0,5"), fractions ("1/2") and mixed numbers ("1 1/2"). None for
+    anything else ("qb", "a gosto", "") and for a zero denominator."""
+    if u_quantity is None:
+        return None
+    text = str(u_quantity).strip().replace(",", ".")
+    match = _FRACTION_RE.match(text)
+    if match:
+        whole, numerator, denominator = match.groups()
+        if int(denominator) == 0:
+            return None
+        return Decimal(whole or 0) + Decimal(numerator) / Decimal(denominator)
+    try:
+        quantity = Decimal(text)
+    except (InvalidOperation, TypeError):
+        return None
+    return quantity if quantity.is_finite() else None
+
+
+def resolve_line_quantities(u_quantity, measure_multiplier):
+    """(quantity_value, base_quantity) of a MealIngredient line, as stored
+    on the row: u_quantity parsed (parse_quantity) and that times its unit's
+    IngredientMeasure multiplier (None when there's no measure), both
+    rounded to QUANTITY_QUANTUM."""
+    quantity = parse_quantity(u_quantity)
+    if quantity is None:
+        return None, None
+    base_quantity = None
+    if measure_multiplier is not None:
+        base_quantity = (quantity * Decimal(measure_multiplier)).quantize(QUANTITY_QUANTUM)
+    return quantity.quantize(QUANTITY_QUANTUM), base_quantity
+
+
+def line_base_quantity(ingredient_id, u_quantity, u_desc, measures):
+    """Base-unit quantity of one MealIngredient line that isn't in the
+    database (e.g. fixture data) — what would be stored as its
+    base_quantity, with the unit's multiplier looked up in measures
+    {(ingredient_id, unit_description): multiplier}. None when u_quantity
+    isn't a number or the unit has no measure."""
+    return resolve_line_quantities(u_quantity, measures.get((ingredient_id, u_desc.strip().lower())))[1]
+
+
+def base_quantity_lines(rows):
+    """[(meal_id, ingredient_id, base_quantity)] from MealIngredient rows
+    fetched as values_list(*LINE_FIELDS). Rows with no stored base_quantity
+    (loaded raw by loaddata, or whose unit has no measure) are worked out
+    here as sync_base_quantity would, with one IngredientMeasure query
+    covering all of them, and only if any has a parseable u_quantity; the
+    ones that still don't convert stay None."""
+    rows = list(rows)
+    pending = {
+        (ingredient_id, (u_desc or "").strip().lower())
+        for _, ingredient_id, base_quantity, u_quantity, u_desc in rows
+        if base_quantity is None and parse_quantity(u_quantity) is not None
+    }
+    measures = {}
+    if pending:
+        measures = {
+            (ingredient_id, unit): multiplier
+            for ingredient_id, unit, multiplier in IngredientMeasure.objects.filter(
+                ingredient_id__in={ingredient_id for ingredient_id, _ in pending},
+                unit_description__in={unit for _, unit in pending},
+            ).values_list("ingredient_id", "unit_description", "multiplier")
+        }
+    return [
+        (
+            meal_id,
+            ingredient_id,
+            base_quantity if base_quantity is not None or not pending
+            else line_base_quantity(ingredient_id, u_quantity, u_desc or "", measures),
+        )
+        for meal_id, ingredient_id, base_quantity, u_quantity, u_desc in rows
+    ]
+
+
+def sync_base_quantity(meal_ingredient, measures=None):
+    """Sets meal_ingredient's quantity_value, measure_multiplier and
+    base_quantity from its u_quantity/u_desc, without saving. The measure
+    comes from measures ({(ingredient_id, unit_description): multiplier})
+    when given, else from one IngredientMeasure query. Returns whether any
+    of the three changed."""
+    unit = (meal_ingredient.u_desc or "").strip().lower()
+    if measures is not None:
+        multiplier = measures.get((meal_ingredient.ingredient_id, unit))
+    else:
+        multiplier = IngredientMeasure.objects.filter(
+            ingredient_id=meal_ingredient.ingredient_id, unit_description=unit
+        ).values_list("multiplier", flat=True).first()
+    quantity_value, base_quantity = resolve_line_quantities(meal_ingredient.u_quantity, multiplier)
+    if quantity_value is None:
+        multiplier = None
+
+    before = (meal_ingredient.quantity_value, meal_ingredient.measure_multiplier, meal_ingredient.base_quantity)
+    meal_ingredient.quantity_value = quantity_value
+    meal_ingredient.measure_multiplier = multiplier
+    meal_ingredient.base_quantity = base_quantity
+    return before != (quantity_value, multiplier, base_quantity)
+
+
+def backfill_base_quantities(ingredient_ids=None, batch_size=1000):
+    """Re-derives the stored quantities (sync_base_quantity) of every
+    MealIngredient row, or of the rows using ingredient_ids, writing back
+    only rows that changed, batch_size at a time. For rows saved before the
+    columns existed, loaded with loaddata (raw saves skip the signal) or
+    whose measures just changed. Returns the number of rows updated."""
+    fields = ["quantity_value", "measure_multiplier", "base_quantity"]
+    lines = MealIngredient.objects.order_by("id").only("id", "ingredient_id", "u_quantity", "u_desc", *fields)
+    measure_rows = IngredientMeasure.objects.all()
+    if ingredient_ids is not None:
+        ingredient_ids = list(ingredient_ids)
+        lines = lines.filter(ingredient_id__in=ingredient_ids)
+        measure_rows = measure_rows.filter(ingredient_id__in=ingredient_ids)
+    measures = {
+        (ingredient_id, unit): multiplier
+        for ingredient_id, unit, multiplier in measure_rows.values_list(
+            "ingredient_id", "unit_description", "multiplier"
+        )
+    }
+
+    updated = 0
+    changed = []
+    for line in lines.iterator(chunk_size=batch_size):
+        if sync_base_quantity(line, measures):
+            changed.append(line)
+        if len(changed) >= batch_size:
+            MealIngredient.objects.bulk_update(changed, fields)
+            updated += len(changed)
+            changed = []
+    if changed:
+        MealIngredient.objects.bulk_update(changed, fields)
+        updated += len(changed)
+    return updated
 
-        base_quantity = quantity * unit_multiplier
 
-        tokens = IngredientNutritionToken.objects.filter(ingredient=ingredient)
-        for token in tokens:
+def token_profiles_from_rows(lines, tokens_by_ingredient, meal_ids=None):
+    """compute_token_profiles_bulk's arithmetic over already-fetched rows:
+    lines [(meal_id, ingredient_id, base_quantity)] — base_quantity None
+    for a line that contributes nothing — and tokens_by_ingredient
+    {ingredient_id: [(token name, quantity per base unit)]}. Doesn't touch
+    the database, so it also works on fixture data (see
+    services/benchmark.py, which derives base quantities with
+    line_base_quantity)."""
+    profiles = {meal_id: {} for meal_id in meal_ids} if meal_ids is not None else {}
+    for meal_id, ingredient_id, base_quantity in lines:
+        token_totals = profiles.setdefault(meal_id, {})
+        if base_quantity is None:
+            continue
+
+        for token_name, token_quantity in tokens_by_ingredient.get(ingredient_id, []):
             try:
-                scaled_token = Decimal(token.quantity) * base_quantity
+                scaled_token = Decimal(token_quantity) * base_quantity
             except (InvalidOperation, TypeError):
                 continue
 
-            token_totals[token.token.name] = token_totals.get(token.token.name, Decimal(0)) + scaled_token
-    #print(token_totals)
-    return token_totals
+            token_totals[token_name] = token_totals.get(token_name, Decimal(0)) + scaled_token
+
+    return profiles
+
+
+def ingredient_quantities_from_rows(lines, ingredient_ids=None):
+    """compute_ingredient_quantities_bulk's arithmetic over already-fetched
+    rows (lines as in token_profiles_from_rows): {meal_id: {ingredient_id:
+    Decimal base-unit quantity}}, lines for the same ingredient summed,
+    lines without a base_quantity skipped. With ingredient_ids, other
+    ingredients' lines are ignored. Meals with nothing computable get no
+    entry."""
+    if ingredient_ids is not None:
+        ingredient_ids = set(ingredient_ids)
+    quantities = {}
+    for meal_id, ingredient_id, base_quantity in lines:
+        if base_quantity is None:
+            continue
+        if ingredient_ids is not None and ingredient_id not in ingredient_ids:
+            continue
+        meal_quantities = quantities.setdefault(meal_id, {})
+        meal_quantities[ingredient_id] = meal_quantities.get(ingredient_id, Decimal(0)) + base_quantity
+    return quantities
+
+
+def compute_ingredient_quantities_bulk(ingredient_ids, meal_ids=None):
+    """compute_ingredient_quantities for many meals at once — {meal_id:
+    {ingredient_id: Decimal}} — as one SQL SUM of the stored base_quantity
+    grouped by meal and ingredient, instead of a measure lookup per line per
+    meal. Lines with no stored base_quantity are fetched separately and
+    resolved by base_quantity_lines. Every meal when meal_ids is None; meals
+    using none of ingredient_ids (or only through unconvertible lines) get
+    no entry.
+    """
+    if not ingredient_ids:
+        return {}
+    lines = MealIngredient.objects.filter(ingredient_id__in=list(ingredient_ids)).order_by()
+    if meal_ids is not None:
+        lines = lines.filter(meal_id__in=list(meal_ids))
+    totals = list(
+        lines.filter(base_quantity__isnull=False)
+        .values_list("meal_id", "ingredient_id")
+        .annotate(total=Sum("base_quantity"))
+    )
+    totals += base_quantity_lines(lines.filter(base_quantity__isnull=True).values_list(*LINE_FIELDS))
+    return ingredient_quantities_from_rows(totals)
 
 
 def compute_ingredient_quantities(meal, ingredient_ids):
@@ -45,33 +269,7 @@ def compute_ingredient_quantities(meal, ingredient_ids):
     care about a handful of "forced" ingredients per request. Same
     skip-on-missing-measure caveat as compute_token_profile: an ingredient
     whose recipe unit has no matching IngredientMeasure row contributes 0,
-    silently. Returns {ingredient_id: Decimal}.
+    silently. Returns {ingredient_id: Decimal}. For more than one meal, use
+    compute_ingredient_quantities_bulk.
     """
-    if not ingredient_ids:
-        return {}
-
-    totals = {}
-    meal_ingredients = MealIngredient.objects.select_related('ingredient').filter(
-        meal=meal, ingredient_id__in=list(ingredient_ids)
-    )
-
-    for meal_ingredient in meal_ingredients:
-        ingredient = meal_ingredient.ingredient
-
-        try:
-            quantity = Decimal(meal_ingredient.u_quantity)
-        except (InvalidOperation, TypeError):
-            continue
-
-        unit = meal_ingredient.u_desc.strip().lower()
-
-        try:
-            measure = IngredientMeasure.objects.get(ingredient=ingredient, unit_description=unit)
-            unit_multiplier = Decimal(measure.multiplier)
-        except IngredientMeasure.DoesNotExist:
-            continue
-
-        base_quantity = quantity * unit_multiplier
-        totals[ingredient.id] = totals.get(ingredient.id, Decimal(0)) + base_quantity
-
-    return totals
+    return compute_ingredient_quantities_bulk(ingredient_ids, [meal.id]).get(meal.id, {})
@@ -1,6 +1,110 @@
 from decimal import Decimal
 from collections import defaultdict
 
+from django.db import transaction
+
+from ..models import Meal, MealIngredient, MealTokenProfile, NutritionToken
+
+PROFILE_QUANTUM = Decimal("0.0001")  # MealTokenProfile.quantity's decimal_places
+
+
+def invalidate_meal_token_profiles(meal_ids):
+    """Marks the given meals' persisted profiles stale — they're rebuilt the
+    next time anyone reads them (get_meal_token_profiles) or on the next
+    rebuild_token_profiles run. Called from signals, so it's a single UPDATE
+    rather than an eager recompute on every MealIngredient save."""
+    Meal.objects.filter(id__in=list(meal_ids)).update(token_profile_version=None)
+
+
+def invalidate_token_profiles_for_ingredient(ingredient_id):
+    """Same as invalidate_meal_token_profiles, for every meal using an
+    ingredient whose measures/nutrition tokens just changed."""
+    meal_ids = MealIngredient.objects.filter(ingredient_id=ingredient_id).values_list("meal_id", flat=True)
+    Meal.objects.filter(id__in=meal_ids).update(token_profile_version=None)
+
+
+def rebuild_meal_token_profiles(meal_ids=None, only_stale=False):
+    """Recomputes (compute_token_profiles_bulk) and persists the
+    MealTokenProfile rows of the given meals, or of every meal when meal_ids
+    is None, stamping them with the current TOKEN_PROFILE_VERSION. Returns
+    {meal_id: {token name: Decimal}} for the rebuilt meals, as stored.
+
+    The meals' rows are locked (select_for_update, in id order) for the
+    whole recompute, so concurrent rebuilds of the same meal queue up
+    instead of both deleting and re-inserting its rows. With only_stale,
+    meals whose stamp turns out to be current once the lock is held (another
+    request just rebuilt them) are skipped and left out of the result."""
+    from .token_calculator import compute_token_profiles_bulk, TOKEN_PROFILE_VERSION
+
+    meals = Meal.objects.all() if meal_ids is None else Meal.objects.filter(id__in=list(meal_ids))
+    token_ids = dict(NutritionToken.objects.values_list("name", "id"))
+
+    with transaction.atomic():
+        stamps = meals.select_for_update().order_by("id").values_list("id", "token_profile_version")
+        meal_ids = [
+            meal_id for meal_id, version in stamps
+            if not only_stale or version != TOKEN_PROFILE_VERSION
+        ]
+        if not meal_ids:
+            return {}
+
+        profiles = {}
+        rows = []
+        for meal_id, computed in compute_token_profiles_bulk(meal_ids).items():
+            profile = {name: value.quantize(PROFILE_QUANTUM) for name, value in computed.items()}
+            profiles[meal_id] = profile
+            rows.extend(
+                MealTokenProfile(meal_id=meal_id, token_id=token_ids[name], quantity=value)
+                for name, value in profile.items()
+            )
+
+        MealTokenProfile.objects.filter(meal_id__in=meal_ids).delete()
+        MealTokenProfile.objects.bulk_create(rows)
+        Meal.objects.filter(id__in=meal_ids).update(token_profile_version=TOKEN_PROFILE_VERSION)
+
+    return profiles
+
+
+def get_meal_token_profiles(meal_ids=None):
+    """Token profiles of the given meals (every meal when meal_ids is None),
+    read from the persisted MealTokenProfile rows: {meal_id: {token name:
+    Decimal}}, unscaled (multiplier 1). Meals whose stamp is stale are
+    rebuilt first (rebuild_meal_token_profiles, only_stale — one another
+    request rebuilt in the meantime is read back instead), so the result
+    always matches compute_token_profile. Meals with no tokens at all map
+    to {}."""
+    from .token_calculator import TOKEN_PROFILE_VERSION
+
+    meals = Meal.objects.all() if meal_ids is None else Meal.objects.filter(id__in=list(meal_ids))
+    stamps = dict(meals.values_list("id", "token_profile_version"))
+    stale_ids = [meal_id for meal_id, version in stamps.items() if version != TOKEN_PROFILE_VERSION]
+
+    profiles = {meal_id: {} for meal_id in stamps}
+    rebuilt = {}
+    if stale_ids:
+        rebuilt = rebuild_meal_token_profiles(stale_ids, only_stale=True)
+        profiles.update(rebuilt)
+
+    rows = MealTokenProfile.objects.all()
+    if meal_ids is not None:
+        rows = rows.filter(meal_id__in=stamps.keys())
+    rows = rows.exclude(meal_id__in=rebuilt.keys()).values_list("meal_id", "token__name", "quantity")
+    for meal_id, token_name, quantity in rows:
+        profiles.setdefault(meal_id, {})[token_name] = quantity
+
+    return profiles
+
+
+def sum_token_profiles(entries):
+    """Adds up (token_profile, multiplier) pairs into one {token name:
+    Decimal} dict, scaling each profile by its multiplier."""
+    totals = defaultdict(Decimal)
+    for profile, multiplier in entries:
+        for token_name, value in profile.items():
+            totals[token_name] += value * Decimal(multiplier)
+    return dict(totals)
+
+
 def compute_menu_token_profile(meals):
     """
     Compute token totals for a list of meals. Each entry is either a Meal
@@ -8,13 +112,6 @@ def compute_menu_token_profile(meals):
     latter for menu slots whose yield was scaled up (MenuMeal.portions_multiplier)
     to cover the household, so token totals scale with it too.
     """
-    from .token_calculator import compute_token_profile  # import inside to avoid circulars
-
-    totals = defaultdict(Decimal)
-    for entry in meals:
-        meal, multiplier = entry if isinstance(entry, tuple) else (entry, 1)
-        meal_tokens = compute_token_profile(meal, multiplier=multiplier)
-        for token_name, value in meal_tokens.items():
-            totals[token_name] += value
-
-    return dict(totals)
\ No newline at end of file
+    entries = [entry if isinstance(entry, tuple) else (entry, 1) for entry in meals]
+    profiles = get_meal_token_profiles({meal.id for meal, _ in entries})
+    return sum_token_profiles((profiles[meal.id], multiplier) for meal, multiplier in entries)
@@ -0,0 +1,182 @@
+import numpy as np
+
+from .meal_plan_optimizer import _add_profile, _recipe_sizing
+
+
+def pack_profiles(profiles, names):
+    """Dense len(profiles) x len(names) float64 matrix of the given
+    {name: value} dicts, one row per profile, columns in `names` order.
+    Keys not listed in `names` are dropped (they can't affect scoring)."""
+    matrix = np.zeros((len(profiles), len(names)), dtype=np.float64)
+    column = {name: i for i, name in enumerate(names)}
+    for row, profile in enumerate(profiles):
+        for name, value in profile.items():
+            col = column.get(name)
+            if col is not None:
+                matrix[row, col] = float(value)
+    return matrix
+
+
+def _top_k_indices(scores, k, rng):
+    """Indices of the k lowest finite scores (lower is better). Ties on the
+    k-th score are broken at random, which is what shuffling the whole pool
+    before a stable sort achieves in build_menu_batches — without having to
+    shuffle or sort anything here."""
+    finite = np.flatnonzero(np.isfinite(scores))
+    if finite.size <= k:
+        return finite
+    values = scores[finite]
+    kth = np.partition(values, k - 1)[k - 1]
+    below = finite[values < kth]
+    tied = finite[values == kth]
+    picked = rng.choice(tied, size=k - below.size, replace=False)
+    return np.concatenate([below, picked])
+
+
+def _pack_recipes(recipes, rule_names, forced_keys, snapshot=None):
+    """(token matrix, forced-ingredient matrix) of `recipes`, one row each:
+    sliced from the snapshot's cached matrices when it holds all of them,
+    otherwise packed from their profiles (pack_profiles)."""
+    rows = snapshot.rows_of(recipes) if snapshot is not None else None
+    if rows is None:
+        return (
+            pack_profiles([r.token_profile for r in recipes], rule_names),
+            pack_profiles([getattr(r, "forced_ingredient_profile", {}) for r in recipes], forced_keys),
+        )
+    return snapshot.token_submatrix(rows, rule_names), snapshot.usage_matrix(forced_keys)[rows]
+
+
+def build_menu_batches_vectorized(
+    recipes,
+    rules,
+    total_slots,
+    members,
+    heat=3,
+    forbidden_ids=None,
+    locked_recipes=None,
+    forced_ingredients=None,
+    debug=False,
+    rng=None,
+    deadline=None,
+    on_pick=None,
+    pantry_bonus=None,
+    snapshot=None,
+):
+    """
+    Drop-in alternative to build_menu_batches (same params, same return
+    shape, same sizing/freeze/no-repeat rules), for large catalogs.
+
+    Instead of re-merging and re-scoring every candidate's token dict in
+    Decimal at every step, every recipe's token_profile (restricted to the
+    rule tokens) and forced_ingredient_profile are packed once into dense
+    float matrices, so a step's scores for the whole pool are one
+    vectorized expression. Already-used recipes are masked out with +inf
+    instead of rebuilding the candidate list. Scoring is the same as
+    _score_candidate + _ingredient_shortfall_penalty, just in float64, and
+    the pick is still random among the top `heat` — so plans are
+    statistically equivalent to build_menu_batches', not identical.
+
+    token_progress/ingredient_progress (debug=True) are re-summed in
+    Decimal from the picked recipes, so they match build_menu_batches'
+    exactly. rng: optional random.Random, used to seed the NumPy generator.
+    deadline: optional Deadline, handled like build_menu_batches' — once it
+    expires the remaining slots get random unused recipes, unscored.
+    on_pick: optional callable(batch, token_progress), as in
+    build_menu_batches — token_progress is then kept up to date in Decimal
+    as batches are added, instead of summed once at the end.
+    pantry_bonus: optional {recipe_id: amount}, as in build_menu_batches —
+    packed into a vector once and subtracted from every step's scores.
+    snapshot: optional CatalogSnapshot the recipes (and locked recipes) came
+    from — their rows are then sliced out of its token_matrix/usage_matrix
+    instead of packing every profile again on each call; ad-hoc recipes it
+    doesn't hold are packed as usual.
+    """
+    forbidden_ids = set(forbidden_ids) if forbidden_ids else set()
+    locked_recipes = list(locked_recipes) if locked_recipes else []
+    forced_ingredients = forced_ingredients or {}
+    rng = np.random.default_rng(rng.getrandbits(64) if rng is not None else None)
+
+    rule_names = list(rules.keys())
+    required = np.array([float(rules[name]) for name in rule_names], dtype=np.float64)
+    forced_keys = list(forced_ingredients.keys())
+    targets = np.array([float(forced_ingredients[key]) for key in forced_keys], dtype=np.float64)
+
+    token_matrix, ingredient_matrix = _pack_recipes(recipes, rule_names, forced_keys, snapshot)
+    locked_tokens, locked_ingredients = _pack_recipes(locked_recipes, rule_names, forced_keys, snapshot)
+    ids = np.array([r.id for r in recipes])
+    bonus = None
+    if pantry_bonus:
+        bonus = np.array([float(pantry_bonus.get(r.id, 0)) for r in recipes], dtype=np.float64)
+
+    batches = []
+    to_freeze = []
+    token_progress = {}
+    ingredient_progress = {}
+    token_vector = np.zeros(len(rule_names), dtype=np.float64)
+    ingredient_vector = np.zeros(len(forced_keys), dtype=np.float64)
+    slots_filled = 0
+
+    for i, r in enumerate(locked_recipes):
+        forbidden_ids.add(r.id)
+        multiplier, occasions, frozen = _recipe_sizing(r.serves, members)
+        token_vector += locked_tokens[i]
+        ingredient_vector += locked_ingredients[i]
+        if frozen:
+            to_freeze.append({"recipe": r, "portions": frozen})
+        batches.append({"recipe": r, "occasions": 1, "multiplier": multiplier})
+        slots_filled += 1
+        if on_pick is not None:
+            _add_profile(token_progress, r.token_profile)
+            on_pick(batches[-1], token_progress)
+
+    remaining_needed = total_slots - slots_filled
+    if remaining_needed < 0:
+        raise ValueError(
+            f"total_slots ({total_slots}) is smaller than the number of locked recipes ({len(locked_recipes)})."
+        )
+
+    forbidden = np.isin(ids, list(forbidden_ids)) if len(ids) else np.zeros(0, dtype=bool)
+
+    while slots_filled < total_slots:
+        if forbidden.all():
+            # Out of distinct recipes — stop here rather than repeating one.
+            break
+
+        if deadline is not None and deadline.expired():
+            deadline.cut("build")
+            row = int(rng.choice(np.flatnonzero(~forbidden)))
+        else:
+            expected = required * ((slots_filled + 1) / total_slots)
+            scores = np.maximum(expected - token_vector - token_matrix, 0.0).sum(axis=1)
+            if forced_keys:
+                scores += np.maximum(targets - ingredient_vector - ingredient_matrix, 0.0).sum(axis=1)
+            if bonus is not None:
+                scores -= bonus
+            scores[forbidden] = np.inf
+
+            top_n = _top_k_indices(scores, heat, rng)
+            row = int(rng.choice(top_n))
+        selected = recipes[row]
+
+        multiplier, natural_occasions, frozen = _recipe_sizing(selected.serves, members)
+        occasions = min(natural_occasions, total_slots - slots_filled)
+        if frozen and occasions == natural_occasions:
+            to_freeze.append({"recipe": selected, "portions": frozen})
+
+        batches.append({"recipe": selected, "occasions": occasions, "multiplier": multiplier})
+        token_vector += token_matrix[row]
+        ingredient_vector += ingredient_matrix[row]
+        forbidden |= ids == selected.id
+        slots_filled += occasions
+        if on_pick is not None:
+            _add_profile(token_progress, selected.token_profile)
+            on_pick(batches[-1], token_progress)
+
+    if debug:
+        for batch in batches:
+            recipe = batch["recipe"]
+            if on_pick is None:
+                _add_profile(token_progress, recipe.token_profile)
+            _add_profile(ingredient_progress, getattr(recipe, "forced_ingredient_profile", {}))
+        return batches, to_freeze, token_progress, ingredient_progress
+    return batches, to_freeze
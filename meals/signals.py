@@ -1,6 +1,23 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.db.models import QuerySet
 from django.dispatch import receiver
-from .models import Ingredient, Household, HouseholdIngredient
+from .models import (
+    Ingredient,
+    Household,
+    HouseholdIngredient,
+    Meal,
+    MealIngredient,
+    IngredientMeasure,
+    IngredientNutritionToken,
+    Menu,
+    MenuMeal,
+    NutritionToken,
+    Tag,
+)
+from .services.catalog import bump_catalog_version
+from .services.shopping_list import apply_menu_meal_change, mark_shopping_lists_stale
+from .services.token_calculator import backfill_base_quantities, resolve_line_quantities, sync_base_quantity
+from .services.token_profile import invalidate_meal_token_profiles, invalidate_token_profiles_for_ingredient
 
 
 @receiver(post_save, sender=Ingredient)
@@ -25,3 +42,98 @@ def create_ingredients_for_new_household(sender, instance, created, **kwargs):
                 ingredient=ing,
                 defaults={"status": 0}
             )
+
+
+@receiver(pre_save, sender=MealIngredient)
+def sync_meal_ingredient_base_quantity(sender, instance, raw=False, **kwargs):
+    if raw:
+        # loaddata: measures may not be loaded yet, so only the parse, which
+        # needs no query. Readers resolve base_quantity themselves when it's
+        # missing (base_quantity_lines).
+        instance.quantity_value = resolve_line_quantities(instance.u_quantity, None)[0]
+        return
+    sync_base_quantity(instance)
+
+
+@receiver(post_save, sender=IngredientMeasure)
+@receiver(post_delete, sender=IngredientMeasure)
+def resync_base_quantities_for_measure(sender, instance, raw=False, **kwargs):
+    if not raw:
+        backfill_base_quantities([instance.ingredient_id])
+
+
+@receiver(post_save, sender=MealIngredient)
+@receiver(post_delete, sender=MealIngredient)
+def invalidate_token_profile_for_meal_ingredient(sender, instance, **kwargs):
+    invalidate_meal_token_profiles([instance.meal_id])
+    mark_shopping_lists_stale(meal_id=instance.meal_id)
+
+
+def _slot_contribution(state, portions_multiplier):
+    """(multiplier, slots) a MenuMeal adds to its menu's shopping list."""
+    return (portions_multiplier, 1) if state == "planned" else (0, 0)
+
+
+@receiver(pre_save, sender=MenuMeal)
+def remember_menu_meal_before_save(sender, instance, raw=False, **kwargs):
+    instance._shopping_before = None
+    if instance.pk is not None and not raw:
+        instance._shopping_before = MenuMeal.objects.filter(pk=instance.pk).values_list(
+            "menu_id", "meal_id", "state", "portions_multiplier"
+        ).first()
+
+
+@receiver(post_save, sender=MenuMeal)
+def update_shopping_list_on_menu_meal_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        mark_shopping_lists_stale([instance.menu_id])
+        return
+    multiplier, slots = _slot_contribution(instance.state, instance.portions_multiplier)
+    before = getattr(instance, "_shopping_before", None)
+    if before is None:
+        apply_menu_meal_change(instance.menu_id, instance.meal_id, multiplier, slots)
+        return
+    menu_id, meal_id, state, portions_multiplier = before
+    old_multiplier, old_slots = _slot_contribution(state, portions_multiplier)
+    if (menu_id, meal_id) == (instance.menu_id, instance.meal_id):
+        apply_menu_meal_change(menu_id, meal_id, multiplier - old_multiplier, slots - old_slots)
+    else:
+        apply_menu_meal_change(menu_id, meal_id, -old_multiplier, -old_slots)
+        apply_menu_meal_change(instance.menu_id, instance.meal_id, multiplier, slots)
+
+
+@receiver(post_delete, sender=MenuMeal)
+def update_shopping_list_on_menu_meal_delete(sender, instance, origin=None, **kwargs):
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Menu:
+        # The whole menu is going, shopping lines included.
+        return
+    if origin_model is not MenuMeal:
+        # Cascading from a Meal: its MealIngredient rows may already be gone,
+        # so the lines to subtract can't be known — rebuild instead.
+        mark_shopping_lists_stale([instance.menu_id])
+        return
+    multiplier, slots = _slot_contribution(instance.state, instance.portions_multiplier)
+    apply_menu_meal_change(instance.menu_id, instance.meal_id, -multiplier, -slots)
+
+
+@receiver(post_save, sender=IngredientMeasure)
+@receiver(post_delete, sender=IngredientMeasure)
+@receiver(post_save, sender=IngredientNutritionToken)
+@receiver(post_delete, sender=IngredientNutritionToken)
+def invalidate_token_profiles_for_ingredient_change(sender, instance, **kwargs):
+    invalidate_token_profiles_for_ingredient(instance.ingredient_id)
+
+
+# Anything a CatalogSnapshot is built from (see services/catalog.py).
+CATALOG_MODELS = (Meal, MealIngredient, IngredientMeasure, IngredientNutritionToken, NutritionToken, Tag)
+
+
+def bump_catalog_version_on_change(sender, **kwargs):
+    bump_catalog_version()
+
+
+for catalog_model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version_on_change, sender=catalog_model)
+    post_delete.connect(bump_catalog_version_on_change, sender=catalog_model)
+m2m_changed.connect(bump_catalog_version_on_change, sender=Meal.tags.through)
@@ -1,27 +1,78 @@
+import json
+import os
+import random
+import threading
+import time
 from collections import Counter
 from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase
+from rest_framework.test import APIRequestFactory
 
 from meals.services.meal_plan_optimizer import (
+    Deadline,
+    RecipeAdapter,
+    TokenAccumulator,
+    _top_k_scored,
     optimize_meal_plan,
     build_menu_batches,
+    build_menu_batches_alternatives,
+    build_menu_batches_best_of,
+    plan_shortfall,
+    refine_menu_batches,
     schedule_batches,
 )
-
-
-class FakeMeal:
-    def __init__(self, serves):
-        self.serves = serves
+from meals.services.vectorized_optimizer import build_menu_batches_vectorized
+from meals.services.exact_optimizer import MAX_EXACT_SLOTS, solve_menu_batches_exact
+from meals.services.token_profile import get_meal_token_profiles, rebuild_meal_token_profiles
+from meals.services.token_calculator import (
+    compute_ingredient_quantities,
+    compute_ingredient_quantities_bulk,
+    compute_token_profiles_bulk,
+    parse_quantity,
+)
+from meals.services.benchmark import CatalogDistribution, run_benchmarks
+from meals.services.catalog import CatalogSnapshot, clear_catalog_snapshot, get_catalog_snapshot
+from meals.services.slot_reoptimizer import rank_slot_alternatives
+from meals.services.plan_cache import PlanCache, plan_cache
+from meals.services.shopping_list import compute_menu_ingredients, menu_shopping_list, rebuild_menu_shopping_lines
+from meals.management.commands import pregenerate_menus
+from meals.views import (
+    GenerateMenuView,
+    OptimizeMenuPreviewStreamView,
+    OptimizeMenuPreviewView,
+    ReoptimizeSlotView,
+    _run_menu_optimizer,
+)
+from meals.models import (
+    Household,
+    HouseholdIngredient,
+    Ingredient,
+    IngredientMeasure,
+    IngredientNutritionToken,
+    Meal,
+    MealIngredient,
+    MealTokenProfile,
+    Menu,
+    MenuMeal,
+    NutritionToken,
+    Tag,
+)
 
 
 class FakeRecipe:
     def __init__(self, id, name, token_profile=None, serves=2, forced_ingredient_profile=None):
         self.id = id
         self.name = name
+        self.serves = serves
         self.token_profile = token_profile or {}
         self.forced_ingredient_profile = forced_ingredient_profile or {}
-        self._meal = FakeMeal(serves)
 
 
 def make_recipes(n, token_profile=None, serves=2):
@@ -232,6 +283,601 @@ class BuildMenuBatchesTests(TestCase):
         self.assertEqual(ingredient_progress[7], Decimal(300))
 
 
+class TopKScoredTests(TestCase):
+    def test_returns_the_k_lowest_scores(self):
+        scored = [(i, score) for i, score in enumerate([5, 1, 4, 2, 3])]
+        top = _top_k_scored(scored, 2, random.Random(0))
+        self.assertEqual(sorted(score for _, score in top), [1, 2])
+
+    def test_breaks_ties_on_the_kth_score_at_random(self):
+        scored = [(i, 0 if i == 0 else 1) for i in range(10)]
+        picked = set()
+        for seed in range(20):
+            top = _top_k_scored(scored, 2, random.Random(seed))
+            self.assertIn((0, 0), top)
+            picked.update(i for i, _ in top if i != 0)
+        self.assertGreater(len(picked), 1)
+
+    def test_small_pool_is_returned_whole(self):
+        scored = [(1, 3), (2, 1)]
+        self.assertCountEqual(_top_k_scored(scored, 3, random.Random(0)), scored)
+
+
+class TokenAccumulatorTests(TestCase):
+    def test_scores_without_adding_and_adds_in_place(self):
+        tokens = TokenAccumulator(["vegetables", "fish"])
+        candidate = tokens.pack({"vegetables": Decimal(3), "dairy": Decimal(9)})
+        self.assertEqual(candidate, (tokens.convert(3), 0))
+
+        targets = [tokens.convert(5), tokens.convert(2)]
+        self.assertEqual(tokens.shortfall_if_added(candidate, targets), tokens.convert(2 + 2))
+        self.assertEqual(tokens.totals, [0, 0])
+
+        tokens.add(candidate)
+        self.assertEqual(tokens.totals, [tokens.convert(3), 0])
+        self.assertEqual(tokens.shortfall_if_added(candidate, targets), tokens.convert(2))
+
+    def test_units_make_prorated_targets_whole(self):
+        tokens = TokenAccumulator(["vegetables"], numeric="fixed", steps=3)
+        self.assertEqual(tokens.convert(Decimal(1) / Decimal(3) * 10) * 3, tokens.convert(10))
+
+
+class NumericBackendParityTests(TestCase):
+    def make_catalog(self):
+        rng = random.Random(4)
+        recipes = []
+        for i in range(60):
+            tokens = rng.sample(["vegetables", "fish", "legumes", "dairy"], 2)
+            recipes.append(FakeRecipe(
+                i, f"recipe-{i}",
+                {token: Decimal(rng.randint(0, 40)) / 10 for token in tokens},
+                serves=rng.choice([1, 2, 4, 8]),
+                forced_ingredient_profile={7: Decimal(rng.randint(0, 3000)) / 10} if i % 5 == 0 else {},
+            ))
+        return recipes
+
+    def test_plans_and_totals_match_the_decimal_path(self):
+        recipes = self.make_catalog()
+        rules = {"vegetables": 20, "fish": 6, "legumes": 8}
+        for seed in range(5):
+            results = {
+                numeric: build_menu_batches(
+                    recipes, rules, total_slots=14, members=2,
+                    forced_ingredients={7: Decimal(500)}, debug=True,
+                    rng=random.Random(seed), numeric=numeric,
+                )
+                for numeric in ("decimal", "float", "fixed")
+            }
+            batches, _, token_progress, ingredient_progress = results["decimal"]
+            for numeric in ("float", "fixed"):
+                other_batches, _, other_tokens, other_ingredients = results[numeric]
+                self.assertEqual(
+                    [(b["recipe"].id, b["occasions"]) for b in other_batches],
+                    [(b["recipe"].id, b["occasions"]) for b in batches],
+                )
+                self.assertEqual(other_tokens, token_progress)
+                self.assertEqual(other_ingredients, ingredient_progress)
+
+    def test_optimize_meal_plan_matches_too(self):
+        recipes = self.make_catalog()
+        rules = {"vegetables": 12, "dairy": 4}
+        plans = [
+            [r.id for r in optimize_meal_plan(recipes, rules, total_meals=8, rng=random.Random(2), numeric=numeric)]
+            for numeric in ("decimal", "float", "fixed")
+        ]
+        self.assertEqual(plans[0], plans[1])
+        self.assertEqual(plans[0], plans[2])
+
+
+@skipUnless(os.environ.get("PLATE_O_BENCHMARKS"), "set PLATE_O_BENCHMARKS=1 to run benchmarks")
+class TopKSelectionBenchmark(SimpleTestCase):
+    """Per-step selection cost: the old shuffle + full sort against
+    _top_k_scored, over pre-scored pools of catalog-like sizes."""
+
+    def test_top_k_beats_shuffle_and_sort(self):
+        rng = random.Random(0)
+        for size in (1000, 10000, 50000):
+            scored = [(i, Decimal(rng.randint(0, 200)) / 10) for i in range(size)]
+
+            started = time.perf_counter()
+            for _ in range(20):
+                pool = list(scored)
+                rng.shuffle(pool)
+                pool.sort(key=lambda x: x[1])
+                rng.choice(pool[:3])
+            sort_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(20):
+                rng.choice(_top_k_scored(scored, 3, rng))
+            top_k_seconds = time.perf_counter() - started
+
+            self.assertLess(
+                top_k_seconds, sort_seconds,
+                f"{size} recipes: shuffle+sort {sort_seconds * 50:.2f} ms/step, top-k {top_k_seconds * 50:.2f} ms/step",
+            )
+
+
+FIXTURE_PATH = os.path.join(settings.BASE_DIR, "data.json")
+
+
+class SyntheticCatalogTests(SimpleTestCase):
+    def test_catalog_is_sampled_from_the_fixture_and_seeded(self):
+        distribution = CatalogDistribution.from_fixture(FIXTURE_PATH)
+        catalog = distribution.synthetic_catalog(200, seed=4)
+        self.assertEqual(len(catalog), 200)
+        self.assertEqual(len({r.id for r in catalog}), 200)
+        known_tokens = set(distribution.mean_token_amounts())
+        self.assertTrue(all(r.token_profile and set(r.token_profile) <= known_tokens for r in catalog))
+        again = distribution.synthetic_catalog(200, seed=4)
+        self.assertEqual([r.token_profile for r in catalog], [r.token_profile for r in again])
+
+
+@skipUnless(os.environ.get("PLATE_O_BENCHMARKS"), "set PLATE_O_BENCHMARKS=1 to run benchmarks")
+class OptimizerBenchmarkSuite(SimpleTestCase):
+    """run_benchmarks at test-friendly sizes; set PLATE_O_BENCHMARK_OUTPUT
+    to a path to keep the JSON report (the benchmark_optimizer command runs
+    the full grid)."""
+
+    def test_report_covers_every_function_and_scenario(self):
+        report = run_benchmarks(CatalogDistribution.from_fixture(FIXTURE_PATH), (100, 1000), repeat=2)
+        output = os.environ.get("PLATE_O_BENCHMARK_OUTPUT")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        functions = Counter(result["function"] for result in report["results"])
+        # 2 sizes x 2 meal sets x 2 locked counts x 2 forced counts, with
+        # optimize_meal_plan skipping the forced half.
+        self.assertEqual(functions, {"build_menu_batches": 16, "schedule_batches": 16, "optimize_meal_plan": 8})
+        for result in report["results"]:
+            self.assertLessEqual(result["latency_ms"]["min"], result["latency_ms"]["max"])
+            self.assertEqual(result["quality"].get("unfilled_slots", 0), 0)
+
+
+class BuildMenuBatchesVectorizedTests(TestCase):
+    def test_total_occasions_sum_to_total_slots_without_repeats(self):
+        recipes = make_recipes(10, serves=2)
+        batches, _ = build_menu_batches_vectorized(recipes, rules={}, total_slots=10, members=2)
+        self.assertEqual(sum(b["occasions"] for b in batches), 10)
+        ids = [b["recipe"].id for b in batches]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_sizing_matches_build_menu_batches(self):
+        recipes = [FakeRecipe(1, "Feijoada", serves=10)]
+        batches, to_freeze = build_menu_batches_vectorized(recipes, rules={}, total_slots=3, members=2)
+        self.assertEqual(batches[0]["occasions"], 3)
+        self.assertEqual(to_freeze[0]["portions"], 4)
+
+    def test_fills_what_it_can_when_not_enough_capacity(self):
+        recipes = make_recipes(2, serves=2)
+        batches, _ = build_menu_batches_vectorized(recipes, rules={}, total_slots=5, members=2)
+        self.assertEqual(sum(b["occasions"] for b in batches), 2)
+
+    def test_prefers_recipes_that_satisfy_rules(self):
+        recipes = make_recipes(5, token_profile={"vegetables": Decimal(0)})
+        recipes[3].token_profile = {"vegetables": Decimal(100)}
+        batches, _ = build_menu_batches_vectorized(
+            recipes, rules={"vegetables": 10}, total_slots=1, members=2, heat=1
+        )
+        self.assertEqual(batches[0]["recipe"].id, recipes[3].id)
+
+    def test_forced_ingredient_is_greedily_preferred(self):
+        recipes = make_recipes(5, serves=2)
+        recipes[3].forced_ingredient_profile = {7: Decimal(1000)}
+        batches, _, _token_progress, ingredient_progress = build_menu_batches_vectorized(
+            recipes,
+            rules={},
+            total_slots=2,
+            members=2,
+            heat=1,
+            forced_ingredients={7: Decimal(500)},
+            debug=True,
+        )
+        self.assertEqual(batches[0]["recipe"].id, recipes[3].id)
+        self.assertEqual(ingredient_progress[7], Decimal(1000))
+
+    def test_locked_recipe_is_sized_and_excluded_from_fresh_batches(self):
+        locked = FakeRecipe(99, "Locked Soup", serves=1)
+        fresh = make_recipes(3, serves=2)
+        batches, _ = build_menu_batches_vectorized(
+            fresh, rules={}, total_slots=4, members=4, locked_recipes=[locked]
+        )
+        self.assertEqual(batches[0]["recipe"].id, locked.id)
+        self.assertEqual(batches[0]["multiplier"], 4)
+        ids = [b["recipe"].id for b in batches]
+        self.assertEqual(ids.count(locked.id), 1)
+
+    def test_snapshot_rows_are_sliced_not_repacked(self):
+        recipes = [
+            RecipeAdapter(i, f"Prato {i}", 2, token_profile={"vegetables": Decimal(i), "fish": Decimal(10 - i)})
+            for i in range(1, 10)
+        ]
+        snapshot = CatalogSnapshot(0, recipes, {}, {}, {3: {7: Decimal(400)}, 5: {7: Decimal(200)}}, {})
+        kwargs = dict(
+            recipes=snapshot.recipe_adapters([7]), rules={"vegetables": 12, "fish": 5}, total_slots=4, members=2,
+            locked_recipes=[snapshot.recipes_by_id[9]], forced_ingredients={7: Decimal(500)}, debug=True,
+        )
+        packed = build_menu_batches_vectorized(rng=random.Random(3), **kwargs)
+        with patch("meals.services.vectorized_optimizer.pack_profiles") as pack_profiles:
+            sliced = build_menu_batches_vectorized(rng=random.Random(3), snapshot=snapshot, **kwargs)
+        pack_profiles.assert_not_called()
+        self.assertEqual(
+            [(b["recipe"].id, b["occasions"]) for b in sliced[0]], [(b["recipe"].id, b["occasions"]) for b in packed[0]]
+        )
+        self.assertEqual(sliced[3], packed[3])
+
+    def test_tied_scores_are_not_always_picked_in_recipe_order(self):
+        recipes = make_recipes(20)
+        first_ids = {
+            build_menu_batches_vectorized(recipes, rules={}, total_slots=1, members=2)[0][0]["recipe"].id
+            for _ in range(30)
+        }
+        self.assertGreater(len(first_ids), 1)
+
+
+class BuildMenuBatchesBestOfTests(TestCase):
+    def test_plan_shortfall_sums_unmet_targets(self):
+        shortfall = plan_shortfall(
+            {"vegetables": Decimal(6)}, {7: Decimal(100)},
+            rules={"vegetables": 10, "fish": 2}, forced_ingredients={7: Decimal(300)},
+        )
+        self.assertEqual(shortfall, Decimal(4 + 2 + 200))
+
+    def test_keeps_the_lowest_shortfall_pass(self):
+        # Only one recipe carries the token; with heat high enough to pick
+        # at random, enough restarts will find a plan that includes it.
+        recipes = make_recipes(10, token_profile={"vegetables": Decimal(0)})
+        recipes[4].token_profile = {"vegetables": Decimal(10)}
+        (batches, _, token_progress, _), score, stats = build_menu_batches_best_of(
+            build_menu_batches, 32, rng=random.Random(1),
+            recipes=recipes, rules={"vegetables": 10}, total_slots=2, members=2, heat=10,
+        )
+        self.assertEqual(score, Decimal(0))
+        self.assertIn(recipes[4].id, [b["recipe"].id for b in batches])
+        self.assertEqual(stats, {"restarts": 32, "restarts_completed": 32})
+
+    def test_same_seed_gives_same_plan(self):
+        recipes = make_recipes(20)
+        plans = [
+            [
+                b["recipe"].id
+                for b in build_menu_batches_best_of(
+                    build_menu_batches_vectorized, 4, rng=random.Random(7),
+                    recipes=recipes, rules={}, total_slots=5, members=2,
+                )[0][0]
+            ]
+            for _ in range(2)
+        ]
+        self.assertEqual(plans[0], plans[1])
+
+    def test_spent_budget_still_returns_first_pass(self):
+        recipes = make_recipes(5)
+        (batches, _, _, _), _, stats = build_menu_batches_best_of(
+            build_menu_batches, 4, deadline=Deadline(1e-6), max_workers=1,
+            recipes=recipes, rules={}, total_slots=3, members=2,
+        )
+        self.assertEqual(sum(b["occasions"] for b in batches), 3)
+        self.assertEqual(stats["restarts_completed"], 1)
+
+
+class DeadlineTests(TestCase):
+    def test_expired_deadline_still_fills_every_slot(self):
+        recipes = make_recipes(30)
+        for build in (build_menu_batches, build_menu_batches_vectorized):
+            deadline = Deadline(1e-6)
+            time.sleep(0.001)
+            batches, _ = build(recipes, {"veggies": Decimal(10)}, 10, 2, rng=random.Random(1), deadline=deadline)
+            ids = [b["recipe"].id for b in batches]
+            self.assertEqual(sum(b["occasions"] for b in batches), 10)
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertEqual(deadline.cut_short, {"build"})
+
+    def test_no_deadline_never_expires(self):
+        deadline = Deadline()
+        self.assertFalse(deadline.expired())
+        self.assertIsNone(deadline.remaining_ms())
+
+    def test_run_menu_optimizer_reports_cut_short_and_skips_cache(self):
+        plan_cache.clear()
+        options = dict(restarts=4, refine_iterations=50, deadline_ms=1e-6, seed=5, catalog_version=1)
+        slots, assigned, _, _, unfilled, _, stats = _run_menu_optimizer(
+            5, [1, 2], {}, 2, recipes=make_recipes(40), **options
+        )
+        self.assertEqual(len(assigned), len(slots))
+        self.assertEqual(unfilled, [])
+        self.assertIn("build", stats["cut_short"])
+        self.assertEqual(stats["deadline_ms"], 1e-6)
+        self.assertEqual(stats["restarts_completed"], 1)
+        *_, replay_stats = _run_menu_optimizer(5, [1, 2], {}, 2, recipes=make_recipes(40), **options)
+        self.assertFalse(replay_stats["cached"])
+
+    def test_uncut_run_reports_empty_cut_short(self):
+        plan_cache.clear()
+        *_, stats = _run_menu_optimizer(5, [1, 2], {}, 2, recipes=make_recipes(40), seed=5)
+        self.assertEqual(stats["cut_short"], [])
+        self.assertIsNone(stats["deadline_ms"])
+
+
+class ProgressEventTests(TestCase):
+    def test_on_pick_reports_every_batch_with_running_totals(self):
+        recipes = make_recipes(10, token_profile={"veggies": Decimal(1)})
+        for build in (build_menu_batches, build_menu_batches_vectorized):
+            seen = []
+            batches, _ = build(
+                recipes, {"veggies": Decimal(5)}, 5, 2, rng=random.Random(2),
+                on_pick=lambda batch, totals: seen.append((batch, dict(totals))),
+            )
+            self.assertEqual([batch for batch, _ in seen], batches)
+            self.assertEqual([totals["veggies"] for _, totals in seen], [Decimal(i) for i in range(1, 6)])
+
+    def test_run_menu_optimizer_emits_stage_events_and_can_be_aborted(self):
+        plan_cache.clear()
+        events = []
+        _run_menu_optimizer(
+            3, [1], {}, 2, recipes=make_recipes(10), restarts=2, refine_iterations=5, seed=1,
+            on_event=lambda name, payload: events.append((name, payload)),
+        )
+        names = [name for name, _ in events]
+        self.assertEqual(names.count("batch"), 6)
+        self.assertEqual(names[-3:], ["built", "refined", "scheduled"])
+        self.assertEqual({payload["pass"] for name, payload in events if name == "batch"}, {0, 1})
+
+        def abort(name, payload):
+            raise RuntimeError("client went away")
+
+        with self.assertRaises(RuntimeError):
+            _run_menu_optimizer(3, [1], {}, 2, recipes=make_recipes(10), on_event=abort)
+
+
+class BuildMenuBatchesAlternativesTests(TestCase):
+    def test_returns_diverse_distinct_plans(self):
+        recipes = make_recipes(40)
+        locked = FakeRecipe(99, "Locked")
+        plans, stats = build_menu_batches_alternatives(
+            build_menu_batches, 3, min_distance=0.5, rng=random.Random(2),
+            recipes=recipes, rules={}, total_slots=5, members=2, locked_recipes=[locked],
+        )
+        self.assertEqual(len(plans), 3)
+        self.assertEqual(stats, {"attempts": 12, "attempts_completed": 12})
+        id_sets = [{b["recipe"].id for b in result[0]} - {99} for result, _, _ in plans]
+        for i, ids in enumerate(id_sets):
+            for other in id_sets[:i]:
+                self.assertGreaterEqual(1 - len(ids & other) / len(ids | other), 0.5)
+        self.assertIsNone(plans[0][2])
+        self.assertGreaterEqual(plans[1][2], 0.5)
+
+    def test_relaxes_diversity_rather_than_returning_too_few(self):
+        # Only 4 recipes for 3 slots: plans overlap a lot but can still differ.
+        recipes = make_recipes(4)
+        plans, _ = build_menu_batches_alternatives(
+            build_menu_batches, 2, min_distance=0.9, attempts=20, rng=random.Random(1),
+            recipes=recipes, rules={}, total_slots=3, members=2,
+        )
+        id_sets = [frozenset(b["recipe"].id for b in result[0]) for result, _, _ in plans]
+        self.assertEqual(len(id_sets), 2)
+        self.assertNotEqual(id_sets[0], id_sets[1])
+
+
+class RefineMenuBatchesTests(TestCase):
+    def test_swaps_in_recipe_that_closes_the_gap(self):
+        recipes = make_recipes(6, token_profile={"vegetables": Decimal(0)})
+        recipes[5].token_profile = {"vegetables": Decimal(10)}
+        batches = [
+            {"recipe": recipes[0], "occasions": 1, "multiplier": 1},
+            {"recipe": recipes[1], "occasions": 1, "multiplier": 1},
+        ]
+        refined, _, token_progress, _, stats = refine_menu_batches(
+            batches, recipes, rules={"vegetables": 10}, members=2, iterations=500, rng=random.Random(3)
+        )
+        self.assertIn(recipes[5].id, [b["recipe"].id for b in refined])
+        self.assertEqual(token_progress["vegetables"], Decimal(10))
+        self.assertEqual(stats["refine_improvements"], 1)
+
+    def test_keeps_locked_recipes_slot_counts_and_no_repeats(self):
+        recipes = make_recipes(8, token_profile={"vegetables": Decimal(1)}, serves=2)
+        recipes[6].token_profile = {"vegetables": Decimal(5)}
+        recipes[7] = FakeRecipe(7, "Big", {"vegetables": Decimal(50)}, serves=6)  # covers 3 occasions
+        locked = FakeRecipe(99, "Locked", serves=2)
+        batches = [{"recipe": locked, "occasions": 1, "multiplier": 1}] + [
+            {"recipe": recipes[i], "occasions": 1, "multiplier": 1} for i in range(3)
+        ]
+        refined, _, _, _, _ = refine_menu_batches(
+            batches, recipes, rules={"vegetables": 100}, members=2,
+            locked_recipes=[locked], iterations=500, rng=random.Random(5),
+        )
+        ids = [b["recipe"].id for b in refined]
+        self.assertEqual(ids[0], locked.id)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sum(b["occasions"] for b in refined), 4)
+        self.assertNotIn(7, ids)  # would change the slot count
+        self.assertIn(6, ids)
+
+    def test_stops_immediately_when_nothing_is_short(self):
+        recipes = make_recipes(4, token_profile={"vegetables": Decimal(5)})
+        batches = [{"recipe": recipes[0], "occasions": 1, "multiplier": 1}]
+        _, _, _, _, stats = refine_menu_batches(batches, recipes, rules={"vegetables": 5}, members=2)
+        self.assertEqual(stats["refine_iterations"], 0)
+
+
+class SolveMenuBatchesExactTests(TestCase):
+    def make_trap(self):
+        # Greedy takes the balanced recipe first and can then only close one
+        # of the two gaps; the two specialists together close both.
+        return [
+            FakeRecipe(1, "Balanced", {"vegetables": Decimal(6), "fish": Decimal(6)}),
+            FakeRecipe(2, "Veg", {"vegetables": Decimal(10)}),
+            FakeRecipe(3, "Fish", {"fish": Decimal(10)}),
+        ]
+
+    def test_beats_the_greedy_plan(self):
+        rules = {"vegetables": 10, "fish": 10}
+        _, _, greedy_tokens, _ = build_menu_batches(
+            self.make_trap(), rules, total_slots=2, members=2, heat=1, debug=True
+        )
+        self.assertGreater(plan_shortfall(greedy_tokens, {}, rules), 0)
+
+        (batches, _, token_progress, _), stats = solve_menu_batches_exact(
+            self.make_trap(), rules, total_slots=2, members=2
+        )
+        self.assertEqual(sorted(b["recipe"].id for b in batches), [2, 3])
+        self.assertEqual(plan_shortfall(token_progress, {}, rules), 0)
+        self.assertTrue(stats["proven_optimal"])
+
+    def test_biggest_batch_goes_last_and_is_cut_short(self):
+        recipes = [
+            FakeRecipe(1, "Small", {"vegetables": Decimal(5)}, serves=2),
+            FakeRecipe(2, "Big", {"vegetables": Decimal(5)}, serves=6),
+        ]
+        (batches, to_freeze, _, _), _ = solve_menu_batches_exact(
+            recipes, {"vegetables": 10}, total_slots=2, members=2
+        )
+        self.assertEqual([b["recipe"].id for b in batches], [1, 2])
+        self.assertEqual([b["occasions"] for b in batches], [1, 1])
+        self.assertEqual(to_freeze, [])
+
+    def test_keeps_locked_recipes_first(self):
+        locked = FakeRecipe(99, "Locked", {"vegetables": Decimal(10)})
+        (batches, _, token_progress, _), _ = solve_menu_batches_exact(
+            self.make_trap() + [locked], {"vegetables": 10, "fish": 10}, total_slots=2, members=2,
+            locked_recipes=[locked],
+        )
+        self.assertEqual([b["recipe"].id for b in batches], [99, 3])
+        self.assertEqual(token_progress, {"vegetables": Decimal(10), "fish": Decimal(10)})
+
+    def test_node_limit_keeps_best_so_far_unproven(self):
+        (batches, _, _, _), stats = solve_menu_batches_exact(
+            self.make_trap(), {"vegetables": 10, "fish": 10}, total_slots=2, members=2, node_limit=1
+        )
+        self.assertEqual(sum(b["occasions"] for b in batches), 2)
+        self.assertFalse(stats["proven_optimal"])
+        self.assertEqual(stats["nodes"], 1)
+
+    def test_falls_back_to_greedy_for_big_menus(self):
+        recipes = make_recipes(MAX_EXACT_SLOTS + 5)
+        (batches, _, _, _), stats = solve_menu_batches_exact(
+            recipes, {}, total_slots=MAX_EXACT_SLOTS + 1, members=2
+        )
+        self.assertTrue(stats["fallback"])
+        self.assertEqual(sum(b["occasions"] for b in batches), MAX_EXACT_SLOTS + 1)
+
+    def test_fallback_is_deterministic_per_seed(self):
+        # Identical profiles: every greedy pick is a tie.
+        recipes = make_recipes(MAX_EXACT_SLOTS + 20)
+
+        def picks(**kwargs):
+            (batches, _, _, _), _ = solve_menu_batches_exact(
+                recipes, {}, total_slots=MAX_EXACT_SLOTS + 1, members=2, **kwargs
+            )
+            return [b["recipe"].id for b in batches]
+
+        self.assertEqual(picks(), picks())
+        self.assertEqual(picks(rng=random.Random(7)), picks(rng=random.Random(7)))
+
+
+class SeededRunMenuOptimizerTests(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+    def tearDown(self):
+        plan_cache.clear()
+
+    def plan(self, **kwargs):
+        slots, assigned, _, _, _, _, stats = _run_menu_optimizer(
+            5, [1, 2], {}, 2, recipes=make_recipes(40), **kwargs
+        )
+        return [assigned[slot]["recipe"].id for slot in slots], stats
+
+    def test_same_seed_gives_same_plan(self):
+        first, stats = self.plan(seed=11, restarts=3, refine_iterations=20)
+        second, _ = self.plan(seed=11, restarts=3, refine_iterations=20)
+        self.assertEqual(first, second)
+        self.assertEqual(stats["seed"], 11)
+
+    def test_seed_is_drawn_and_echoed_when_missing(self):
+        first, stats = self.plan()
+        replay, _ = self.plan(seed=stats["seed"])
+        self.assertEqual(first, replay)
+
+    def test_replay_with_catalog_version_hits_the_cache(self):
+        first, stats = self.plan(seed=3, catalog_version=1)
+        second, cached_stats = self.plan(seed=3, catalog_version=1)
+        self.assertFalse(stats["cached"])
+        self.assertTrue(cached_stats["cached"])
+        self.assertEqual(first, second)
+        _, other_version = self.plan(seed=3, catalog_version=2)
+        self.assertFalse(other_version["cached"])
+
+
+class RankSlotAlternativesTests(TestCase):
+    def make_snapshot(self):
+        recipes = [
+            RecipeAdapter(1, "Sopa", 2, token_profile={"vegetables": Decimal(4)}),
+            RecipeAdapter(2, "Bacalhau", 2, token_profile={"fish": Decimal(3)}),
+            RecipeAdapter(3, "Salada", 2, token_profile={"vegetables": Decimal(2), "fish": Decimal(1)}),
+            RecipeAdapter(4, "Arroz", 2, token_profile={}),
+            RecipeAdapter(5, "Atum", 2, token_profile={"fish": Decimal(3)}),
+        ]
+        return CatalogSnapshot(0, recipes, {}, {}, {4: {9: Decimal(300)}}, {})
+
+    def test_ranks_against_the_rest_of_the_draft(self):
+        snapshot = self.make_snapshot()
+        kept = [snapshot.recipes_by_id[1]]
+        replaced = snapshot.recipes_by_id[4]
+        alternatives, current_score = rank_slot_alternatives(
+            snapshot, {"vegetables": 4, "fish": 3}, kept, replaced_recipe=replaced, limit=2
+        )
+        # Kept and replaced recipes are excluded; fish ties break by name.
+        self.assertEqual([a["recipe"].id for a in alternatives], [5, 2])
+        self.assertEqual(alternatives[0]["score"], 0.0)
+        self.assertEqual(alternatives[0]["token_deltas"], {"fish": Decimal(3)})
+        self.assertEqual(current_score, 3.0)
+
+    def test_forced_ingredients_count_toward_the_score(self):
+        snapshot = self.make_snapshot()
+        alternatives, current_score = rank_slot_alternatives(
+            snapshot, {}, [], forced_ingredients={9: Decimal(300)}, limit=1
+        )
+        self.assertEqual(alternatives[0]["recipe"].id, 4)
+        self.assertIsNone(current_score)
+
+    def test_replaced_batch_on_another_slot_is_counted_once(self):
+        snapshot = self.make_snapshot()
+        # Atum cooked for two occasions: its other slot is still in the draft.
+        kept = [snapshot.recipes_by_id[1], snapshot.recipes_by_id[5]]
+        replaced = snapshot.recipes_by_id[5]
+        alternatives, current_score = rank_slot_alternatives(
+            snapshot, {"vegetables": 4, "fish": 6}, kept, replaced_recipe=replaced,
+            forced_ingredients={9: Decimal(300)}, limit=1,
+        )
+        # Not 300: Atum's fish isn't added on top of its own kept copy.
+        self.assertEqual(current_score, 3.0 + 300.0)
+        self.assertEqual(alternatives[0]["recipe"].id, 4)
+        self.assertEqual(alternatives[0]["score"], 3.0)
+
+    def test_usage_matrix_slices_forced_columns(self):
+        snapshot = self.make_snapshot()
+        usage = snapshot.usage_matrix([9, 7])
+        self.assertEqual(usage.shape, (5, 2))
+        self.assertEqual(usage[snapshot.recipe_rows[4]].tolist(), [300.0, 0.0])
+        self.assertEqual(usage.sum(), 300.0)
+
+
+class PlanCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = PlanCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_expired_entries_are_dropped(self):
+        cache = PlanCache(ttl_seconds=-1)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
 class ScheduleBatchesTests(TestCase):
     def test_returns_one_entry_per_occasion(self):
         recipe_a = FakeRecipe(1, "A", serves=6)
@@ -256,3 +902,568 @@ class ScheduleBatchesTests(TestCase):
         for i in range(len(scheduled) - 2):
             ids = {scheduled[i]["recipe"].id, scheduled[i + 1]["recipe"].id, scheduled[i + 2]["recipe"].id}
             self.assertGreater(len(ids), 1)
+
+    def test_multi_week_plan_only_repeats_once_a_single_batch_is_left(self):
+        rng = random.Random(3)
+        batches = [
+            {"recipe": FakeRecipe(i, f"R{i}"), "occasions": rng.randint(1, 3), "multiplier": 1}
+            for i in range(60)
+        ]
+        batches.append({"recipe": FakeRecipe(99, "Big"), "occasions": 6, "multiplier": 2})
+        scheduled = schedule_batches(batches)
+        ids = [entry["recipe"].id for entry in scheduled]
+        self.assertEqual(len(ids), sum(b["occasions"] for b in batches))
+        repeats = [i for i in range(1, len(ids)) if ids[i] == ids[i - 1]]
+        # Only the longest batch's tail, once every other batch is used up.
+        self.assertTrue(all(ids[i] == 99 for i in repeats))
+        self.assertEqual(set(ids[repeats[0]:]) if repeats else {99}, {99})
+
+
+def make_meal(name="Sopa", serves=2):
+    return Meal.objects.create(
+        name=name, description="", serves=serves, time=30, nuisance_factor=1.0
+    )
+
+
+class MealTokenProfileStoreTests(TestCase):
+    def setUp(self):
+        self.token = NutritionToken.objects.create(name="vegetables")
+        self.carrot = Ingredient.objects.create(name="Cenoura", base_unit="g")
+        self.measure = IngredientMeasure.objects.create(
+            ingredient=self.carrot, unit_description="u", multiplier=100
+        )
+        IngredientNutritionToken.objects.create(
+            ingredient=self.carrot, token=self.token, quantity=Decimal("0.01")
+        )
+        self.meal = make_meal()
+        MealIngredient.objects.create(
+            meal=self.meal, ingredient=self.carrot, u_quantity="2", u_desc="u"
+        )
+
+    def test_profile_is_persisted_on_first_read(self):
+        profiles = get_meal_token_profiles([self.meal.id])
+        self.assertEqual(profiles[self.meal.id], {"vegetables": Decimal(2)})
+        self.assertEqual(MealTokenProfile.objects.filter(meal=self.meal).count(), 1)
+
+    def test_measure_change_invalidates_and_rebuilds(self):
+        get_meal_token_profiles([self.meal.id])
+        self.measure.multiplier = 200
+        self.measure.save()
+        self.meal.refresh_from_db()
+        self.assertIsNone(self.meal.token_profile_version)
+        self.assertEqual(get_meal_token_profiles([self.meal.id])[self.meal.id]["vegetables"], Decimal(4))
+
+    def test_meal_ingredient_delete_empties_profile(self):
+        get_meal_token_profiles([self.meal.id])
+        MealIngredient.objects.filter(meal=self.meal).delete()
+        self.assertEqual(get_meal_token_profiles([self.meal.id])[self.meal.id], {})
+
+    def test_rebuild_skips_meals_another_request_already_rebuilt(self):
+        # Both requests saw the stale stamp; the first one rebuilds.
+        self.assertEqual(rebuild_meal_token_profiles([self.meal.id], only_stale=True), {
+            self.meal.id: {"vegetables": Decimal(2)}
+        })
+        rows = list(MealTokenProfile.objects.filter(meal=self.meal).values_list("id", flat=True))
+        # The second finds the stamp current once it holds the lock.
+        self.assertEqual(rebuild_meal_token_profiles([self.meal.id], only_stale=True), {})
+        self.assertEqual(list(MealTokenProfile.objects.filter(meal=self.meal).values_list("id", flat=True)), rows)
+
+
+class ComputeTokenProfilesBulkTests(TestCase):
+    def setUp(self):
+        token = NutritionToken.objects.create(name="vegetables")
+        self.carrot = Ingredient.objects.create(name="Cenoura", base_unit="g")
+        self.salt = Ingredient.objects.create(name="Sal", base_unit="g")
+        IngredientMeasure.objects.create(ingredient=self.carrot, unit_description="u", multiplier=100)
+        IngredientNutritionToken.objects.create(ingredient=self.carrot, token=token, quantity=Decimal("0.01"))
+        IngredientNutritionToken.objects.create(ingredient=self.salt, token=token, quantity=Decimal("1"))
+        self.soup = make_meal("Sopa")
+        self.stew = make_meal("Guisado")
+        self.empty = make_meal("Vazio")
+        MealIngredient.objects.create(meal=self.soup, ingredient=self.carrot, u_quantity="2", u_desc=" U ")
+        MealIngredient.objects.create(meal=self.stew, ingredient=self.carrot, u_quantity="1", u_desc="u")
+        # Unparseable quantity and a unit with no measure both contribute nothing.
+        MealIngredient.objects.create(meal=self.stew, ingredient=self.salt, u_quantity="qb", u_desc="g")
+        MealIngredient.objects.create(meal=self.stew, ingredient=self.carrot, u_quantity="3", u_desc="kg")
+
+    def test_matches_per_meal_semantics_in_constant_queries(self):
+        ids = [self.soup.id, self.stew.id, self.empty.id]
+        # Lines, one measure lookup for the "kg" line with no base_quantity, tokens.
+        with self.assertNumQueries(3):
+            profiles = compute_token_profiles_bulk(ids)
+        self.assertEqual(profiles[self.soup.id], {"vegetables": Decimal(2)})
+        self.assertEqual(profiles[self.stew.id], {"vegetables": Decimal(1)})
+        self.assertEqual(profiles[self.empty.id], {})
+
+    def test_ingredient_quantities_bulk_sums_in_sql(self):
+        # The SUM, the lines without a base_quantity, their measure lookup.
+        with self.assertNumQueries(3):
+            quantities = compute_ingredient_quantities_bulk([self.carrot.id, self.salt.id])
+        self.assertEqual(quantities, {
+            self.soup.id: {self.carrot.id: Decimal(200)},
+            self.stew.id: {self.carrot.id: Decimal(100)},
+        })
+        self.assertEqual(compute_ingredient_quantities(self.stew, [self.carrot.id]), {self.carrot.id: Decimal(100)})
+        self.assertEqual(compute_ingredient_quantities(self.empty, [self.carrot.id]), {})
+
+    def test_lines_without_stored_quantities_are_resolved_on_read(self):
+        MealIngredient.objects.update(quantity_value=None, measure_multiplier=None, base_quantity=None)
+        self.assertEqual(compute_token_profiles_bulk([self.soup.id])[self.soup.id], {"vegetables": Decimal(2)})
+        self.assertEqual(
+            compute_ingredient_quantities_bulk([self.carrot.id]),
+            {self.soup.id: {self.carrot.id: Decimal(200)}, self.stew.id: {self.carrot.id: Decimal(100)}},
+        )
+
+
+class BaseQuantityTests(TestCase):
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name="Farinha", base_unit="g")
+        IngredientMeasure.objects.create(ingredient=self.flour, unit_description="c", multiplier=120)
+        self.meal = make_meal("Bolo")
+
+    def line(self, u_quantity, u_desc="c"):
+        return MealIngredient.objects.create(meal=self.meal, ingredient=self.flour, u_quantity=u_quantity, u_desc=u_desc)
+
+    def test_parse_quantity(self):
+        self.assertEqual(parse_quantity("2"), Decimal(2))
+        self.assertEqual(parse_quantity("0,5"), Decimal("0.5"))
+        self.assertEqual(parse_quantity("1/2"), Decimal("0.5"))
+        self.assertEqual(parse_quantity("1 1/2"), Decimal("1.5"))
+        for raw in ("qb", "a gosto", "", "1/0", "nan", None):
+            self.assertIsNone(parse_quantity(raw))
+
+    def test_save_stores_parsed_and_base_quantities(self):
+        line = self.line("1/2")
+        self.assertEqual((line.quantity_value, line.measure_multiplier, line.base_quantity), (Decimal("0.5"), 120, 60))
+        unmeasured = self.line("2", u_desc="kg")
+        self.assertEqual((unmeasured.quantity_value, unmeasured.base_quantity), (Decimal(2), None))
+        to_taste = self.line("qb")
+        self.assertEqual((to_taste.quantity_value, to_taste.measure_multiplier), (None, None))
+
+    def test_measure_changes_resync_rows(self):
+        line = self.line("2", u_desc="kg")
+        measure = IngredientMeasure.objects.create(ingredient=self.flour, unit_description="kg", multiplier=1000)
+        line.refresh_from_db()
+        self.assertEqual(line.base_quantity, 2000)
+        measure.delete()
+        line.refresh_from_db()
+        self.assertIsNone(line.base_quantity)
+
+    def test_backfill_fills_rows_saved_without_the_signal(self):
+        line = self.line("3")
+        MealIngredient.objects.filter(id=line.id).update(quantity_value=None, measure_multiplier=None, base_quantity=None)
+        out = StringIO()
+        call_command("backfill_base_quantities", stdout=out)
+        self.assertIn("1 meal ingredients", out.getvalue())
+        line.refresh_from_db()
+        self.assertEqual(line.base_quantity, 360)
+
+
+class ComputeMenuIngredientsTests(TestCase):
+    def setUp(self):
+        household = Household.objects.create(number_of_members=2)
+        self.menu = Menu.objects.create(household=household)
+        self.rice = Ingredient.objects.create(name="Arroz", base_unit="g")
+        self.salt = Ingredient.objects.create(name="Sal", base_unit="g")
+        self.meals = [make_meal(f"Prato {i}") for i in range(3)]
+        for meal in self.meals:
+            MealIngredient.objects.create(meal=meal, ingredient=self.rice, u_quantity="1/2", u_desc=" C ")
+            MealIngredient.objects.create(meal=meal, ingredient=self.salt, u_quantity="qb", u_desc="")
+
+    def plan(self, meal, day, multiplier=1, state="planned"):
+        MenuMeal.objects.create(
+            menu=self.menu, meal=meal, day_number=day, meal_type=2, portions_multiplier=multiplier, state=state
+        )
+
+    def test_sums_scaled_quantities_in_constant_queries(self):
+        self.plan(self.meals[0], 1)
+        self.plan(self.meals[1], 2, multiplier=2)
+        self.plan(self.meals[2], 3, state="rejected")
+        with self.assertNumQueries(3):
+            measured, unmeasured = compute_menu_ingredients(self.menu)
+        self.assertEqual(dict(measured[self.rice.id]["lines"]), {"c": Decimal("1.5")})
+        self.assertEqual(list(unmeasured), [self.salt.id])
+
+        for day in range(4, 30):
+            self.plan(self.meals[0], day)
+        with self.assertNumQueries(3):
+            compute_menu_ingredients(self.menu)
+
+    def test_rows_never_synced_are_parsed_in_python(self):
+        self.plan(self.meals[0], 1, multiplier=3)
+        MealIngredient.objects.filter(ingredient=self.rice).update(quantity_value=None)
+        measured, _ = compute_menu_ingredients(self.menu)
+        self.assertEqual(dict(measured[self.rice.id]["lines"]), {"c": Decimal("1.5")})
+
+
+class MenuShoppingListTests(TestCase):
+    def setUp(self):
+        household = Household.objects.create(number_of_members=2)
+        self.menu = Menu.objects.create(household=household)
+        self.rice = Ingredient.objects.create(name="Arroz", base_unit="g")
+        self.salt = Ingredient.objects.create(name="Sal", base_unit="g")
+        self.meals = [make_meal(f"Prato {i}") for i in range(2)]
+        for meal in self.meals:
+            MealIngredient.objects.create(meal=meal, ingredient=self.rice, u_quantity="1/2", u_desc="c")
+        MealIngredient.objects.create(meal=self.meals[1], ingredient=self.salt, u_quantity="qb", u_desc="")
+        self.entries = [
+            MenuMeal.objects.create(menu=self.menu, meal=meal, day_number=day, meal_type=2)
+            for day, meal in enumerate(self.meals, start=1)
+        ]
+        rebuild_menu_shopping_lines(self.menu)
+
+    def assertMatchesFullRecompute(self):
+        self.menu.refresh_from_db()
+        self.assertFalse(self.menu.shopping_list_stale)
+        self.assertEqual(menu_shopping_list(self.menu), compute_menu_ingredients(self.menu))
+
+    def test_menu_meal_changes_are_applied_incrementally(self):
+        first, second = self.entries
+        first.portions_multiplier = 3
+        first.save()
+        self.assertMatchesFullRecompute()
+
+        second.state = "done"
+        second.save()
+        self.assertMatchesFullRecompute()
+        self.assertNotIn(self.salt.id, menu_shopping_list(self.menu)[1])
+
+        first.delete()
+        self.assertMatchesFullRecompute()
+        MenuMeal.objects.create(menu=self.menu, meal=self.meals[1], day_number=3, meal_type=2, portions_multiplier=2)
+        self.assertMatchesFullRecompute()
+        measured, unmeasured = menu_shopping_list(self.menu)
+        self.assertEqual(dict(measured[self.rice.id]["lines"]), {"c": Decimal("1")})
+        self.assertEqual(list(unmeasured), [self.salt.id])
+
+    def test_fresh_list_is_one_query(self):
+        with self.assertNumQueries(1):
+            menu_shopping_list(self.menu)
+
+    def test_ingredient_edit_marks_menu_stale_until_next_read(self):
+        line = MealIngredient.objects.get(meal=self.meals[0])
+        line.u_quantity = "2"
+        line.save()
+        self.menu.refresh_from_db()
+        self.assertTrue(self.menu.shopping_list_stale)
+
+        measured, _ = menu_shopping_list(self.menu)
+        self.assertEqual(dict(measured[self.rice.id]["lines"]), {"c": Decimal("2.5")})
+        self.assertMatchesFullRecompute()
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        clear_catalog_snapshot()
+        self.carrot = Ingredient.objects.create(name="Cenoura", base_unit="g")
+        IngredientMeasure.objects.create(ingredient=self.carrot, unit_description="u", multiplier=100)
+        self.meal = make_meal()
+        MealIngredient.objects.create(meal=self.meal, ingredient=self.carrot, u_quantity="2", u_desc="u")
+
+    def tearDown(self):
+        clear_catalog_snapshot()
+
+    def test_snapshot_is_reused_until_catalog_version_changes(self):
+        snapshot = get_catalog_snapshot()
+        self.assertIs(get_catalog_snapshot(), snapshot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_meal("Guisado")
+        refreshed = get_catalog_snapshot()
+        self.assertIsNot(refreshed, snapshot)
+        self.assertEqual(len(refreshed.recipes), 2)
+
+    def test_recipes_are_slotted_adapters_without_model_instances(self):
+        recipe = get_catalog_snapshot().recipes_by_id[self.meal.id]
+        self.assertIsInstance(recipe, RecipeAdapter)
+        self.assertEqual((recipe.name, recipe.serves, recipe.image), ("Sopa", 2, ""))
+        with self.assertRaises(AttributeError):
+            recipe._meal = self.meal
+
+    def test_forced_ingredient_profiles_use_base_units(self):
+        adapters = get_catalog_snapshot().recipe_adapters([self.carrot.id])
+        self.assertEqual(adapters[0].forced_ingredient_profile, {self.carrot.id: Decimal(200)})
+        # The shared adapters are left untouched.
+        self.assertEqual(get_catalog_snapshot().recipes[0].forced_ingredient_profile, {})
+
+
+class PregeneratedMenuTests(TestCase):
+    def setUp(self):
+        clear_catalog_snapshot()
+        self.household = Household.objects.create(id=1, number_of_members=2, menu_preferences={"days": 3, "meals": [2]})
+        for i in range(6):
+            make_meal(f"Prato {i}")
+
+    def tearDown(self):
+        clear_catalog_snapshot()
+
+    def generate(self, body, household_id=1):
+        request = APIRequestFactory().post(f"/api/meals/{household_id}/generate-menu/", body, format="json")
+        return GenerateMenuView.as_view()(request, household_id=household_id)
+
+    def test_command_stores_inactive_drafts(self):
+        call_command("pregenerate_menus", "--drafts", "2", "--workers", "1", stdout=StringIO())
+        drafts = Menu.objects.filter(household=self.household, is_draft=True)
+        self.assertEqual(drafts.count(), 2)
+        self.assertFalse(drafts.filter(is_active=True).exists())
+        self.assertEqual(drafts.first().menu_meals.count(), 3)
+
+    def test_failed_persist_keeps_the_previous_drafts(self):
+        call_command("pregenerate_menus", "--workers", "1", stdout=StringIO())
+        draft = Menu.objects.get(is_draft=True)
+
+        persist = pregenerate_menus._persist_menu
+        calls = []
+
+        def failing_persist(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return persist(*args, **kwargs)
+
+        with patch.object(pregenerate_menus, "_persist_menu", failing_persist), self.assertRaises(RuntimeError):
+            call_command("pregenerate_menus", "--drafts", "2", "--workers", "1", stdout=StringIO())
+        self.assertEqual(list(Menu.objects.filter(is_draft=True)), [draft])
+
+    def test_generate_promotes_matching_draft(self):
+        call_command("pregenerate_menus", "--workers", "1", stdout=StringIO())
+        draft = Menu.objects.get(is_draft=True)
+
+        response = self.generate({"days": 3, "meals": [2]})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data["pregenerated"])
+        draft.refresh_from_db()
+        self.assertTrue(draft.is_active)
+        self.assertFalse(draft.is_draft)
+
+        # No draft left for these params, and none ever for other ones.
+        self.assertFalse(self.generate({"days": 3, "meals": [2]}).data["pregenerated"])
+        self.assertFalse(self.generate({"days": 2, "meals": [2]}).data["pregenerated"])
+        self.assertEqual(Menu.objects.filter(is_active=True).count(), 1)
+
+    def test_generate_uses_the_url_household(self):
+        other = Household.objects.create(number_of_members=2, menu_preferences={"days": 3, "meals": [2]})
+        call_command("pregenerate_menus", "--workers", "1", stdout=StringIO())
+        draft = Menu.objects.get(household=other, is_draft=True)
+
+        response = self.generate({"days": 3, "meals": [2]}, household_id=other.id)
+        self.assertTrue(response.data["pregenerated"])
+        draft.refresh_from_db()
+        self.assertTrue(draft.is_active)
+        self.assertTrue(Menu.objects.filter(household=self.household, is_draft=True).exists())
+
+
+def sse_event_names(chunks):
+    """Event names of a text/event-stream body, in order (keepalives skipped)."""
+    body = b"".join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in chunks).decode()
+    return [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+
+
+class PreviewEndpointTests(TestCase):
+    def setUp(self):
+        clear_catalog_snapshot()
+        plan_cache.clear()
+        Household.objects.create(id=1, number_of_members=2)
+        self.meals = [make_meal(f"Prato {i}") for i in range(6)]
+
+    def tearDown(self):
+        clear_catalog_snapshot()
+        plan_cache.clear()
+
+    def post(self, view, path, body, **kwargs):
+        return view.as_view()(APIRequestFactory().post(path, body, format="json"), **kwargs)
+
+    def test_stream_sends_catalog_then_batches_then_plan(self):
+        response = self.post(OptimizeMenuPreviewStreamView, "/api/meals/1/optimize-preview/stream/", {"days": 2})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        names = sse_event_names(response.streaming_content)
+        self.assertEqual(names[0], "catalog")
+        self.assertEqual(names[-1], "plan")
+        self.assertIn("batch", names)
+        self.assertLess(names.index("batch"), names.index("built"))
+
+    def test_stream_is_async_under_asgi(self):
+        request = AsyncRequestFactory().post(
+            "/api/meals/1/optimize-preview/stream/", {"days": 2}, content_type="application/json"
+        )
+        response = OptimizeMenuPreviewStreamView.as_view()(request, household_id=1)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response]
+
+        names = sse_event_names(async_to_sync(read)())
+        self.assertEqual((names[0], names[-1]), ("catalog", "plan"))
+
+    def test_closing_the_async_stream_cancels_the_run(self):
+        stopped = threading.Event()
+
+        def endless_run(*args, on_event, **kwargs):
+            try:
+                while True:
+                    on_event("batch", {})
+                    time.sleep(0.01)
+            finally:
+                stopped.set()
+
+        request = AsyncRequestFactory().post(
+            "/api/meals/1/optimize-preview/stream/", {"days": 2}, content_type="application/json"
+        )
+        with patch("meals.views._run_menu_optimizer", endless_run):
+            response = OptimizeMenuPreviewStreamView.as_view()(request, household_id=1)
+
+            async def read_two_and_disconnect():
+                stream = response.streaming_content
+                chunks = [await anext(stream), await anext(stream)]
+                await stream.aclose()
+                return chunks
+
+            self.assertEqual(sse_event_names(async_to_sync(read_two_and_disconnect)()), ["catalog", "batch"])
+            self.assertTrue(stopped.wait(timeout=5))
+
+    def test_stream_reports_errors(self):
+        response = self.post(
+            OptimizeMenuPreviewStreamView, "/api/meals/1/optimize-preview/stream/", {"days": 2, "alternatives": 2}
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with patch("meals.views._run_menu_optimizer", side_effect=ValueError("no recipes")):
+            response = self.post(OptimizeMenuPreviewStreamView, "/api/meals/1/optimize-preview/stream/", {"days": 2})
+            body = b"".join(response.streaming_content).decode()
+        self.assertEqual(sse_event_names([body]), ["catalog", "error"])
+        self.assertIn('"error": "no recipes"', body)
+
+    def test_preview_alternatives_are_distinct_menus(self):
+        response = self.post(
+            OptimizeMenuPreviewView, "/api/meals/1/optimize-preview/", {"days": 2, "alternatives": 2, "seed": 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        alternatives = response.data["alternatives"]
+        self.assertEqual(len(alternatives), 2)
+        recipe_sets = [{entry["recipe"]["id"] for entry in plan["recipes"]} for plan in alternatives]
+        self.assertNotEqual(recipe_sets[0], recipe_sets[1])
+        self.assertEqual(response.data["recipes"], alternatives[0]["recipes"])
+
+    def test_reoptimize_slot_ranks_replacements(self):
+        kept, replaced = self.meals[0], self.meals[1]
+        body = {
+            "tokens": {},
+            "draft": [
+                {"day_number": 1, "meal_type": 2, "meal_id": kept.id},
+                {"day_number": 2, "meal_type": 2, "meal_id": replaced.id},
+            ],
+            "slot": {"day_number": 2, "meal_type": 2},
+            "limit": 3,
+        }
+        response = self.post(ReoptimizeSlotView, "/api/meals/1/reoptimize-slot/", body, household_id=1)
+        self.assertEqual(response.status_code, 200)
+        ids = [int(entry["recipe"]["id"]) for entry in response.data["alternatives"]]
+        self.assertEqual(len(ids), 3)
+        self.assertFalse({kept.id, replaced.id} & set(ids))
+        self.assertEqual(response.data["current_score"], 0.0)
+
+        body["draft"][0]["meal_id"] = 9999
+        response = self.post(ReoptimizeSlotView, "/api/meals/1/reoptimize-slot/", body, household_id=1)
+        self.assertEqual(response.status_code, 400)
+
+
+class TagFilteredPoolTests(TestCase):
+    def setUp(self):
+        clear_catalog_snapshot()
+        vegetarian = Tag.objects.create(name="Vegetariano", category="diet")
+        portugal = Tag.objects.create(name="Portugal", category="country")
+        spain = Tag.objects.create(name="Espanha", category="country")
+        Tag.objects.create(name="Picante", category="spice_level")
+        self.sopa = make_meal("Sopa")
+        self.sopa.tags.set([vegetarian, portugal])
+        self.gaspacho = make_meal("Gaspacho")
+        self.gaspacho.tags.set([vegetarian, spain])
+        self.cozido = make_meal("Cozido")
+        self.cozido.tags.set([portugal])
+
+    def tearDown(self):
+        clear_catalog_snapshot()
+
+    def pool(self, include=(), exclude=()):
+        return {r.name for r in get_catalog_snapshot().recipe_adapters(include_tags=include, exclude_tags=exclude)}
+
+    def test_include_ors_within_a_category_and_ands_across(self):
+        self.assertEqual(self.pool(["Vegetariano"]), {"Sopa", "Gaspacho"})
+        self.assertEqual(self.pool(["Portugal", "Espanha"]), {"Sopa", "Gaspacho", "Cozido"})
+        self.assertEqual(self.pool(["Portugal", "Vegetariano"]), {"Sopa"})
+        self.assertEqual(self.pool(["Picante"]), set())
+
+    def test_exclude_removes_any_tagged_recipe(self):
+        self.assertEqual(self.pool(exclude=["Vegetariano"]), {"Cozido"})
+        self.assertEqual(self.pool(["Portugal"], ["Vegetariano"]), {"Cozido"})
+
+    def test_unknown_tag_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Unknown tags: Vegano"):
+            get_catalog_snapshot().tag_mask(["Vegano"])
+
+    def test_filtered_plans_are_cached_apart_from_unfiltered_ones(self):
+        plan_cache.clear()
+        slots, assigned, *_ = _run_menu_optimizer(1, [2], {}, 2, seed=1, include_tags=("Espanha",))
+        self.assertEqual(assigned[slots[0]]["recipe"].name, "Gaspacho")
+        slots, assigned, *_, stats = _run_menu_optimizer(1, [2], {}, 2, seed=1, include_tags=("Portugal",))
+        self.assertFalse(stats["cached"])
+        self.assertIn(assigned[slots[0]]["recipe"].name, {"Sopa", "Cozido"})
+
+
+class PantryBonusTests(TestCase):
+    def setUp(self):
+        clear_catalog_snapshot()
+        self.household = Household.objects.create(id=1, number_of_members=2)
+        self.rice = Ingredient.objects.create(name="Arroz", base_unit="g")
+        self.beans = Ingredient.objects.create(name="Feijão", base_unit="g")
+        self.salt = Ingredient.objects.create(name="Sal", base_unit="g")
+        self.feijoada = make_meal("Feijoada")
+        self.arroz = make_meal("Arroz")
+        self.salada = make_meal("Salada")
+        for meal, ingredient, required in [
+            (self.feijoada, self.rice, True),
+            (self.feijoada, self.beans, True),
+            (self.arroz, self.rice, True),
+            (self.arroz, self.salt, False),
+            (self.salada, self.salt, False),
+        ]:
+            MealIngredient.objects.create(meal=meal, ingredient=ingredient, required=required)
+
+    def tearDown(self):
+        clear_catalog_snapshot()
+
+    def test_bonus_is_weighted_coverage_of_required_ingredients(self):
+        bonus = get_catalog_snapshot().pantry_bonus({self.rice.id: 2, self.beans.id: 1, self.salt.id: 2}, 10)
+        # Optional ingredients don't count, so Salada has nothing to cover.
+        self.assertEqual(bonus, {self.feijoada.id: 7.5, self.arroz.id: 10.0})
+        self.assertEqual(get_catalog_snapshot().pantry_bonus({self.rice.id: 2}, 0), {})
+
+    def test_bonus_steers_both_engines(self):
+        recipes = make_recipes(5)
+        pantry_bonus = {3: 1.0}
+        for build in (build_menu_batches, build_menu_batches_vectorized):
+            for seed in range(5):
+                batches, _ = build(
+                    recipes, {}, 1, 2, heat=1, rng=random.Random(seed), pantry_bonus=pantry_bonus
+                )
+                self.assertEqual(batches[0]["recipe"].id, 3)
+
+    def test_drafts_planned_with_the_pantry_go_stale_when_it_changes(self):
+        self.household.menu_preferences = {"days": 1, "meals": [2], "pantryWeight": 5}
+        self.household.save()
+        HouseholdIngredient.objects.filter(household=self.household, ingredient=self.rice).update(status=2)
+        call_command("pregenerate_menus", "--workers", "1", stdout=StringIO())
+        self.assertEqual(Menu.objects.get(is_draft=True).generation_params["pantry"], {str(self.rice.id): 2})
+
+        HouseholdIngredient.objects.filter(household=self.household, ingredient=self.beans).update(status=1)
+        response = GenerateMenuView.as_view()(APIRequestFactory().post(
+            "/api/meals/1/generate-menu/", {"days": 1, "meals": [2], "pantryWeight": 5}, format="json"
+        ), household_id=1)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.data["pregenerated"])
+
+    def test_exact_engine_rejects_pantry_weight(self):
+        response = GenerateMenuView.as_view()(APIRequestFactory().post(
+            "/api/meals/1/generate-menu/", {"engine": "exact", "pantryWeight": 1}, format="json"
+        ), household_id=1)
+        self.assertEqual(response.status_code, 400)
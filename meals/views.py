@@ -1,62 +1,61 @@
+import asyncio
+import json
+import queue
 import random
+import threading
+from collections import deque
 from datetime import timedelta
+from functools import partial
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from .models import HouseholdIngredient
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.db import transaction
 from django.utils import timezone
-from .services.meal_plan_optimizer import build_menu_batches, schedule_batches
+from .services.meal_plan_optimizer import (
+    Deadline,
+    _recipe_sizing,
+    build_menu_batches,
+    build_menu_batches_alternatives,
+    build_menu_batches_best_of,
+    plan_shortfall,
+    refine_menu_batches,
+    schedule_batches,
+)
+from .services.vectorized_optimizer import build_menu_batches_vectorized
+from .services.exact_optimizer import build_menu_batches_exact, solve_menu_batches_exact
 from meals.models import MenuMeal, MenuFreezeEntry
 
 from meals.models import Meal, Ingredient, MealIngredient, IngredientNutritionToken, IngredientMeasure, Household, HouseholdIngredient
 from meals.serializers import MealIngredientSerializer, MealSerializer, HouseholdIngredientSerializer, RecipeSerializer, IngredientDetailSerializer, apply_multiplier_display
-from django.db.models import Count, Q
 from decimal import Decimal, InvalidOperation
-from .services.token_calculator import compute_token_profile, compute_ingredient_quantities
-from .services.token_profile import compute_menu_token_profile
+from .services.token_profile import get_meal_token_profiles, sum_token_profiles
+from .services.catalog import get_catalog_snapshot
+from .services.plan_cache import plan_cache
+from .services.slot_reoptimizer import rank_slot_alternatives
+from .services.shopping_list import rebuild_menu_shopping_lines
 from .models import Menu
 from .serializers import MenuSerializer, serialize_menu_ingredients
 
 
-def _build_recipe_adapters(forced_ingredient_ids=None):
-    """Wrap every Meal in a lightweight adapter carrying its computed
-    token_profile — the shape optimize_meal_plan expects (.id, .token_profile),
-    plus a back-reference to the real Meal (._meal). Shared by GenerateMenuView
-    and OptimizeMenuPreviewView so both run the optimizer over the same data.
-
-    forced_ingredient_ids: optional list of ingredient ids to also compute a
-    per-recipe forced_ingredient_profile for (dict {ingredient_id: Decimal
-    grams used}) — see build_menu_batches's forced_ingredients param. Left
-    empty/omitted this is just {} on every adapter (cheap no-op), since most
-    callers don't have any forced ingredients."""
-    recipes = []
-    for meal in Meal.objects.all():
-        adapter = type("RecipeAdapter", (), {})()
-        adapter.id = meal.id
-        adapter.name = meal.name
-        adapter.token_profile = compute_token_profile(meal)
-        adapter.forced_ingredient_profile = compute_ingredient_quantities(
-            meal, forced_ingredient_ids or []
-        )
-        adapter._meal = meal  # keep reference to real Meal object
-        recipes.append(adapter)
-    return recipes
-
-
-def _serialize_recipe_summary(meal):
+def _serialize_recipe_summary(recipe):
     """Same nested-recipe shape as MenuSerializer.get_recipes's "recipe" object,
     minus the times_made placeholder (the frontend's Recipe model doesn't read
-    it). Shared by OptimizeMenuPreviewView and MealSearchView."""
+    it), from a RecipeAdapter. Shared by OptimizeMenuPreviewView and
+    MealSearchView."""
     return {
-        "id": str(meal.id),
-        "name": meal.name,
-        "image": meal.image.name if meal.image else "",
-        "cook_time": meal.time,
-        "serves": meal.serves,
+        "id": str(recipe.id),
+        "name": recipe.name,
+        "image": recipe.image,
+        "cook_time": recipe.time,
+        "serves": recipe.serves,
     }
 
 
@@ -99,7 +98,201 @@ def _parse_forced_ingredients(raw):
     return parsed, None
 
 
-def _run_menu_optimizer(days, meals, rules, members, locked_recipes=None, recipes=None, forced_ingredients=None):
+# Batch-building engines _run_menu_optimizer can run, selectable per request
+# via the "engine" field. All take the same params and return the same shape
+# (see build_menu_batches_vectorized, build_menu_batches_exact).
+OPTIMIZER_ENGINES = {
+    "greedy": build_menu_batches,
+    "vectorized": build_menu_batches_vectorized,
+    "exact": build_menu_batches_exact,
+}
+
+
+def _parse_engine(raw):
+    """Parses the request's optional engine field (one of OPTIMIZER_ENGINES,
+    default "greedy"). Returns (engine, error_response), same convention as
+    _parse_forced_ingredients."""
+    if raw is None:
+        return "greedy", None
+    if raw not in OPTIMIZER_ENGINES:
+        return None, Response(
+            {"error": f"engine must be one of {sorted(OPTIMIZER_ENGINES)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return raw, None
+
+
+def _parse_tag_filter(data):
+    """Parses the request's optional includeTags/excludeTags (lists of Tag
+    names — see CatalogSnapshot.tag_mask for how they combine). Returns
+    ((include_tags, exclude_tags), error_response), each a sorted tuple —
+    same convention as _parse_forced_ingredients. Whether the tags exist is
+    checked against the snapshot by the optimizer run."""
+    filters = []
+    for field in ("includeTags", "excludeTags"):
+        raw = data.get(field) or []
+        if not isinstance(raw, list) or not all(isinstance(name, str) for name in raw):
+            return None, Response({"error": f"{field} must be a list of tag names"}, status=status.HTTP_400_BAD_REQUEST)
+        filters.append(tuple(sorted(set(raw))))
+    return tuple(filters), None
+
+
+def _parse_pantry_weight(data, engine):
+    """Parses the request's optional pantryWeight (non-negative number,
+    default 0 = ignore the pantry): how many token units of shortfall a
+    recipe whose required ingredients are all "Plenty" is worth — see
+    CatalogSnapshot.pantry_bonus. The exact engine doesn't support it.
+    Returns (weight, error_response), same convention as
+    _parse_forced_ingredients."""
+    try:
+        weight = float(data.get("pantryWeight", 0))
+    except (TypeError, ValueError):
+        return None, Response({"error": "pantryWeight must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    if not weight >= 0:
+        return None, Response({"error": "pantryWeight must not be negative"}, status=status.HTTP_400_BAD_REQUEST)
+    if weight and engine == "exact":
+        return None, Response(
+            {"error": "pantryWeight needs a greedy or vectorized engine"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return weight, None
+
+
+def _pantry_statuses(household_id):
+    """{ingredient_id: status} of the household's HouseholdIngredient rows
+    that aren't All Out (those carry no pantry credit)."""
+    return dict(
+        HouseholdIngredient.objects.filter(household_id=household_id, status__gt=0)
+        .values_list("ingredient_id", "status")
+    )
+
+
+MAX_RESTARTS = 32
+MAX_REFINE_ITERATIONS = 5000
+
+
+def _parse_search_options(data):
+    """Parses the request's optional search-effort fields: restarts
+    (1..MAX_RESTARTS, default 1 — see build_menu_batches_best_of),
+    refineIterations (0..MAX_REFINE_ITERATIONS, default 0 — see
+    refine_menu_batches), deadlineMs (positive int, default none — the
+    older timeBudgetMs name is still accepted) and seed (non-negative int,
+    default none — one is drawn and echoed back).
+    Returns ({"restarts", "refine_iterations", "deadline_ms", "seed"},
+    error_response) — the dict is meant to be splatted into
+    _run_menu_optimizer — same convention as _parse_forced_ingredients."""
+    try:
+        restarts = int(data.get("restarts", 1))
+        refine_iterations = int(data.get("refineIterations", 0))
+        deadline_ms = data.get("deadlineMs", data.get("timeBudgetMs"))
+        deadline_ms = int(deadline_ms) if deadline_ms is not None else None
+        seed = data.get("seed")
+        seed = int(seed) if seed is not None else None
+    except (TypeError, ValueError):
+        return None, Response(
+            {"error": "restarts, refineIterations, deadlineMs and seed must be integers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if restarts < 1 or restarts > MAX_RESTARTS:
+        return None, Response(
+            {"error": f"restarts must be between 1 and {MAX_RESTARTS}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if refine_iterations < 0 or refine_iterations > MAX_REFINE_ITERATIONS:
+        return None, Response(
+            {"error": f"refineIterations must be between 0 and {MAX_REFINE_ITERATIONS}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if deadline_ms is not None and deadline_ms <= 0:
+        return None, Response({"error": "deadlineMs must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+    if seed is not None and seed < 0:
+        return None, Response({"error": "seed must not be negative"}, status=status.HTTP_400_BAD_REQUEST)
+    return {
+        "restarts": restarts,
+        "refine_iterations": refine_iterations,
+        "deadline_ms": deadline_ms,
+        "seed": seed,
+    }, None
+
+
+def _plan_cache_key(catalog_version, days, meals, rules, members, locked_recipes, forced_ingredients, engine, **search_options):
+    """Everything a _run_menu_optimizer result depends on, as a hashable
+    plan_cache key. Rule and forced-ingredient amounts are keyed by their
+    string form, so 10 and "10" from the client land on the same entry."""
+    return (
+        catalog_version,
+        days,
+        tuple(meals),
+        tuple(sorted((str(token), str(amount)) for token, amount in rules.items())),
+        members,
+        tuple(sorted((slot, adapter.id) for slot, adapter in locked_recipes)),
+        tuple(sorted((ingredient_id, str(grams)) for ingredient_id, grams in forced_ingredients.items())),
+        engine,
+        tuple(sorted(search_options.items())),
+    )
+
+
+def _engine_builder(engine, snapshot=None):
+    """OPTIMIZER_ENGINES[engine], with the greedy engine set to score in the
+    MEAL_OPTIMIZER_NUMERIC backend, and the vectorized one reading packed
+    rows from `snapshot` (the CatalogSnapshot the recipes came from) when
+    given."""
+    build = OPTIMIZER_ENGINES[engine]
+    if build is build_menu_batches:
+        build = partial(build, numeric=getattr(settings, "MEAL_OPTIMIZER_NUMERIC", "decimal"))
+    elif build is build_menu_batches_vectorized and snapshot is not None:
+        build = partial(build, snapshot=snapshot)
+    return build
+
+
+def _assign_batches_to_slots(slots, batches, locked_recipes):
+    """Lays a build_menu_batches result out over `slots`: returns (assigned,
+    unfilled_slots) as described in _run_menu_optimizer."""
+    # Locked batches (occasions always 1, appended first by build_menu_batches)
+    # map straight to their pinned slot; everything else is freely schedulable.
+    # Note: spacing (no-3-in-a-row / freshness window) is computed only among
+    # the freely-scheduled slots — locked slots are explicit user picks, so we
+    # don't try to re-balance spacing around them.
+    locked_by_slot = dict(locked_recipes)
+    locked_ids = {a.id for a in locked_by_slot.values()}
+    fresh_batches = [b for b in batches if b["recipe"].id not in locked_ids]
+    fresh_queue = deque(schedule_batches(fresh_batches))
+    locked_multipliers = {b["recipe"].id: b["multiplier"] for b in batches if b["recipe"].id in locked_ids}
+
+    assigned = {}
+    unfilled_slots = []
+    for slot in slots:
+        if slot in locked_by_slot:
+            adapter = locked_by_slot[slot]
+            assigned[slot] = {"recipe": adapter, "multiplier": locked_multipliers[adapter.id], "locked": True}
+        elif fresh_queue:
+            entry = fresh_queue.popleft()
+            assigned[slot] = {"recipe": entry["recipe"], "multiplier": entry["multiplier"], "locked": False}
+        else:
+            unfilled_slots.append(slot)
+    return assigned, unfilled_slots
+
+
+def _run_menu_optimizer(
+    days,
+    meals,
+    rules,
+    members,
+    locked_recipes=None,
+    recipes=None,
+    forced_ingredients=None,
+    engine="greedy",
+    restarts=1,
+    refine_iterations=0,
+    deadline_ms=None,
+    seed=None,
+    catalog_version=None,
+    on_event=None,
+    include_tags=(),
+    exclude_tags=(),
+    pantry_bonus=None,
+    snapshot=None,
+):
     """
     Shared by GenerateMenuView and OptimizeMenuPreviewView. Builds
     household-sized batches (see build_menu_batches: multiply-up small
@@ -114,8 +307,53 @@ def _run_menu_optimizer(days, meals, rules, members, locked_recipes=None, recipe
         build_menu_batches's param of the same name. When recipes isn't
         passed in, adapters are built with forced_ingredient_profile
         populated for exactly these ids.
-
-    Returns (slots, assigned, to_freeze, recipes, unfilled_slots, ingredient_progress):
+    engine: key into OPTIMIZER_ENGINES — "greedy" (build_menu_batches),
+        "vectorized" (build_menu_batches_vectorized, for big catalogs) or
+        "exact" (solve_menu_batches_exact, for small menus — restarts are
+        skipped since it's deterministic, and deadline_ms caps its
+        search).
+    restarts: run that many independent passes and keep the best one
+        (build_menu_batches_best_of).
+    refine_iterations: if > 0, hill-climb the chosen plan with up to that
+        many swap attempts (refine_menu_batches) before scheduling it.
+    deadline_ms: optional wall-clock deadline, counted from the call,
+        shared by every stage (see Deadline): the batch build, the restarts
+        and the refinement. Whatever is running when it passes wraps up with
+        the best complete plan it has — a build in progress fills its
+        remaining slots unscored — so a plan always comes back. Scheduling
+        isn't interrupted; it's linear in the number of slots.
+    seed: seeds the random.Random every randomized step draws from, so the
+        same inputs and seed give the same plan (unless deadline_ms cuts
+        the search short at a different point). Drawn at random when None;
+        either way it's echoed back in stats["seed"].
+    catalog_version: the CatalogSnapshot version `recipes` came from. With
+        it (or when recipes is built here), results are memoized in
+        plan_cache keyed by every input including the seed, so replaying a
+        seed skips the search — stats["cached"] says whether it did. Plans
+        cut short by deadline_ms aren't cached, so a replay gets the chance
+        to finish.
+    on_event: optional callable(name, payload) for streaming progress
+        (OptimizeMenuPreviewStreamView): "batch" {"pass", "recipe_id",
+        "name", "occasions", "multiplier", "token_totals"} as each engine
+        pass adds a batch (the exact engine reports none — its search has
+        no partial plans), "built" once the best pass is chosen, "refined"
+        after refinement and "scheduled" once batches are laid out. A cache
+        hit reports nothing. An exception it raises aborts the run.
+    include_tags/exclude_tags: restrict the fresh picks to recipes passing
+        CatalogSnapshot.tag_mask (locked recipes are kept regardless). When
+        recipes is passed in it must already be filtered the same way —
+        the tags are still needed here for the plan_cache key. Unknown tags
+        raise ValueError.
+    pantry_bonus: optional {recipe_id: amount} from
+        CatalogSnapshot.pantry_bonus, favouring recipes the household's
+        pantry already covers — see build_menu_batches. Ignored by the exact
+        engine.
+    snapshot: the CatalogSnapshot `recipes` came from, if any, so the
+        vectorized engine can reuse its packed matrices (see
+        build_menu_batches_vectorized). Fetched here when recipes isn't
+        passed in.
+
+    Returns (slots, assigned, to_freeze, recipes, unfilled_slots, ingredient_progress, stats):
       slots: list of (day_number, meal_type) in chronological order
       assigned: dict {(day_number, meal_type): {"recipe", "multiplier", "locked"}}
         — only holds entries for slots that actually got filled.
@@ -132,53 +370,177 @@ def _run_menu_optimizer(days, meals, rules, members, locked_recipes=None, recipe
         across every batch picked (locked + fresh) — how much of each forced
         ingredient the resulting menu ended up using, for reporting back to
         the client. {} when forced_ingredients wasn't given.
+      stats: {"engine", "restarts", "restarts_completed", "score", "seed",
+        "cached"} — or {"engine", "proven_optimal", "nodes", "fallback",
+        "score", "seed", "cached"} for the exact engine — plus
+        {"refine_iterations", "refine_improvements"} when refining. score is
+        the final plan's plan_shortfall (0 = every target met). Always also
+        "deadline_ms" (as passed) and "cut_short": the stages the deadline
+        stopped early, sorted ("build", "restarts", "refine", "exact") —
+        [] when the search ran to completion.
     """
+    deadline = Deadline(deadline_ms)
     total_slots = days * len(meals)
     slots = [(day, meal_type) for day in range(1, days + 1) for meal_type in meals]
 
     if recipes is None:
-        recipes = _build_recipe_adapters(
-            forced_ingredient_ids=list((forced_ingredients or {}).keys())
-        )
+        snapshot = get_catalog_snapshot()
+        catalog_version = snapshot.version
+        recipes = snapshot.recipe_adapters(list((forced_ingredients or {}).keys()), include_tags, exclude_tags)
 
     locked_recipes = locked_recipes or []
-    locked_by_slot = dict(locked_recipes)
     locked_adapters = [adapter for _, adapter in locked_recipes]
 
-    batches, to_freeze, _token_progress, ingredient_progress = build_menu_batches(
+    if seed is None:
+        seed = random.getrandbits(32)
+    cache_key = None
+    if catalog_version is not None:
+        cache_key = _plan_cache_key(
+            catalog_version, days, meals, rules, members, locked_recipes, forced_ingredients or {}, engine,
+            restarts=restarts, refine_iterations=refine_iterations, deadline_ms=deadline_ms, seed=seed,
+            include_tags=tuple(include_tags), exclude_tags=tuple(exclude_tags),
+            pantry=tuple(sorted((pantry_bonus or {}).items())),
+        )
+        cached = plan_cache.get(cache_key)
+        if cached is not None:
+            assigned, to_freeze, unfilled_slots, ingredient_progress, stats = cached
+            return slots, assigned, to_freeze, recipes, unfilled_slots, ingredient_progress, {**stats, "cached": True}
+    rng = random.Random(seed)
+    notify = on_event or (lambda name, payload: None)
+
+    if engine == "exact":
+        (batches, to_freeze, token_progress, ingredient_progress), stats = solve_menu_batches_exact(
+            recipes,
+            rules,
+            total_slots,
+            members,
+            locked_recipes=locked_adapters,
+            forced_ingredients=forced_ingredients,
+            deadline=deadline,
+            rng=rng,
+        )
+        score = plan_shortfall(token_progress, ingredient_progress, rules, forced_ingredients)
+    else:
+        build_options = {}
+        if on_event is not None:
+            build_options["on_pick"] = lambda index, batch, token_progress: on_event("batch", {
+                "pass": index,
+                "recipe_id": batch["recipe"].id,
+                "name": batch["recipe"].name,
+                "occasions": batch["occasions"],
+                "multiplier": batch["multiplier"],
+                "token_totals": {token: float(amount) for token, amount in token_progress.items()},
+            })
+        (batches, to_freeze, token_progress, ingredient_progress), score, stats = build_menu_batches_best_of(
+            _engine_builder(engine, snapshot),
+            restarts,
+            deadline=deadline,
+            recipes=recipes,
+            rules=rules,
+            total_slots=total_slots,
+            members=members,
+            heat=3,
+            locked_recipes=locked_adapters,
+            forced_ingredients=forced_ingredients,
+            rng=rng,
+            pantry_bonus=pantry_bonus,
+            **build_options,
+        )
+    stats = {"engine": engine, **stats}
+    notify("built", {**stats, "score": float(score)})
+
+    if refine_iterations:
+        batches, to_freeze, token_progress, ingredient_progress, refine_stats = refine_menu_batches(
+            batches,
+            recipes,
+            rules,
+            members,
+            locked_recipes=locked_adapters,
+            forced_ingredients=forced_ingredients,
+            iterations=refine_iterations,
+            deadline=deadline,
+            rng=rng,
+            pantry_bonus=pantry_bonus,
+        )
+        score = plan_shortfall(token_progress, ingredient_progress, rules, forced_ingredients)
+        stats.update(refine_stats)
+        notify("refined", {**refine_stats, "score": float(score)})
+    stats["score"] = float(score)
+    stats["seed"] = seed
+    stats["deadline_ms"] = deadline_ms
+    stats["cut_short"] = sorted(deadline.cut_short)
+
+    assigned, unfilled_slots = _assign_batches_to_slots(slots, batches, locked_recipes)
+    notify("scheduled", {"filled_slots": len(assigned), "unfilled_slots": len(unfilled_slots)})
+
+    if cache_key is not None and not deadline.cut_short:
+        plan_cache.set(cache_key, (assigned, to_freeze, unfilled_slots, ingredient_progress, stats))
+    return slots, assigned, to_freeze, recipes, unfilled_slots, ingredient_progress, {**stats, "cached": False}
+
+
+def _run_menu_alternatives(
+    days,
+    meals,
+    rules,
+    members,
+    count,
+    locked_recipes=None,
+    recipes=None,
+    forced_ingredients=None,
+    engine="greedy",
+    min_distance=0.3,
+    deadline_ms=None,
+    seed=None,
+    include_tags=(),
+    exclude_tags=(),
+    pantry_bonus=None,
+    snapshot=None,
+):
+    """
+    Like _run_menu_optimizer, but returns up to `count` diverse plans from
+    one catalog load (build_menu_batches_alternatives — passes run in
+    parallel) instead of one. Same params; min_distance is the Jaccard
+    distance kept between plans' recipe sets. No restarts/refinement per
+    plan, and results aren't cached.
+
+    Returns (slots, plans, stats): plans is a list of (assigned, to_freeze,
+    unfilled_slots, ingredient_progress, plan_stats) — see
+    _run_menu_optimizer — with plan_stats {"engine", "score", "distance"};
+    stats {"seed", "alternatives", "attempts", "attempts_completed",
+    "deadline_ms", "cut_short"}.
+    """
+    slots = [(day, meal_type) for day in range(1, days + 1) for meal_type in meals]
+    if recipes is None:
+        snapshot = get_catalog_snapshot()
+        recipes = snapshot.recipe_adapters(list((forced_ingredients or {}).keys()), include_tags, exclude_tags)
+    locked_recipes = locked_recipes or []
+    if seed is None:
+        seed = random.getrandbits(32)
+    deadline = Deadline(deadline_ms)
+
+    results, stats = build_menu_batches_alternatives(
+        _engine_builder(engine, snapshot),
+        count,
+        min_distance=min_distance,
+        deadline=deadline,
+        rng=random.Random(seed),
         recipes=recipes,
         rules=rules,
-        total_slots=total_slots,
+        total_slots=len(slots),
         members=members,
         heat=3,
-        locked_recipes=locked_adapters,
+        locked_recipes=[adapter for _, adapter in locked_recipes],
         forced_ingredients=forced_ingredients,
-        debug=True,
+        pantry_bonus=pantry_bonus,
     )
 
-    # Locked batches (occasions always 1, appended first by build_menu_batches)
-    # map straight to their pinned slot; everything else is freely schedulable.
-    # Note: spacing (no-3-in-a-row / freshness window) is computed only among
-    # the freely-scheduled slots — locked slots are explicit user picks, so we
-    # don't try to re-balance spacing around them.
-    locked_ids = {a.id for a in locked_adapters}
-    fresh_batches = [b for b in batches if b["recipe"].id not in locked_ids]
-    fresh_queue = schedule_batches(fresh_batches)
-
-    assigned = {}
-    unfilled_slots = []
-    for slot in slots:
-        if slot in locked_by_slot:
-            adapter = locked_by_slot[slot]
-            multiplier = next(b["multiplier"] for b in batches if b["recipe"].id == adapter.id)
-            assigned[slot] = {"recipe": adapter, "multiplier": multiplier, "locked": True}
-        elif fresh_queue:
-            entry = fresh_queue.pop(0)
-            assigned[slot] = {"recipe": entry["recipe"], "multiplier": entry["multiplier"], "locked": False}
-        else:
-            unfilled_slots.append(slot)
-
-    return slots, assigned, to_freeze, recipes, unfilled_slots, ingredient_progress
+    plans = []
+    for (batches, to_freeze, _token_progress, ingredient_progress), score, distance in results:
+        assigned, unfilled_slots = _assign_batches_to_slots(slots, batches, locked_recipes)
+        plan_stats = {"engine": engine, "score": float(score), "distance": distance}
+        plans.append((assigned, to_freeze, unfilled_slots, ingredient_progress, plan_stats))
+    stats = {**stats, "deadline_ms": deadline_ms, "cut_short": sorted(deadline.cut_short)}
+    return slots, plans, {"seed": seed, "alternatives": count, **stats}
 
 
 def _shortfall_payload(slots, unfilled_slots):
@@ -250,13 +612,12 @@ class MealsByIngredientsAPIView(APIView):
             return Response({'error': 'No ingredient IDs provided'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Filter meals that contain ALL of the ingredients
-        meals = (
-            Meal.objects
-            .annotate(matching_ingredients=Count('ingredients', filter=Q(ingredients__id__in=ingredient_ids), distinct=True))
-            .filter(matching_ingredients=len(ingredient_ids))
-        )
-
-        meal_list = list(meals)
+        snapshot = get_catalog_snapshot()
+        wanted = set(ingredient_ids)
+        meal_list = [
+            recipe for recipe in snapshot.recipes
+            if wanted <= snapshot.ingredients_by_meal.get(recipe.id, frozenset())
+        ]
         random.shuffle(meal_list)
         selected_meals = meal_list[:amount]
 
@@ -274,7 +635,7 @@ class MealTokensAPIView(APIView):
         except Meal.DoesNotExist:
             return Response({"error": "Meal not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        token_totals = compute_token_profile(meal)
+        token_totals = get_meal_token_profiles([meal.id])[meal.id]
 
         response = {k: float(v.quantize(Decimal("0.01"))) for k, v in token_totals.items()}
         return Response(response)
@@ -363,79 +724,215 @@ class MenuIngredientsView(APIView):
         return Response(serialize_menu_ingredients(menu, request))
 
 
-class GenerateMenuView(APIView):
-    """
-    POST endpoint to generate a new optimized menu for a household.
-    """
+MAX_MENU_DAYS = 30
 
-    MAX_DAYS = 30
 
-    def post(self, request, *args, **kwargs):
-        household_id = 1  # TODO: replace with real household logic
-        days = int(request.data.get("days", 7))
-        meals = request.data.get("meals", [2])  # default to lunch only
-        rules = request.data.get("tokens", {})
+def _parse_generate_options(data):
+    """Parses a GenerateMenuView body — or a Household.menu_preferences dict,
+    which has the same shape. Returns ({"days", "meals", "rules",
+    "forced_ingredients", "engine", "search_options", "include_tags",
+    "exclude_tags", "pantry_weight"}, error_response) — same convention as
+    _parse_forced_ingredients."""
+    try:
+        days = int(data.get("days", 7))
+    except (TypeError, ValueError):
+        return None, Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    meals = data.get("meals", [2])  # default to lunch only
+    rules = data.get("tokens", {})
+
+    # Validate meals list
+    if not meals or not isinstance(meals, list):
+        return None, Response(
+            {"error": "meals must be a non-empty list"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-        # Validate meals list
-        if not meals or not isinstance(meals, list):
-            return Response(
-                {"error": "meals must be a non-empty list"},
-                status=status.HTTP_400_BAD_REQUEST
+    if days < 1 or days > MAX_MENU_DAYS:
+        return None, Response(
+            {"error": f"days must be between 1 and {MAX_MENU_DAYS}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    forced_ingredients, error = _parse_forced_ingredients(data.get("forcedIngredients"))
+    if error:
+        return None, error
+    engine, error = _parse_engine(data.get("engine"))
+    if error:
+        return None, error
+    search_options, error = _parse_search_options(data)
+    if error:
+        return None, error
+    (include_tags, exclude_tags), error = _parse_tag_filter(data)
+    if error:
+        return None, error
+    pantry_weight, error = _parse_pantry_weight(data, engine)
+    if error:
+        return None, error
+    return {
+        "days": days,
+        "meals": meals,
+        "rules": rules,
+        "forced_ingredients": forced_ingredients,
+        "engine": engine,
+        "search_options": search_options,
+        "include_tags": include_tags,
+        "exclude_tags": exclude_tags,
+        "pantry_weight": pantry_weight,
+    }, None
+
+
+def _generation_params(
+    catalog_version, members, days, meals, rules, forced_ingredients, engine, include_tags=(), exclude_tags=(),
+    pantry_weight=0, pantry_statuses=None,
+):
+    """What a drafted menu was planned for, as stored in
+    Menu.generation_params — a request with equal params (compared as a
+    whole, amounts by their string form like _plan_cache_key) can take the
+    draft instead of running the optimizer. The pantry only counts when
+    pantry_weight is set, so pantry changes don't strand other drafts."""
+    return {
+        "catalog_version": catalog_version,
+        "members": members,
+        "days": days,
+        "meals": list(meals),
+        "tokens": {str(token): str(amount) for token, amount in sorted(rules.items())},
+        "forced_ingredients": {
+            str(ingredient_id): str(grams) for ingredient_id, grams in sorted(forced_ingredients.items())
+        },
+        "engine": engine,
+        "include_tags": list(include_tags),
+        "exclude_tags": list(exclude_tags),
+        "pantry_weight": pantry_weight,
+        "pantry": {
+            str(ingredient_id): pantry_status
+            for ingredient_id, pantry_status in sorted((pantry_statuses or {}).items())
+        } if pantry_weight else {},
+    }
+
+
+def _persist_menu(household_id, slots, assigned, to_freeze, is_draft=False, generation_params=None):
+    """Creates the Menu with its MenuMeal rows (only for slots the optimizer
+    actually filled — see unfilled_slots) and MenuFreezeEntry rows. Drafts
+    are stored inactive; otherwise the caller has already deactivated the
+    household's previous menu. The shopping list is built once at the end
+    (a new menu starts stale, so the per-MenuMeal signal updates skip it)."""
+    with transaction.atomic():
+        menu = Menu.objects.create(
+            household_id=household_id,
+            is_active=not is_draft,
+            is_draft=is_draft,
+            generation_params=generation_params,
+            created_at=timezone.now()
+        )
+
+        for day_number, meal_type in slots:
+            entry = assigned.get((day_number, meal_type))
+            if entry is None:
+                continue
+            MenuMeal.objects.create(
+                menu=menu,
+                meal_id=entry["recipe"].id,
+                day_number=day_number,
+                meal_type=meal_type,
+                state="planned",
+                portions_multiplier=entry["multiplier"],
             )
 
-        if days < 1 or days > self.MAX_DAYS:
-            return Response(
-                {"error": f"days must be between 1 and {self.MAX_DAYS}"},
-                status=status.HTTP_400_BAD_REQUEST
+        for freeze in to_freeze:
+            MenuFreezeEntry.objects.create(
+                menu=menu,
+                meal_id=freeze["recipe"].id,
+                portions=freeze["portions"],
             )
+        rebuild_menu_shopping_lines(menu)
+    return menu
+
+
+def _promote_draft_menu(household_id, generation_params):
+    """Makes the newest matching draft (see _generation_params) the
+    household's active menu, deactivating the previous one. Returns the
+    promoted Menu, or None when there's no such draft."""
+    with transaction.atomic():
+        draft = (
+            Menu.objects.select_for_update()
+            .filter(household_id=household_id, is_draft=True, generation_params=generation_params)
+            .order_by("-created_at")
+            .first()
+        )
+        if draft is None:
+            return None
+        Menu.objects.filter(household_id=household_id, is_active=True).update(is_active=False)
+        draft.is_draft = False
+        draft.is_active = True
+        draft.created_at = timezone.now()
+        draft.save(update_fields=["is_draft", "is_active", "created_at"])
+    return draft
 
-        forced_ingredients, error = _parse_forced_ingredients(request.data.get("forcedIngredients"))
+
+class GenerateMenuView(APIView):
+    """
+    POST endpoint to generate a new optimized menu for a household.
+
+    Promotes a matching draft built by pregenerate_menus when there is one
+    (see _promote_draft_menu) instead of optimizing on the request path —
+    unless the request pins a seed, which has to be replayed exactly.
+    "pregenerated" in the response says which happened.
+    """
+
+    MAX_DAYS = MAX_MENU_DAYS
+
+    def post(self, request, household_id):
+        options, error = _parse_generate_options(request.data)
         if error:
             return error
+        days, meals, rules = options["days"], options["meals"], options["rules"]
+        forced_ingredients, engine = options["forced_ingredients"], options["engine"]
+        search_options = options["search_options"]
+        include_tags, exclude_tags = options["include_tags"], options["exclude_tags"]
+        pantry_weight = options["pantry_weight"]
 
         household = get_object_or_404(Household, id=household_id)
+        snapshot = get_catalog_snapshot()
+        try:
+            snapshot.tag_mask(include_tags, exclude_tags)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        pantry_statuses = _pantry_statuses(household_id) if pantry_weight else {}
+
+        if search_options["seed"] is None:
+            generation_params = _generation_params(
+                snapshot.version, household.number_of_members,
+                days, meals, rules, forced_ingredients, engine, include_tags, exclude_tags,
+                pantry_weight, pantry_statuses,
+            )
+            draft = _promote_draft_menu(household_id, generation_params)
+            if draft is not None:
+                response_body = {"detail": "Menu generated successfully.", "pregenerated": True}
+                slot_count = days * len(meals)
+                filled = draft.menu_meals.count()
+                if filled < slot_count:
+                    slots = [(day, meal_type) for day in range(1, days + 1) for meal_type in meals]
+                    response_body["shortfall"] = _shortfall_payload(slots, slots[filled:])
+                return Response(response_body, status=status.HTTP_201_CREATED)
 
         # Step 1: deactivate old menus
         Menu.objects.filter(household_id=household_id, is_active=True).update(is_active=False)
 
         # Step 2: build household-sized batches and schedule them into slots
         try:
-            slots, assigned, to_freeze, _recipes, unfilled_slots, _ingredient_progress = _run_menu_optimizer(
-                days, meals, rules, household.number_of_members, forced_ingredients=forced_ingredients
+            slots, assigned, to_freeze, _recipes, unfilled_slots, _ingredient_progress, stats = _run_menu_optimizer(
+                days, meals, rules, household.number_of_members,
+                forced_ingredients=forced_ingredients, engine=engine,
+                include_tags=include_tags, exclude_tags=exclude_tags,
+                pantry_bonus=snapshot.pantry_bonus(pantry_statuses, pantry_weight), **search_options,
             )
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Step 3: create new menu & insert menu meals + freeze entries
-        # (only for slots the optimizer actually filled — see unfilled_slots)
-        with transaction.atomic():
-            menu = Menu.objects.create(
-                household_id=household_id,
-                is_active=True,
-                created_at=timezone.now()
-            )
-
-            for day_number, meal_type in slots:
-                entry = assigned.get((day_number, meal_type))
-                if entry is None:
-                    continue
-                MenuMeal.objects.create(
-                    menu=menu,
-                    meal=entry["recipe"]._meal,
-                    day_number=day_number,
-                    meal_type=meal_type,
-                    state="planned",
-                    portions_multiplier=entry["multiplier"],
-                )
-
-            for freeze in to_freeze:
-                MenuFreezeEntry.objects.create(
-                    menu=menu,
-                    meal=freeze["recipe"]._meal,
-                    portions=freeze["portions"],
-                )
+        _persist_menu(household_id, slots, assigned, to_freeze)
 
-        response_body = {"detail": "Menu generated successfully."}
+        response_body = {"detail": "Menu generated successfully.", "optimizer": stats, "pregenerated": False}
         shortfall = _shortfall_payload(slots, unfilled_slots)
         if shortfall:
             response_body["shortfall"] = shortfall
@@ -443,6 +940,72 @@ class GenerateMenuView(APIView):
         return Response(response_body, status=status.HTTP_201_CREATED)
 
 
+def _preview_payload(slots, assigned, to_freeze, unfilled_slots, ingredient_progress, stats, forced_ingredients=None, forced_names=None):
+    """OptimizeMenuPreviewView's response body for one planned menu (one
+    _run_menu_optimizer result, or one of _run_menu_alternatives' plans).
+    forced_names: {ingredient_id: name} for the forced_ingredients entries."""
+    meal_type_labels = dict(MenuMeal.MEAL_TYPE_CHOICES)
+    today = timezone.localdate()
+
+    result_recipes = []
+    for day_number, meal_type in slots:
+        entry = assigned.get((day_number, meal_type))
+        if entry is None:
+            continue
+        recipe_summary = _serialize_recipe_summary(entry["recipe"])
+        recipe_summary["name"] = apply_multiplier_display(recipe_summary["name"], entry["multiplier"])
+
+        result_recipes.append({
+            "day_number": day_number,
+            "meal_type": meal_type,
+            "meal_type_label": meal_type_labels.get(meal_type, "").lower(),
+            "suggested_date": (today + timedelta(days=day_number - 1)).isoformat(),
+            "locked": entry["locked"],
+            "multiplier": entry["multiplier"],
+            "recipe": recipe_summary,
+        })
+
+    token_totals = sum_token_profiles(
+        (assigned[slot]["recipe"].token_profile, assigned[slot]["multiplier"]) for slot in slots if slot in assigned
+    )
+    tokens_response = {
+        token: {"real": float(value), "planned": 2}
+        for token, value in token_totals.items()
+    }
+
+    to_freeze_response = [
+        {
+            "meal": _serialize_recipe_summary(freeze["recipe"]),
+            "portions": freeze["portions"],
+        }
+        for freeze in to_freeze
+    ]
+
+    response_body = {
+        "tokens": tokens_response,
+        "recipes": result_recipes,
+        "to_freeze": to_freeze_response,
+        "optimizer": stats,
+    }
+
+    if forced_ingredients:
+        forced_names = forced_names or {}
+        response_body["forced_ingredients"] = [
+            {
+                "ingredient_id": ingredient_id,
+                "name": forced_names.get(ingredient_id, ""),
+                "requested_grams": float(target),
+                "planned_grams": float(ingredient_progress.get(ingredient_id, Decimal(0))),
+            }
+            for ingredient_id, target in forced_ingredients.items()
+        ]
+
+    shortfall = _shortfall_payload(slots, unfilled_slots)
+    if shortfall:
+        response_body["shortfall"] = shortfall
+    return response_body
+
+
 class OptimizeMenuPreviewView(APIView):
     """
     POST endpoint that runs the optimizer WITHOUT persisting anything, so the
@@ -452,11 +1015,21 @@ class OptimizeMenuPreviewView(APIView):
     slot the user pinned) and "reoptimize just this one slot" (locked = every
     *other* slot, computed client-side) — see optimize_meal_plan's
     locked_recipes param for why these are the same operation.
+
+    With `alternatives: K` (1..MAX_ALTERNATIVES), returns up to K diverse
+    menus from the one catalog load (_run_menu_alternatives) under
+    "alternatives", each in the single-menu shape, with the best one also
+    at the top level. `minDistance` (0..1, default 0.3) is the Jaccard
+    distance kept between their recipe sets.
     """
 
     MAX_DAYS = 30
+    MAX_ALTERNATIVES = 8
 
-    def post(self, request, *args, **kwargs):
+    def _parse_request(self, request):
+        """Validates the body and resolves everything the optimizer run needs
+        (catalog snapshot, locked adapters, forced-ingredient names). Returns
+        (preview, error_response) — preview a dict of the parsed fields."""
         household_id = 1  # TODO: replace with real household logic — ignored, same as elsewhere
         days = int(request.data.get("days", 7))
         meals = request.data.get("meals", [2])
@@ -464,27 +1037,70 @@ class OptimizeMenuPreviewView(APIView):
         locked = request.data.get("locked", [])
 
         if not meals or not isinstance(meals, list):
-            return Response(
+            return None, Response(
                 {"error": "meals must be a non-empty list"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         if days < 1 or days > self.MAX_DAYS:
-            return Response(
+            return None, Response(
                 {"error": f"days must be between 1 and {self.MAX_DAYS}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         if not isinstance(locked, list):
-            return Response({"error": "locked must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+            return None, Response({"error": "locked must be a list"}, status=status.HTTP_400_BAD_REQUEST)
 
         forced_ingredients, error = _parse_forced_ingredients(request.data.get("forcedIngredients"))
         if error:
-            return error
+            return None, error
+        engine, error = _parse_engine(request.data.get("engine"))
+        if error:
+            return None, error
+        search_options, error = _parse_search_options(request.data)
+        if error:
+            return None, error
+        (include_tags, exclude_tags), error = _parse_tag_filter(request.data)
+        if error:
+            return None, error
+        pantry_weight, error = _parse_pantry_weight(request.data, engine)
+        if error:
+            return None, error
+        alternatives = request.data.get("alternatives")
+        try:
+            alternatives = int(alternatives) if alternatives is not None else None
+            min_distance = float(request.data.get("minDistance", 0.3))
+        except (TypeError, ValueError):
+            return None, Response(
+                {"error": "alternatives must be an integer and minDistance a number"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if alternatives is not None and not 1 <= alternatives <= self.MAX_ALTERNATIVES:
+            return None, Response(
+                {"error": f"alternatives must be between 1 and {self.MAX_ALTERNATIVES}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 <= min_distance <= 1:
+            return None, Response({"error": "minDistance must be between 0 and 1"}, status=status.HTTP_400_BAD_REQUEST)
+        if alternatives is not None and engine == "exact":
+            return None, Response(
+                {"error": "alternatives needs a randomized engine (greedy or vectorized)"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         household = get_object_or_404(Household, id=household_id)
         slots = [(day, meal_type) for day in range(1, days + 1) for meal_type in meals]
 
-        recipes = _build_recipe_adapters(forced_ingredient_ids=list(forced_ingredients.keys()))
-        recipes_by_id = {r.id: r for r in recipes}
+        snapshot = get_catalog_snapshot()
+        try:
+            tag_mask = snapshot.tag_mask(include_tags, exclude_tags)
+        except ValueError as e:
+            return None, Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Locked meal_ids resolve against the whole catalog — a pinned recipe
+        # stays even if the tag filter would exclude it.
+        all_recipes = snapshot.recipe_adapters(list(forced_ingredients.keys()))
+        recipes_by_id = {r.id: r for r in all_recipes}
+        recipes = all_recipes
+        if include_tags or exclude_tags:
+            recipes = [all_recipes[row] for row in snapshot.mask_rows(tag_mask)]
 
         locked_pairs = []
         for entry in locked:
@@ -493,93 +1109,319 @@ class OptimizeMenuPreviewView(APIView):
                 meal_type = int(entry["meal_type"])
                 meal_id = int(entry["meal_id"])
             except (KeyError, TypeError, ValueError):
-                return Response(
+                return None, Response(
                     {"error": "each locked entry needs day_number, meal_type, meal_id"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
             if (day_number, meal_type) not in slots:
-                return Response(
+                return None, Response(
                     {"error": f"locked slot (day {day_number}, meal_type {meal_type}) is not part of this menu"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             adapter = recipes_by_id.get(meal_id)
             if adapter is None:
-                return Response({"error": f"Unknown meal_id {meal_id}"}, status=status.HTTP_400_BAD_REQUEST)
+                return None, Response({"error": f"Unknown meal_id {meal_id}"}, status=status.HTTP_400_BAD_REQUEST)
 
             locked_pairs.append(((day_number, meal_type), adapter))
 
+        forced_names = {}
+        if forced_ingredients:
+            forced_names = {
+                ing.id: ing.name
+                for ing in Ingredient.objects.filter(id__in=forced_ingredients.keys())
+            }
+
+        return {
+            "days": days,
+            "meals": meals,
+            "rules": rules,
+            "members": household.number_of_members,
+            "slots": slots,
+            "snapshot": snapshot,
+            "recipes": recipes,
+            "locked_pairs": locked_pairs,
+            "forced_ingredients": forced_ingredients,
+            "forced_names": forced_names,
+            "engine": engine,
+            "search_options": search_options,
+            "alternatives": alternatives,
+            "min_distance": min_distance,
+            "include_tags": include_tags,
+            "exclude_tags": exclude_tags,
+            "pantry_bonus": snapshot.pantry_bonus(
+                _pantry_statuses(household_id) if pantry_weight else {}, pantry_weight
+            ),
+        }, None
+
+    def post(self, request, *args, **kwargs):
+        preview, error = self._parse_request(request)
+        if error:
+            return error
+        slots = preview["slots"]
+        forced_ingredients = preview["forced_ingredients"]
+        forced_names = preview["forced_names"]
+        search_options = preview["search_options"]
+
+        if preview["alternatives"] is not None:
+            try:
+                slots, plans, stats = _run_menu_alternatives(
+                    preview["days"], preview["meals"], preview["rules"], preview["members"], preview["alternatives"],
+                    locked_recipes=preview["locked_pairs"], recipes=preview["recipes"],
+                    forced_ingredients=forced_ingredients, engine=preview["engine"],
+                    min_distance=preview["min_distance"],
+                    deadline_ms=search_options["deadline_ms"], seed=search_options["seed"],
+                    include_tags=preview["include_tags"], exclude_tags=preview["exclude_tags"],
+                    pantry_bonus=preview["pantry_bonus"], snapshot=preview["snapshot"],
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            payloads = [
+                _preview_payload(slots, *plan, forced_ingredients=forced_ingredients, forced_names=forced_names)
+                for plan in plans
+            ]
+            # The first (best) plan doubles as the regular single-menu response.
+            response_body = {**payloads[0], "alternatives": payloads, "alternatives_stats": stats}
+            return Response(response_body, status=status.HTTP_200_OK)
+
         try:
-            _, assigned, to_freeze, _recipes, unfilled_slots, ingredient_progress = _run_menu_optimizer(
-                days, meals, rules, household.number_of_members,
-                locked_recipes=locked_pairs, recipes=recipes, forced_ingredients=forced_ingredients,
+            _, assigned, to_freeze, _recipes, unfilled_slots, ingredient_progress, stats = _run_menu_optimizer(
+                preview["days"], preview["meals"], preview["rules"], preview["members"],
+                locked_recipes=preview["locked_pairs"], recipes=preview["recipes"],
+                forced_ingredients=forced_ingredients, engine=preview["engine"],
+                catalog_version=preview["snapshot"].version,
+                include_tags=preview["include_tags"], exclude_tags=preview["exclude_tags"],
+                pantry_bonus=preview["pantry_bonus"], snapshot=preview["snapshot"], **search_options,
             )
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        meal_type_labels = dict(MenuMeal.MEAL_TYPE_CHOICES)
-        today = timezone.localdate()
+        response_body = _preview_payload(
+            slots, assigned, to_freeze, unfilled_slots, ingredient_progress, stats,
+            forced_ingredients=forced_ingredients, forced_names=forced_names,
+        )
+        return Response(response_body, status=status.HTTP_200_OK)
 
-        result_recipes = []
-        for day_number, meal_type in slots:
-            entry = assigned.get((day_number, meal_type))
-            if entry is None:
-                continue
-            recipe_summary = _serialize_recipe_summary(entry["recipe"]._meal)
-            recipe_summary["name"] = apply_multiplier_display(recipe_summary["name"], entry["multiplier"])
-
-            result_recipes.append({
-                "day_number": day_number,
-                "meal_type": meal_type,
-                "meal_type_label": meal_type_labels.get(meal_type, "").lower(),
-                "suggested_date": (today + timedelta(days=day_number - 1)).isoformat(),
-                "locked": entry["locked"],
-                "multiplier": entry["multiplier"],
-                "recipe": recipe_summary,
-            })
 
-        token_totals = compute_menu_token_profile(
-            [(assigned[slot]["recipe"]._meal, assigned[slot]["multiplier"]) for slot in slots if slot in assigned]
-        )
-        tokens_response = {
-            token: {"real": float(value), "planned": 2}
-            for token, value in token_totals.items()
-        }
+class _StreamCancelled(Exception):
+    """Raised inside a streamed optimizer run once its client has gone away."""
 
-        to_freeze_response = [
-            {
-                "meal": _serialize_recipe_summary(freeze["recipe"]._meal),
-                "portions": freeze["portions"],
-            }
-            for freeze in to_freeze
-        ]
 
-        response_body = {
-            "tokens": tokens_response,
-            "recipes": result_recipes,
-            "to_freeze": to_freeze_response,
-        }
+def _sse_event(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload, cls=JSONEncoder)}\n\n"
 
-        if forced_ingredients:
-            names = {
-                ing.id: ing.name
-                for ing in Ingredient.objects.filter(id__in=forced_ingredients.keys())
-            }
-            response_body["forced_ingredients"] = [
-                {
-                    "ingredient_id": ingredient_id,
-                    "name": names.get(ingredient_id, ""),
-                    "requested_grams": float(target),
-                    "planned_grams": float(ingredient_progress.get(ingredient_id, Decimal(0))),
-                }
-                for ingredient_id, target in forced_ingredients.items()
-            ]
 
-        shortfall = _shortfall_payload(slots, unfilled_slots)
-        if shortfall:
-            response_body["shortfall"] = shortfall
+class OptimizeMenuPreviewStreamView(OptimizeMenuPreviewView):
+    """
+    OptimizeMenuPreviewView as a text/event-stream (server-sent events), for
+    previews big enough that the client wants to show progress. Same body
+    (minus `alternatives`); events, each data a JSON object:
+
+      catalog    {"version", "recipes", "slots"} — snapshot loaded
+      batch      one per batch an engine pass adds, with the running
+                 token totals (see _run_menu_optimizer's on_event)
+      built      the best pass's stats; refined  after refinement
+      scheduled  batches laid out over the slots
+      plan       the final OptimizeMenuPreviewView response body
+      error      {"error": message} instead of a plan
+
+    The optimizer runs on a worker thread feeding a queue; a comment line is
+    sent every KEEPALIVE_SECONDS while it's quiet. Under ASGI the stream is
+    an async generator awaiting that queue off the event loop, so events go
+    out as they happen (Django would buffer a sync iterator whole there);
+    under WSGI it's a plain generator. When the client disconnects (ASGI
+    cancels the generator, WSGI closes it) the worker's next progress event
+    aborts the run instead of finishing a plan nobody will read.
+
+    The request itself is parsed synchronously — DRF's APIView has no async
+    handlers — only the response body is async.
+    """
 
-        return Response(response_body, status=status.HTTP_200_OK)
+    KEEPALIVE_SECONDS = 5
+
+    def post(self, request, *args, **kwargs):
+        preview, error = self._parse_request(request)
+        if error:
+            return error
+        if preview["alternatives"] is not None:
+            return Response(
+                {"error": "alternatives isn't supported when streaming"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        events = queue.Queue()
+        cancelled = threading.Event()
+
+        def on_event(name, payload):
+            if cancelled.is_set():
+                raise _StreamCancelled()
+            events.put((name, payload))
+
+        def run():
+            try:
+                slots, assigned, to_freeze, _recipes, unfilled_slots, ingredient_progress, stats = _run_menu_optimizer(
+                    preview["days"], preview["meals"], preview["rules"], preview["members"],
+                    locked_recipes=preview["locked_pairs"], recipes=preview["recipes"],
+                    forced_ingredients=preview["forced_ingredients"], engine=preview["engine"],
+                    catalog_version=preview["snapshot"].version, on_event=on_event,
+                    include_tags=preview["include_tags"], exclude_tags=preview["exclude_tags"],
+                    pantry_bonus=preview["pantry_bonus"], snapshot=preview["snapshot"],
+                    **preview["search_options"],
+                )
+                events.put(("plan", _preview_payload(
+                    slots, assigned, to_freeze, unfilled_slots, ingredient_progress, stats,
+                    forced_ingredients=preview["forced_ingredients"], forced_names=preview["forced_names"],
+                )))
+            except _StreamCancelled:
+                pass
+            except ValueError as e:
+                events.put(("error", {"error": str(e)}))
+            except Exception:
+                events.put(("error", {"error": "optimization failed"}))
+                raise
+            finally:
+                events.put(None)
+
+        catalog_event = _sse_event("catalog", {
+            "version": preview["snapshot"].version,
+            "recipes": len(preview["recipes"]),
+            "slots": len(preview["slots"]),
+        })
+
+        def stream():
+            try:
+                yield catalog_event
+                threading.Thread(target=run, daemon=True).start()
+                while True:
+                    try:
+                        event = events.get(timeout=self.KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    if event is None:
+                        return
+                    yield _sse_event(*event)
+            finally:
+                cancelled.set()
+
+        async def astream():
+            # CancelledError (client gone) and GeneratorExit (aclose) both
+            # pass through the finally.
+            try:
+                yield catalog_event
+                threading.Thread(target=run, daemon=True).start()
+                while True:
+                    try:
+                        event = await asyncio.to_thread(events.get, timeout=self.KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    if event is None:
+                        return
+                    yield _sse_event(*event)
+            finally:
+                cancelled.set()
+
+        body = astream() if isinstance(request._request, ASGIRequest) else stream()
+        response = StreamingHttpResponse(body, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class ReoptimizeSlotView(APIView):
+    """
+    POST endpoint for swapping the dish on one slot of a draft menu: ranks
+    every catalog recipe as a replacement in one pass (rank_slot_alternatives)
+    against the token totals of the rest of the draft, instead of re-running
+    the whole optimizer with every other slot locked (OptimizeMenuPreviewView).
+    Nothing is persisted.
+
+    Body: {"tokens": {...}, "draft": [{day_number, meal_type, meal_id}, ...],
+    "slot": {day_number, meal_type}, "forcedIngredients": [...] (optional),
+    "limit": int (optional, 1..MAX_LIMIT, default 5)}. The slot doesn't have
+    to be in the draft — an empty slot just gets filled.
+    """
+
+    MAX_LIMIT = 20
+
+    def post(self, request, household_id):
+        rules = request.data.get("tokens", {})
+        draft = request.data.get("draft", [])
+        slot = request.data.get("slot")
+
+        if not isinstance(draft, list):
+            return Response({"error": "draft must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            target = (int(slot["day_number"]), int(slot["meal_type"]))
+            limit = int(request.data.get("limit", 5))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "slot needs day_number and meal_type, and limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if limit < 1 or limit > self.MAX_LIMIT:
+            return Response(
+                {"error": f"limit must be between 1 and {self.MAX_LIMIT}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        forced_ingredients, error = _parse_forced_ingredients(request.data.get("forcedIngredients"))
+        if error:
+            return error
+
+        household = get_object_or_404(Household, id=household_id)
+        snapshot = get_catalog_snapshot()
+
+        kept = []
+        replaced = None
+        for entry in draft:
+            try:
+                entry_slot = (int(entry["day_number"]), int(entry["meal_type"]))
+                meal_id = int(entry["meal_id"])
+            except (KeyError, TypeError, ValueError):
+                return Response(
+                    {"error": "each draft entry needs day_number, meal_type, meal_id"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            adapter = snapshot.recipes_by_id.get(meal_id)
+            if adapter is None:
+                return Response({"error": f"Unknown meal_id {meal_id}"}, status=status.HTTP_400_BAD_REQUEST)
+            if entry_slot == target:
+                replaced = adapter
+            else:
+                kept.append(adapter)
+
+        try:
+            alternatives, current_score = rank_slot_alternatives(
+                snapshot, rules, kept, replaced_recipe=replaced,
+                forced_ingredients=forced_ingredients, limit=limit,
+            )
+        except (TypeError, ValueError):
+            return Response({"error": "tokens must map token names to numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for alternative in alternatives:
+            recipe = alternative["recipe"]
+            multiplier = _recipe_sizing(recipe.serves, household.number_of_members)[0]
+            recipe_summary = _serialize_recipe_summary(recipe)
+            recipe_summary["name"] = apply_multiplier_display(recipe_summary["name"], multiplier)
+            results.append({
+                "recipe": recipe_summary,
+                "multiplier": multiplier,
+                "score": alternative["score"],
+                "token_deltas": {token: float(delta) for token, delta in alternative["token_deltas"].items()},
+            })
+
+        return Response(
+            {
+                "slot": {"day_number": target[0], "meal_type": target[1]},
+                "current_score": current_score,
+                "alternatives": results,
+            },
+            status=status.HTTP_200_OK,
+        )
 
 
 class CommitMenuView(APIView):
@@ -656,6 +1498,7 @@ class CommitMenuView(APIView):
                     meal=meals_by_id[freeze_meal_id],
                     portions=portions,
                 )
+            rebuild_menu_shopping_lines(menu)
 
         return Response({"detail": "Menu committed successfully."}, status=status.HTTP_201_CREATED)
 
@@ -701,12 +1544,13 @@ class MealSearchView(APIView):
             return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
         amount = max(1, min(amount, 50))
 
-        meals = Meal.objects.all()
+        recipes = get_catalog_snapshot().recipes
         if query:
-            meals = meals.filter(name__icontains=query)
-        meals = meals.order_by('name')[:amount]
+            needle = query.casefold()
+            recipes = [r for r in recipes if needle in r.name.casefold()]
+        recipes = sorted(recipes, key=lambda r: r.name.casefold())[:amount]
 
-        return Response({"recipes": [_serialize_recipe_summary(m) for m in meals]})
+        return Response({"recipes": [_serialize_recipe_summary(r) for r in recipes]})
 
 
 class RecipeDetailView(APIView):
@@ -132,3 +132,8 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Number type the greedy menu optimizer scores candidates in: 'decimal',
+# 'float' or 'fixed' (see meals.services.meal_plan_optimizer.NUMERIC_BACKENDS).
+
+MEAL_OPTIMIZER_NUMERIC = 'fixed'
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from meals.views import RandomMealsAPIView, MealIngredientsAPIView, MealsByIngredientsAPIView, MealTokensAPIView, HouseholdIngredientListView, adjust_ingredient, CurrentMenuView, MenuIngredientsView, GenerateMenuView, RecipeDetailView, IngredientDetailView, OptimizeMenuPreviewView, CommitMenuView, MealSearchView, IngredientSearchView
+from meals.views import RandomMealsAPIView, MealIngredientsAPIView, MealsByIngredientsAPIView, MealTokensAPIView, HouseholdIngredientListView, adjust_ingredient, CurrentMenuView, MenuIngredientsView, GenerateMenuView, RecipeDetailView, IngredientDetailView, OptimizeMenuPreviewView, OptimizeMenuPreviewStreamView, ReoptimizeSlotView, CommitMenuView, MealSearchView, IngredientSearchView
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -17,6 +17,8 @@ urlpatterns = [
     path('api/meals/<int:household_id>/current-menu/ingredients/', MenuIngredientsView.as_view(), name='menu-ingredients'),
     path('api/meals/<int:household_id>/generate-menu/', GenerateMenuView.as_view(), name='generate-menu'),
     path('api/meals/<int:household_id>/optimize-preview/', OptimizeMenuPreviewView.as_view(), name='optimize-menu-preview'),
+    path('api/meals/<int:household_id>/optimize-preview/stream/', OptimizeMenuPreviewStreamView.as_view(), name='optimize-menu-preview-stream'),
+    path('api/meals/<int:household_id>/reoptimize-slot/', ReoptimizeSlotView.as_view(), name='reoptimize-slot'),
     path('api/meals/<int:household_id>/commit-menu/', CommitMenuView.as_view(), name='commit-menu'),
     path('api/meals/search/', MealSearchView.as_view(), name='meal-search'),
     path('api/recipes/<int:recipe_id>/', RecipeDetailView.as_view(), name='recipe-detail'),